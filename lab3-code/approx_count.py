@@ -0,0 +1,239 @@
+"""Approximate model counting with random XOR hashing, after ApproxMC
+(Chakraborty, Meel and Vardi).
+
+Adding `m` random XOR constraints over the counted variables, each of
+which holds for about half of the assignments, cuts the models into
+`2 ** m` cells of about equal size. Once a cell is small enough to
+enumerate, up to `threshold` models, its size times `2 ** m` estimates
+the count. The median of `iterations` such estimates, each with its own
+hash, is within the factor `1 + epsilon` of the count with probability
+at least `1 - delta`:
+
+    threshold  = 1 + 9.84 (1 + epsilon / (1 + epsilon)) (1 + 1 / epsilon) ** 2
+    iterations = ceil(17 log2(3 / delta))
+
+Each hash is solved by one incremental CDCL engine. Each XOR gets a
+chain of auxiliary variables defining its parity, added on first use,
+so that the XOR holds under one assumption literal. The cells of a hash
+are its prefixes, and `m` starts from the last iteration's. The blocking
+clauses of a cell go into a `push` frame, which `pop` retracts, and the
+clauses learned along the way stay for the next cells, as they follow
+from the formula and the definitions alone. A new hash gets a new
+engine, lest the search keep deciding the variables of the old XORs.
+CDCL alone is poor at parity reasoning, so the XORs of a hash are put in
+echelon form first, which keeps the solutions of every prefix.
+
+`solver_calls` counts the calls to `solve`, to weigh the approximation
+against enumerating the models with one call each.
+"""
+
+import math
+import random
+import statistics
+import unittest
+from typing import Iterable, List, Optional, Tuple
+
+from cdcl import CDCL
+from dpll import PAnd, PNot, PVar
+from model_count import count_models, count_prop, counting_db
+
+EPSILON = 0.8
+DELTA = 0.2
+
+
+def threshold(epsilon: float) -> int:
+    return int(1 + 9.84 * (1 + epsilon / (1 + epsilon)) * (1 + 1 / epsilon) ** 2)
+
+
+def iterations(delta: float) -> int:
+    return math.ceil(17 * math.log2(3 / delta))
+
+
+def _echelon(rows: List[Tuple[int, bool]]) -> List[Tuple[int, bool]]:
+    """Eliminate the pivot of each XOR (a bitmask of variables and a
+    parity) from the ones after it. Every prefix keeps its solutions, but
+    the last XOR of a prefix now determines its pivot from the variables
+    of no other pivot, and so on backwards: unit propagation infers all
+    the pivots from the other variables."""
+    result = []
+    # the lowest variable of each row, with the row
+    pivots = []
+    for row, parity in rows:
+        for pivot, other, other_parity in pivots:
+            if row & pivot:
+                row ^= other
+                parity ^= other_parity
+        if row:
+            pivots.append((row & -row, row, parity))
+        result.append((row, parity))
+    return result
+
+
+class ApproxCounter:
+    """Count the models of DIMACS clauses, projected on the `sampling`
+    variables (1 to `num_vars` by default)."""
+
+    def __init__(self, clauses: Iterable[Iterable[int]], num_vars: int = 0,
+                 sampling: Optional[Iterable[int]] = None, epsilon: float = EPSILON,
+                 delta: float = DELTA, seed: Optional[int] = None):
+        if epsilon <= 0 or not 0 < delta < 1:
+            raise ValueError("expected epsilon > 0 and 0 < delta < 1")
+        self.clauses = [list(clause) for clause in clauses]
+        self.num_vars = max([num_vars] + [abs(lit) for clause in self.clauses for lit in clause])
+        self.engine = self._new_engine()
+        if sampling is None:
+            sampling = range(1, self.num_vars + 1)
+        self.sampling = sorted(set(sampling))
+        self.epsilon = epsilon
+        self.delta = delta
+        self.threshold = threshold(epsilon)
+        self.iterations = iterations(delta)
+        self.rng = random.Random(seed)
+        self.solver_calls = 0
+        # whether the count was small enough to enumerate
+        self.exact = False
+
+    def _new_engine(self) -> CDCL:
+        engine = CDCL(self.num_vars)
+        for clause in self.clauses:
+            if not engine.add_clause(clause):
+                break
+        return engine
+
+    def _xor(self, variables: List[int], parity: bool) -> Optional[int]:
+        """A literal equivalent to the XOR of `variables` being `parity`,
+        True or False when the XOR is constant."""
+        engine = self.engine
+        if not variables:
+            return parity is False
+        acc = variables[0]
+        for var in variables[1:]:
+            # z <-> acc xor var
+            z = engine.new_var()
+            engine.add_clause([-z, acc, var])
+            engine.add_clause([-z, -acc, -var])
+            engine.add_clause([z, -acc, var])
+            engine.add_clause([z, acc, -var])
+            acc = z
+        return acc if parity else -acc
+
+    def _cell(self, assumptions: List, limit: int) -> int:
+        """Enumerate up to `limit` models under the assumptions, projected
+        on the sampling variables."""
+        if False in assumptions:
+            return 0
+        assumptions = [lit for lit in assumptions if lit is not True]
+        engine = self.engine
+        engine.push()
+        count = 0
+        while count < limit:
+            self.solver_calls += 1
+            if not engine.solve(assumptions):
+                break
+            count += 1
+            model = engine.model
+            engine.add_clause([-var if model[var] else var for var in self.sampling])
+        engine.pop()
+        return count
+
+    def count(self) -> int:
+        limit = self.threshold
+        cell = self._cell([], limit)
+        if cell < limit:
+            self.exact = True
+            return cell
+        estimates = []
+        m = 1
+        n = len(self.sampling)
+        for _ in range(self.iterations):
+            self.engine = self._new_engine()
+            # a random hash, one XOR for each sampling variable
+            rng = self.rng
+            hash_xors = _echelon([(rng.getrandbits(n), rng.random() < 0.5) for _ in range(n)])
+            hash_xors = [([var for k, var in enumerate(self.sampling) if row >> k & 1], parity)
+                         for row, parity in hash_xors]
+            xors = []
+            cells = {}
+
+            def size(k: int) -> int:
+                if k not in cells:
+                    while len(xors) < k:
+                        xors.append(self._xor(*hash_xors[len(xors)]))
+                    cells[k] = self._cell(xors[:k], limit)
+                return cells[k]
+
+            # the smallest m whose cell is below the threshold, searched
+            # from the last one
+            m = min(m, n)
+            while m > 1 and size(m - 1) < limit:
+                m -= 1
+            while m < n and size(m) >= limit:
+                m += 1
+            estimates.append(size(m) << m)
+        return round(statistics.median(estimates))
+
+
+def approx_count(clauses: Iterable[Iterable[int]], num_vars: int = 0,
+                 sampling: Optional[Iterable[int]] = None, epsilon: float = EPSILON,
+                 delta: float = DELTA, seed: Optional[int] = None) -> Tuple[int, int]:
+    """An (epsilon, delta) approximation of the number of models of the
+    DIMACS clauses, and the number of solver calls it took."""
+    counter = ApproxCounter(clauses, num_vars, sampling, epsilon, delta, seed)
+    return counter.count(), counter.solver_calls
+
+
+def approx_count_prop(prop, names: Iterable[str] = (), epsilon: float = EPSILON,
+                      delta: float = DELTA, seed: Optional[int] = None) -> Tuple[int, int]:
+    """`approx_count` for a `Prop` (or a propositional Z3 formula), over
+    its variables and the extra `names`, see `counting_db`."""
+    db = counting_db(prop, names)
+    return approx_count(db, db.num_vars, db.ids.values(), epsilon, delta, seed)
+
+
+#####################
+# test cases:
+
+class TestApproxCount(unittest.TestCase):
+    def test_parameters(self):
+        self.assertEqual(threshold(0.8), 72)
+        self.assertEqual(iterations(0.2), 67)
+        with self.assertRaises(ValueError):
+            ApproxCounter([], epsilon=0)
+
+    def test_exact(self):
+        count, calls = approx_count([[1, 2], [-1, -2]], 3)
+        self.assertEqual((count, calls), (4, 5))
+        count, _ = approx_count([[1], [-1]])
+        self.assertEqual(count, 0)
+
+    def test_bounds(self):
+        epsilon = 0.8
+        rng = random.Random(3)
+        clauses = [[var if rng.random() < 0.5 else -var for var in rng.sample(range(1, 15), 3)]
+                   for _ in range(20)]
+        exact = count_models(clauses, 14)
+        counter = ApproxCounter(clauses, 14, epsilon=epsilon, delta=0.5, seed=1)
+        count = counter.count()
+        self.assertFalse(counter.exact)
+        self.assertLessEqual(exact / (1 + epsilon), count)
+        self.assertLessEqual(count, exact * (1 + epsilon))
+        self.assertGreater(counter.solver_calls, counter.iterations)
+
+    def test_prop(self):
+        # the auxiliary variables of the definitional CNF are left out of
+        # the count
+        from bdd import interleaved
+        prop = interleaved(10)
+        db = counting_db(prop)
+        self.assertGreater(db.num_vars, 20)
+        counter = ApproxCounter(db, db.num_vars, db.ids.values(), seed=2)
+        # fewer iterations than delta asks for, to keep the test short
+        counter.iterations = 5
+        exact = count_prop(prop)
+        count = counter.count()
+        self.assertLessEqual(exact / 1.8, count)
+        self.assertLessEqual(count, exact * 1.8)
+        self.assertEqual(approx_count_prop(PAnd(PVar("p"), PNot(PVar("q"))), ["r"]), (2, 3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+"""Backbones: the literals which hold in every model of a formula.
+
+Enumerating the models to intersect them takes one call per model. The
+backbone needs far fewer, on one incremental CDCL engine:
+  - the first model gives the candidates, its literals;
+  - every later model drops the candidates it falsifies, for free;
+  - a chunk of candidates `l1 ... lk` is tested at once, by asking for a
+    model of the clause `~l1 \\/ ... \\/ ~lk`, added under an activation
+    literal and assumed. Unsatisfiable: all of them are in the backbone,
+    and become unit clauses. Satisfiable: the new model drops at least
+    one of them. The clause is then switched off by the negated
+    activation literal, a unit clause too.
+
+A call thus either settles a whole chunk of the backbone or drops
+candidates, so the calls grow with the size of the backbone over the
+chunk size, plus the number of models needed to rule out the rest,
+rather than with the number of models.
+"""
+
+import itertools
+import random
+import unittest
+from typing import Dict, Iterable, List, Optional
+
+from cdcl import CDCL
+from dpll import Prop, encode_prop, from_z3
+from clause_db import ClauseDB
+
+# candidates tested per call
+CHUNK = 16
+
+
+class BackboneExtractor:
+    """The backbone of DIMACS clauses, over the `variables` (all of them
+    by default)."""
+
+    def __init__(self, clauses: Iterable[Iterable[int]], num_vars: int = 0,
+                 variables: Optional[Iterable[int]] = None, chunk: int = CHUNK):
+        clauses = [list(clause) for clause in clauses]
+        num_vars = max([num_vars] + [abs(lit) for clause in clauses for lit in clause])
+        self.engine = CDCL(num_vars)
+        for clause in clauses:
+            if not self.engine.add_clause(clause):
+                break
+        self.variables = range(1, num_vars + 1) if variables is None else sorted(set(variables))
+        self.chunk = chunk
+        self.solver_calls = 0
+
+    def _solve(self, assumptions: List[int] = ()) -> bool:
+        self.solver_calls += 1
+        return self.engine.solve(assumptions)
+
+    def _candidates(self, candidates: Dict[int, None]):
+        """Drop the candidates falsified by the model of the last call."""
+        model = self.engine.model
+        for lit in [lit for lit in candidates if model[abs(lit)] != (lit > 0)]:
+            del candidates[lit]
+
+    def extract(self) -> Optional[List[int]]:
+        """The backbone literals, None if the clauses are unsatisfiable."""
+        engine = self.engine
+        if not self._solve():
+            return None
+        model = engine.model
+        # insertion ordered, to test the candidates in a fixed order
+        candidates = dict.fromkeys(var if model[var] else -var for var in self.variables)
+        backbone = []
+        while candidates:
+            chunk = list(itertools.islice(candidates, self.chunk))
+            if len(chunk) == 1:
+                assumptions = [-chunk[0]]
+                activation = None
+            else:
+                activation = engine.new_var()
+                engine.add_clause([-lit for lit in chunk] + [-activation])
+                assumptions = [activation]
+            if self._solve(assumptions):
+                self._candidates(candidates)
+            else:
+                for lit in chunk:
+                    del candidates[lit]
+                    backbone.append(lit)
+                    engine.add_clause([lit])
+            if activation is not None:
+                engine.add_clause([-activation])
+        return sorted(backbone, key=abs)
+
+
+def backbone(clauses: Iterable[Iterable[int]], num_vars: int = 0,
+             variables: Optional[Iterable[int]] = None, chunk: int = CHUNK) -> Optional[List[int]]:
+    """The backbone literals of DIMACS clauses, see `BackboneExtractor`."""
+    return BackboneExtractor(clauses, num_vars, variables, chunk).extract()
+
+
+def backbone_prop(formula, chunk: int = CHUNK) -> Optional[Dict[str, bool]]:
+    """The value of each variable of a `Prop` (or a propositional Z3
+    formula) forced by the formula, None if it is unsatisfiable. The
+    auxiliary variables of its CNF are left out."""
+    prop = formula if isinstance(formula, Prop) else from_z3(formula)
+    db = ClauseDB()
+    encode_prop(prop, db)
+    found = backbone(db, db.num_vars, db.ids.values(), chunk)
+    if found is None:
+        return None
+    return {db.names[abs(lit)]: lit > 0 for lit in found}
+
+
+#####################
+# test cases:
+
+def brute_force(clauses: List[List[int]], num_vars: int) -> Optional[List[int]]:
+    models = [bits for bits in itertools.product([False, True], repeat=num_vars)
+              if all(any(bits[abs(lit) - 1] == (lit > 0) for lit in clause) for clause in clauses)]
+    if not models:
+        return None
+    return [var if models[0][var - 1] else -var for var in range(1, num_vars + 1)
+            if all(bits[var - 1] == models[0][var - 1] for bits in models)]
+
+
+class TestBackbone(unittest.TestCase):
+    def test_small(self):
+        self.assertEqual(backbone([[1], [-1, 2], [3, 4]]), [1, 2])
+        self.assertIsNone(backbone([[1], [-1]]))
+        self.assertEqual(backbone([[1, 2]], 3), [])
+        self.assertEqual(backbone([[-1], [-2, 3], [-2, -3]], chunk=1), [-1, -2])
+
+    def test_random(self):
+        rng = random.Random(11)
+        for chunk in (1, 3, CHUNK):
+            for _ in range(40):
+                n = rng.randint(3, 10)
+                clauses = [[var if rng.random() < 0.5 else -var for var in rng.sample(range(1, n + 1), 2)]
+                           for _ in range(rng.randint(1, 3 * n))]
+                self.assertEqual(backbone(clauses, n, chunk=chunk), brute_force(clauses, n))
+
+    def test_calls(self):
+        # a chain forcing 200 variables, next to 30 free ones with 2 ** 30
+        # models: a few dozen calls
+        clauses = [[1]] + [[-i, i + 1] for i in range(1, 200)]
+        clauses += [[i, -i - 1, i + 1] for i in range(201, 230)]
+        extractor = BackboneExtractor(clauses, 230)
+        self.assertEqual(extractor.extract(), list(range(1, 201)))
+        self.assertLess(extractor.solver_calls, 60)
+
+    def test_seats(self):
+        from z3 import And
+        from seat_arrange import seat_constraints
+        props, constraints = seat_constraints()
+        # the unique arrangement: Carol, Bob, Alice
+        forced = backbone_prop(And(constraints))
+        self.assertEqual(len(forced), 9)
+        self.assertEqual({name for name, value in forced.items() if value}, {"a3", "b2", "c1"})
+        # without Bob's constraint, Alice and Carol may swap, but they
+        # still sit apart, with Bob in the middle
+        forced = backbone_prop(And(constraints[:4]))
+        self.assertEqual(forced, {"a2": False, "b1": False, "b2": True, "b3": False, "c2": False})
+
+
+if __name__ == '__main__':
+    unittest.main()
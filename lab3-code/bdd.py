@@ -0,0 +1,610 @@
+"""Reduced ordered binary decision diagrams (ROBDDs) over `Prop`.
+
+Once a proposition is compiled into a BDD, validity and satisfiability
+are a comparison with a constant, equivalence of two compiled
+propositions is a comparison of two edges, and model counting and model
+finding are linear in the size of the diagram.
+
+The nodes live in a `BDDManager`, in parallel lists indexed by node
+number; node 0 is the terminal true. An edge is `2 * node + complement`:
+the complement bit negates the function, so that negation is free and a
+function and its negation share their nodes. To keep the diagrams
+canonical, the then-edge of a node is never complemented. Every node is
+unique for its variable and its two edges, which the per-variable unique
+tables ensure (hash-consing, as for `Prop`). Hence two edges are equal
+if and only if their functions are.
+
+All the operations go through `ite(f, g, h)`, "if f then g else h",
+whose results are kept in a fixed size computed table: a new entry
+overwrites the one in its slot, so that the table never grows.
+
+Each node counts the references to it, from the nodes above and from the
+live `BDD` handles. Unreferenced nodes are reclaimed by `collect`, which
+the manager runs at safe points (between two top-level operations) once
+the node count doubled. Likewise, with `auto_reorder`, the variables are
+reordered by Rudell's sifting whenever the live nodes doubled: each
+variable in turn is moved through all the levels by swapping adjacent
+ones, and left where the diagram was the smallest. The swaps are done in
+place, so the handles stay valid.
+"""
+
+import functools
+import itertools
+import random
+import unittest
+from typing import Dict, Iterable, List, Optional
+
+from dpll import (PAnd, PFalse, PImplies, PNot, POr, Prop, PTrue, PVar, children, operands,
+                  test_prop_1, test_prop_2, transform, variables)
+from prop_compile import evaluate
+
+TRUE = 0
+FALSE = 1
+# slots of the computed table
+CACHE_SIZE = 1 << 16
+# live nodes before the first garbage collection and reordering
+GC_THRESHOLD = 1 << 14
+REORDER_THRESHOLD = 1 << 12
+# sifting gives up on a direction once the diagram grew by this factor
+MAX_GROWTH = 1.2
+
+
+class BDDManager:
+    def __init__(self, cache_size: int = CACHE_SIZE, auto_reorder: bool = False):
+        # node 0 is the terminal, below all the variables
+        self.var: List[int] = [-1]
+        self.hi: List[int] = [TRUE]
+        self.lo: List[int] = [TRUE]
+        self.refs: List[int] = [1]
+        self.free: List[int] = []
+        self.live = 0
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+        # level of each variable, and variable at each level
+        self.level: List[int] = []
+        self.order: List[int] = []
+        self.unique: List[Dict[tuple, int]] = []
+        self.cache: List[Optional[tuple]] = [None] * cache_size
+        self.auto_reorder = auto_reorder
+        self.gc_threshold = GC_THRESHOLD
+        self.reorder_threshold = REORDER_THRESHOLD
+        self.reorderings = 0
+
+    def __len__(self) -> int:
+        """The number of nodes, the terminal excluded."""
+        return self.live
+
+    @property
+    def true(self) -> "BDD":
+        return BDD(self, TRUE)
+
+    @property
+    def false(self) -> "BDD":
+        return BDD(self, FALSE)
+
+    def add_var(self, name: str) -> "BDD":
+        """The variable called `name`, added below the others if new."""
+        var = self.index.get(name)
+        if var is None:
+            var = self.index[name] = len(self.names)
+            self.names.append(name)
+            self.level.append(len(self.order))
+            self.order.append(var)
+            self.unique.append({})
+        return BDD(self, self._node(var, TRUE, FALSE))
+
+    def variable_order(self) -> List[str]:
+        return [self.names[var] for var in self.order]
+
+    def _level(self, edge: int) -> int:
+        node = edge >> 1
+        return self.level[self.var[node]] if node else len(self.order)
+
+    def _ref(self, edge: int):
+        self.refs[edge >> 1] += 1
+
+    def _deref(self, edge: int):
+        """Drop a reference, freeing the nodes no longer referenced."""
+        refs = self.refs
+        stack = [edge >> 1]
+        while stack:
+            node = stack.pop()
+            if not node:
+                continue
+            refs[node] -= 1
+            if refs[node] == 0:
+                del self.unique[self.var[node]][self.hi[node], self.lo[node]]
+                self.free.append(node)
+                self.live -= 1
+                stack.append(self.hi[node] >> 1)
+                stack.append(self.lo[node] >> 1)
+
+    def _node(self, var: int, hi: int, lo: int) -> int:
+        """The edge to the node `var ? hi : lo`, reduced and unique."""
+        if hi == lo:
+            return hi
+        complement = hi & 1
+        if complement:
+            hi ^= 1
+            lo ^= 1
+        table = self.unique[var]
+        node = table.get((hi, lo))
+        if node is None:
+            if self.free:
+                node = self.free.pop()
+                self.var[node] = var
+                self.hi[node] = hi
+                self.lo[node] = lo
+                self.refs[node] = 0
+            else:
+                node = len(self.var)
+                self.var.append(var)
+                self.hi.append(hi)
+                self.lo.append(lo)
+                self.refs.append(0)
+            table[hi, lo] = node
+            self.live += 1
+            self.refs[hi >> 1] += 1
+            self.refs[lo >> 1] += 1
+        return 2 * node + complement
+
+    def _cofactors(self, edge: int, var: int):
+        node = edge >> 1
+        if not node or self.var[node] != var:
+            return edge, edge
+        complement = edge & 1
+        return self.hi[node] ^ complement, self.lo[node] ^ complement
+
+    def ite(self, f: int, g: int, h: int) -> int:
+        """The edge of `f ? g : h`, computed with an explicit stack so
+        that the depth of the diagrams is not bounded by the recursion
+        limit."""
+        cache = self.cache
+        slots = len(cache)
+        results = []
+        stack = [(f, g, h, None)]
+        while stack:
+            f, g, h, pending = stack.pop()
+            if pending is not None:
+                var, negate = pending
+                lo = results.pop()
+                hi = results.pop()
+                result = self._node(var, hi, lo)
+                cache[hash((f, g, h)) % slots] = (f, g, h, result)
+                results.append(result ^ negate)
+                continue
+            # standard triples: f and g regular, g and h not f or ~f
+            if g == f:
+                g = TRUE
+            elif g == f ^ 1:
+                g = FALSE
+            if h == f:
+                h = FALSE
+            elif h == f ^ 1:
+                h = TRUE
+            if f & 1:
+                f, g, h = f ^ 1, h, g
+            negate = 0
+            if g & 1:
+                g, h, negate = g ^ 1, h ^ 1, 1
+            if f == TRUE or g == h:
+                results.append(g ^ negate)
+                continue
+            if g == TRUE and h == FALSE:
+                results.append(f ^ negate)
+                continue
+            entry = cache[hash((f, g, h)) % slots]
+            if entry is not None and entry[0] == f and entry[1] == g and entry[2] == h:
+                results.append(entry[3] ^ negate)
+                continue
+            level = min(self._level(f), self._level(g), self._level(h))
+            var = self.order[level]
+            f1, f0 = self._cofactors(f, var)
+            g1, g0 = self._cofactors(g, var)
+            h1, h0 = self._cofactors(h, var)
+            stack.append((f, g, h, (var, negate)))
+            stack.append((f0, g0, h0, None))
+            stack.append((f1, g1, h1, None))
+        return results[0]
+
+    def _checkpoint(self, edge: int) -> "BDD":
+        """Wrap the result of a top-level operation, the only point where
+        the unreferenced nodes may be reclaimed or moved."""
+        result = BDD(self, edge)
+        if self.auto_reorder and self.live > self.reorder_threshold:
+            self.reorder()
+            self.reorder_threshold = max(self.reorder_threshold, 2 * self.live)
+        elif len(self.var) - len(self.free) > self.gc_threshold:
+            self.collect()
+            self.gc_threshold = max(self.gc_threshold, 2 * self.live)
+        return result
+
+    def collect(self):
+        """Free the nodes unreachable from the live handles."""
+        refs = self.refs
+        dead = [node for table in self.unique for node in table.values() if refs[node] == 0]
+        for node in dead:
+            # the reference `_deref` drops
+            refs[node] = 1
+            self._deref(2 * node)
+        self.cache = [None] * len(self.cache)
+
+    def _swap(self, level: int):
+        """Exchange the variables at `level` and `level + 1`."""
+        x = self.order[level]
+        y = self.order[level + 1]
+        var = self.var
+        hi = self.hi
+        lo = self.lo
+        table = self.unique[x]
+        moved = [node for node in table.values()
+                 if var[hi[node] >> 1] == y or var[lo[node] >> 1] == y]
+        for node in moved:
+            del table[hi[node], lo[node]]
+        self.order[level], self.order[level + 1] = y, x
+        self.level[x], self.level[y] = level + 1, level
+        for node in moved:
+            f1, f0 = hi[node], lo[node]
+            f11, f10 = self._cofactors(f1, y)
+            f01, f00 = self._cofactors(f0, y)
+            # the then-edge stays regular, as f11 comes from a regular edge
+            new_hi = self._node(x, f11, f01)
+            new_lo = self._node(x, f10, f00)
+            self._ref(new_hi)
+            self._ref(new_lo)
+            var[node], hi[node], lo[node] = y, new_hi, new_lo
+            self.unique[y][new_hi, new_lo] = node
+            self._deref(f1)
+            self._deref(f0)
+
+    def _sift(self, var: int):
+        last = len(self.order) - 1
+        position = best = self.level[var]
+        best_size = self.live
+        # towards the nearest end first
+        directions = [(1, last), (-1, 0)] if position > last // 2 else [(-1, 0), (1, last)]
+        for step, end in directions:
+            while position != end:
+                self._swap(position if step > 0 else position - 1)
+                position += step
+                if self.live < best_size:
+                    best, best_size = position, self.live
+                elif self.live > MAX_GROWTH * best_size:
+                    break
+        while position < best:
+            self._swap(position)
+            position += 1
+        while position > best:
+            self._swap(position - 1)
+            position -= 1
+
+    def reorder(self):
+        """Sift every variable, the largest levels first."""
+        self.collect()
+        for var in sorted(range(len(self.names)), key=lambda v: -len(self.unique[v])):
+            self._sift(var)
+        self.cache = [None] * len(self.cache)
+        self.reorderings += 1
+
+    def compile(self, prop: Prop) -> "BDD":
+        """The BDD of a proposition. New variables are added in the order
+        of their first occurrence.
+
+        The operands of nested conjunctions (disjunctions) are combined
+        from the one with the lowest top variable up, so that each step
+        only adds nodes on top: a chain of `n` conjunctions then takes
+        `O(n)` steps instead of `O(n^2)`.
+        """
+        for name in variables(prop):
+            self.add_var(name)
+
+        def expand(node: Prop) -> tuple:
+            kind = type(node)
+            if kind is PAnd or kind is POr:
+                return tuple(operands(node, kind, unique=True))
+            return children(node)
+
+        def bottom_up(args) -> List[BDD]:
+            return sorted(args, key=lambda arg: -self._level(arg.edge))
+
+        def combine(node: Prop, args) -> BDD:
+            match node:
+                case PVar(var):
+                    return self.add_var(var)
+                case PTrue():
+                    return self.true
+                case PFalse():
+                    return self.false
+                case PNot():
+                    return ~args[0]
+                case PAnd():
+                    return functools.reduce(BDD.__and__, bottom_up(args))
+                case POr():
+                    return functools.reduce(BDD.__or__, bottom_up(args))
+                case PImplies():
+                    return args[0].implies(args[1])
+            raise TypeError(f"not a proposition: {node!r}")
+
+        return transform(prop, combine, expand)
+
+
+class BDD:
+    """A handle on the function of an edge of a manager."""
+    __slots__ = ("manager", "edge", "__weakref__")
+
+    def __init__(self, manager: BDDManager, edge: int):
+        self.manager = manager
+        self.edge = edge
+        manager.refs[edge >> 1] += 1
+
+    def __del__(self):
+        try:
+            self.manager.refs[self.edge >> 1] -= 1
+        except (AttributeError, IndexError):
+            pass
+
+    def _edge(self, other: "BDD") -> int:
+        if other.manager is not self.manager:
+            raise ValueError("the BDDs belong to different managers")
+        return other.edge
+
+    def ite(self, then: "BDD", otherwise: "BDD") -> "BDD":
+        manager = self.manager
+        return manager._checkpoint(manager.ite(self.edge, self._edge(then), self._edge(otherwise)))
+
+    def __invert__(self) -> "BDD":
+        return BDD(self.manager, self.edge ^ 1)
+
+    def __and__(self, other: "BDD") -> "BDD":
+        manager = self.manager
+        return manager._checkpoint(manager.ite(self.edge, self._edge(other), FALSE))
+
+    def __or__(self, other: "BDD") -> "BDD":
+        manager = self.manager
+        return manager._checkpoint(manager.ite(self.edge, TRUE, self._edge(other)))
+
+    def __xor__(self, other: "BDD") -> "BDD":
+        manager = self.manager
+        edge = self._edge(other)
+        return manager._checkpoint(manager.ite(self.edge, edge ^ 1, edge))
+
+    def implies(self, other: "BDD") -> "BDD":
+        manager = self.manager
+        return manager._checkpoint(manager.ite(self.edge, self._edge(other), TRUE))
+
+    def __eq__(self, other) -> bool:
+        """Equivalence, in constant time."""
+        if not isinstance(other, BDD):
+            return NotImplemented
+        return self.manager is other.manager and self.edge == other.edge
+
+    def __hash__(self):
+        return hash((id(self.manager), self.edge))
+
+    @property
+    def valid(self) -> bool:
+        return self.edge == TRUE
+
+    @property
+    def satisfiable(self) -> bool:
+        return self.edge != FALSE
+
+    def _nodes(self) -> List[int]:
+        """The nodes reachable from the edge, children first."""
+        manager = self.manager
+        result = []
+        visited = {0}
+        stack = [(self.edge >> 1, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                result.append(node)
+                continue
+            if node in visited:
+                continue
+            visited.add(node)
+            stack.append((node, True))
+            stack.append((manager.lo[node] >> 1, False))
+            stack.append((manager.hi[node] >> 1, False))
+        return result
+
+    def size(self) -> int:
+        """The number of nodes of the function, the terminal excluded."""
+        return len(self._nodes())
+
+    def support(self) -> List[str]:
+        manager = self.manager
+        found = {manager.var[node] for node in self._nodes()}
+        return [manager.names[var] for var in manager.order if var in found]
+
+    def count(self, names: Optional[Iterable[str]] = None) -> int:
+        """The number of models over the variables `names` (all those of
+        the manager by default), which must include the support."""
+        manager = self.manager
+        n = len(manager.names)
+        # models of each node over all the variables of the manager
+        models = {0: 1 << n}
+        for node in self._nodes():
+            hi, lo = manager.hi[node], manager.lo[node]
+            high = models[hi >> 1] if not hi & 1 else (1 << n) - models[hi >> 1]
+            low = models[lo >> 1] if not lo & 1 else (1 << n) - models[lo >> 1]
+            models[node] = (high + low) >> 1
+        total = models[self.edge >> 1]
+        if self.edge & 1:
+            total = (1 << n) - total
+        if names is None:
+            return total
+        names = set(names)
+        missing = set(self.support()) - names
+        if missing:
+            raise ValueError(f"the count must range over the support, missing {sorted(missing)}")
+        known = sum(1 for name in names if name in manager.index)
+        return (total >> (n - known)) << (len(names) - known)
+
+    def model(self) -> Optional[Dict[str, bool]]:
+        """A model over the support, None if unsatisfiable."""
+        if self.edge == FALSE:
+            return None
+        manager = self.manager
+        result = {}
+        edge = self.edge
+        while edge >> 1:
+            node = edge >> 1
+            complement = edge & 1
+            hi = manager.hi[node] ^ complement
+            name = manager.names[manager.var[node]]
+            # a complemented edge to the terminal is false
+            if hi != FALSE:
+                result[name] = True
+                edge = hi
+            else:
+                result[name] = False
+                edge = manager.lo[node] ^ complement
+        return result
+
+    def evaluate(self, assignment: Dict[str, bool]) -> bool:
+        manager = self.manager
+        edge = self.edge
+        while edge >> 1:
+            node = edge >> 1
+            complement = edge & 1
+            if assignment[manager.names[manager.var[node]]]:
+                edge = manager.hi[node] ^ complement
+            else:
+                edge = manager.lo[node] ^ complement
+        return edge == TRUE
+
+    def __str__(self):
+        return f"BDD({self.size()} nodes)"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def compile_bdd(prop: Prop, manager: Optional[BDDManager] = None) -> BDD:
+    """Compile a proposition, in a new manager by default."""
+    if manager is None:
+        manager = BDDManager()
+    return manager.compile(prop)
+
+
+#####################
+# test cases:
+
+def random_prop(rng: random.Random, names: List[str], size: int) -> Prop:
+    if size <= 1:
+        atom = rng.choice(names + ["T", "F"] if rng.random() < 0.1 else names)
+        return PTrue() if atom == "T" else PFalse() if atom == "F" else PVar(atom)
+    kind = rng.choice([PAnd, POr, PImplies, PNot])
+    if kind is PNot:
+        return PNot(random_prop(rng, names, size - 1))
+    left = rng.randint(1, size - 1)
+    return kind(random_prop(rng, names, left), random_prop(rng, names, size - left))
+
+
+def interleaved(n: int) -> Prop:
+    """(x1 /\\ y1) \\/ ... \\/ (xn /\\ yn), linear in the interleaved
+    order and exponential with all the x first."""
+    prop = PFalse()
+    for i in range(n):
+        prop = POr(prop, PAnd(PVar(f"x{i}"), PVar(f"y{i}")))
+    return prop
+
+
+class TestBDD(unittest.TestCase):
+    def test_canonical(self):
+        manager = BDDManager()
+        p, q, r = (PVar(name) for name in "pqr")
+        self.assertEqual(manager.compile(POr(PAnd(p, q), PAnd(p, r))),
+                         manager.compile(PAnd(p, POr(q, r))))
+        self.assertTrue(manager.compile(test_prop_1).valid)
+        self.assertFalse(manager.compile(PAnd(p, PNot(p))).satisfiable)
+        f = manager.compile(test_prop_2)
+        self.assertEqual(~f, manager.compile(PNot(test_prop_2)))
+        # negation shares all the nodes
+        self.assertEqual((~f).size(), f.size())
+        self.assertEqual(f.count(), 2 ** 7 - 2 ** 3 * 9)
+        self.assertEqual(manager.compile(p).count(["p"]), 1)
+        self.assertEqual(manager.compile(p).count(["p", "new"]), 2)
+        with self.assertRaises(ValueError):
+            manager.compile(p).count(["q"])
+
+    def test_random(self):
+        rng = random.Random(1)
+        names = [f"v{i}" for i in range(6)]
+        for cache_size in [CACHE_SIZE, 7]:
+            manager = BDDManager(cache_size)
+            for _ in range(40):
+                prop = random_prop(rng, names, rng.randint(1, 30))
+                f = manager.compile(prop)
+                models = 0
+                for values in itertools.product([False, True], repeat=len(names)):
+                    assignment = dict(zip(names, values))
+                    self.assertEqual(f.evaluate(assignment), evaluate(prop, assignment))
+                    models += evaluate(prop, assignment)
+                self.assertEqual(f.count(names), models)
+                model = f.model()
+                if models:
+                    full = dict.fromkeys(names, False)
+                    full.update(model)
+                    self.assertTrue(evaluate(prop, full))
+                else:
+                    self.assertIsNone(model)
+            self.assertEqual(len(manager.cache), cache_size)
+
+    def test_collect(self):
+        manager = BDDManager()
+        f = manager.compile(interleaved(6))
+        manager.compile(PAnd(interleaved(5), PVar("z")))
+        before = len(manager)
+        manager.collect()
+        self.assertEqual(len(manager), f.size())
+        self.assertLess(len(manager), before)
+        del f
+        manager.collect()
+        self.assertEqual(len(manager), 0)
+
+    def test_reorder(self):
+        n = 8
+        manager = BDDManager()
+        # all the x first
+        for prefix in "xy":
+            for i in range(n):
+                manager.add_var(f"{prefix}{i}")
+        f = manager.compile(interleaved(n))
+        g = ~f & manager.add_var("x0")
+        self.assertEqual(f.size(), 2 ** (n + 1) - 2)
+        count_f, count_g = f.count(), g.count()
+        manager.reorder()
+        self.assertEqual(f.size(), 2 * n)
+        self.assertEqual((f.count(), g.count()), (count_f, count_g))
+        rng = random.Random(2)
+        for _ in range(50):
+            assignment = {name: rng.random() < 0.5 for name in manager.names}
+            self.assertEqual(f.evaluate(assignment), evaluate(interleaved(n), assignment))
+        # the handles stay canonical
+        self.assertEqual(f, manager.compile(interleaved(n)))
+
+        manager = BDDManager(auto_reorder=True)
+        manager.reorder_threshold = 64
+        for prefix in "xy":
+            for i in range(n):
+                manager.add_var(f"{prefix}{i}")
+        f = manager.compile(interleaved(n))
+        self.assertGreater(manager.reorderings, 0)
+        self.assertLess(f.size(), 2 ** (n + 1) - 2)
+
+    def test_deep(self):
+        # a chain far deeper than the recursion limit
+        n = 20000
+        prop = PTrue()
+        for i in range(n):
+            prop = PAnd(prop, PVar(f"b{i}"))
+        f = compile_bdd(prop)
+        self.assertEqual(f.size(), n)
+        self.assertEqual(f.count(), 1)
+        self.assertEqual(f.model(), {f"b{i}": True for i in range(n)})
+
+
+if __name__ == '__main__':
+    unittest.main()
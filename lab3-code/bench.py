@@ -0,0 +1,246 @@
+"""Benchmarks of the `dpll()` pipeline, against Z3.
+
+The instances are generated at any size, as propositions:
+  - random k-SAT at the satisfiability threshold (4.26 clauses per
+    variable for k = 3), half of which are unsatisfiable;
+  - pigeonhole: n + 1 pigeons in n holes, unsatisfiable and exponential
+    for resolution;
+  - parity: the XOR of a chain of variables asserted both true and false
+    by two different bracketings, unsatisfiable and hard for CDCL alone;
+  - N-queens, as in `queen.py`, satisfiable for n >= 4;
+  - the And chain of `monster.py`, 100,000 variables deep.
+
+Each run times the phases of `dpll()` (see its `stats`) and the whole of
+it, and the same formula in a Z3 `Solver`. The results are written as
+JSON along with the git revision, so that two revisions are compared by
+
+    python bench.py run --out new.json --baseline old.json
+
+which lists the phases which got slower by more than `TOLERANCE`.
+Without `run`, `python bench.py` runs the tests, as the other modules do.
+"""
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import unittest
+from typing import Callable, Dict, List, Optional
+
+import z3
+
+from cdcl import pigeonhole
+from dpll import PAnd, PFalse, PNot, POr, Prop, PTrue, PVar, dpll, to_z3, variables
+
+# slowdown ratio counted as a regression, and the least slowdown in
+# seconds, below which the timings are noise
+TOLERANCE = 1.25
+MIN_SECONDS = 0.01
+
+
+def _conjunction(props: List[Prop]) -> Prop:
+    result = props[0] if props else PTrue()
+    for prop in props[1:]:
+        result = PAnd(result, prop)
+    return result
+
+
+def _disjunction(props: List[Prop]) -> Prop:
+    result = props[0] if props else PFalse()
+    for prop in props[1:]:
+        result = POr(result, prop)
+    return result
+
+
+def random_ksat(n: int, k: int = 3, ratio: float = 4.26, seed: int = 0) -> Prop:
+    rng = random.Random(seed)
+    atoms = [PVar(f"x{i}") for i in range(n)]
+    return _conjunction([_disjunction([atom if rng.random() < 0.5 else PNot(atom)
+                                       for atom in rng.sample(atoms, k)])
+                         for _ in range(round(ratio * n))])
+
+
+def clauses_prop(clauses: List[List[int]]) -> Prop:
+    """The conjunction of DIMACS clauses, over the variables `x1`, `x2`..."""
+    return _conjunction([_disjunction([PVar(f"x{lit}") if lit > 0 else PNot(PVar(f"x{-lit}"))
+                                       for lit in clause])
+                         for clause in clauses])
+
+
+def parity(n: int, seed: int = 0) -> Prop:
+    def xor(a: Prop, b: Prop) -> Prop:
+        return POr(PAnd(a, PNot(b)), PAnd(PNot(a), b))
+
+    atoms = [PVar(f"x{i}") for i in range(n)]
+    shuffled = atoms[:]
+    random.Random(seed).shuffle(shuffled)
+    odd = atoms[0]
+    for atom in atoms[1:]:
+        odd = xor(odd, atom)
+    even = shuffled[0]
+    for atom in shuffled[1:]:
+        even = xor(even, atom)
+    return PAnd(odd, PNot(even))
+
+
+def queens(n: int) -> Prop:
+    q = [[PVar(f"q{i}_{j}") for j in range(n)] for i in range(n)]
+    rows = [_disjunction(row) for row in q]
+    attacks = []
+    cells = [(i, j) for i in range(n) for j in range(n)]
+    for a, (i, j) in enumerate(cells):
+        for k, l in cells[a + 1:]:
+            if i == k or j == l or i - j == k - l or i + j == k + l:
+                attacks.append(PNot(PAnd(q[i][j], q[k][l])))
+    return _conjunction(rows + attacks)
+
+
+def and_chain(n: int) -> Prop:
+    prop = PTrue()
+    for i in range(n):
+        prop = PAnd(prop, PVar(f"b_{i}"))
+    return prop
+
+
+# the benchmarks by name, with their generator at the default size and at
+# a small one for quick runs
+SUITE: Dict[str, Dict[str, Callable[[], Prop]]] = {
+    "random_3sat": dict(full=lambda: random_ksat(150, seed=1), quick=lambda: random_ksat(30, seed=1)),
+    "pigeonhole": dict(full=lambda: clauses_prop(pigeonhole(7)),
+                       quick=lambda: clauses_prop(pigeonhole(4))),
+    "parity": dict(full=lambda: parity(14), quick=lambda: parity(8)),
+    "queens": dict(full=lambda: queens(10), quick=lambda: queens(5)),
+    "and_chain": dict(full=lambda: and_chain(100000), quick=lambda: and_chain(2000)),
+}
+
+
+def run_one(prop: Prop, repeat: int = 1) -> dict:
+    """The best timings of `repeat` runs of `dpll()` and of Z3."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result, stats = dpll(prop, stats=True)
+        total = time.perf_counter() - start
+        if best is None or total < best["total"]:
+            best = dict(answer="unsat" if result == "unsat" else "sat", total=total,
+                        time=stats["time"], conflicts=stats["conflicts"],
+                        decisions=stats["decisions"], peak_bytes=stats["peak_bytes"])
+    z3_best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        solver = z3.Solver()
+        solver.add(to_z3(prop))
+        answer = solver.check()
+        elapsed = time.perf_counter() - start
+        z3_best = elapsed if z3_best is None else min(z3_best, elapsed)
+    best["z3"] = dict(answer=str(answer), total=z3_best)
+    return best
+
+
+def revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names: Optional[List[str]] = None, size: str = "full", repeat: int = 1) -> dict:
+    results = {}
+    for name in names or SUITE:
+        results[name] = run_one(SUITE[name][size](), repeat)
+    return dict(revision=revision(), python=platform.python_version(), size=size,
+                time=time.time(), benchmarks=results)
+
+
+def compare(old: dict, new: dict, tolerance: float = TOLERANCE,
+            min_seconds: float = MIN_SECONDS) -> List[dict]:
+    """The phases (and totals) of the benchmarks of both results which got
+    slower, and the benchmarks whose answer changed."""
+    regressions = []
+    for name, now in new["benchmarks"].items():
+        before = old["benchmarks"].get(name)
+        if before is None:
+            continue
+        if before["answer"] != now["answer"]:
+            regressions.append(dict(benchmark=name, phase="answer", old=before["answer"],
+                                    new=now["answer"]))
+        phases = [("total", before["total"], now["total"])]
+        phases += [(phase, before["time"][phase], seconds) for phase, seconds in now["time"].items()
+                   if phase in before["time"]]
+        for phase, was, seconds in phases:
+            if seconds > was * tolerance and seconds - was > min_seconds:
+                regressions.append(dict(benchmark=name, phase=phase, old=was, new=seconds))
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="bench.py run", description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run, among {', '.join(SUITE)}")
+    parser.add_argument("--quick", action="store_true", help="run the small instances")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of each, the best is kept")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in SUITE]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    results = run(args.names, "quick" if args.quick else "full", args.repeat)
+    for name, result in results["benchmarks"].items():
+        phases = " ".join(f"{phase}={seconds:.3f}" for phase, seconds in result["time"].items())
+        print(f"{name:12} {result['answer']:5} {result['total']:8.3f}s  z3 {result['z3']['total']:8.3f}s"
+              f"  {phases}")
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(json.load(file), results)
+        for regression in regressions:
+            print("regression:", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+#####################
+# test cases:
+
+class TestBench(unittest.TestCase):
+    def test_generators(self):
+        solver = z3.Solver()
+        solver.add(to_z3(clauses_prop(pigeonhole(3))))
+        self.assertEqual(solver.check(), z3.unsat)
+        solver = z3.Solver()
+        solver.add(to_z3(parity(6)))
+        self.assertEqual(solver.check(), z3.unsat)
+        self.assertEqual(len(dpll(queens(5))), 25)
+        self.assertEqual(dpll(queens(3)), "unsat")
+        self.assertEqual(len(variables(random_ksat(20))), 20)
+        self.assertEqual(str(clauses_prop([[1, -2], [2]])), "((x1 \\/ ~x2) /\\ x2)")
+
+    def test_run(self):
+        results = run(["pigeonhole", "queens"], "quick")
+        self.assertEqual(results["benchmarks"]["pigeonhole"]["answer"], "unsat")
+        self.assertEqual(results["benchmarks"]["pigeonhole"]["z3"]["answer"], "unsat")
+        self.assertEqual(results["benchmarks"]["queens"]["answer"], "sat")
+        self.assertIn("search", results["benchmarks"]["queens"]["time"])
+        json.loads(json.dumps(results))
+        self.assertEqual(compare(results, results), [])
+        slower = json.loads(json.dumps(results))
+        slower["benchmarks"]["queens"]["time"]["search"] += 1
+        slower["benchmarks"]["pigeonhole"]["answer"] = "sat"
+        self.assertEqual([(r["benchmark"], r["phase"]) for r in compare(results, slower)],
+                         [("pigeonhole", "answer"), ("queens", "search")])
+
+    def test_deep(self):
+        result = run_one(and_chain(20000))
+        self.assertEqual((result["answer"], result["z3"]["answer"]), ("sat", "sat"))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["run"]:
+        sys.exit(main(sys.argv[2:]))
+    unittest.main()
@@ -0,0 +1,762 @@
+"""Conflict-driven clause learning (CDCL) SAT engine.
+
+This is the search engine behind `dpll()` in `dpll.py`. It works on
+clauses of DIMACS-style integers: variable `v` (v >= 1) is written `v`,
+its negation is `-v`.
+
+Internally a literal is encoded as `2 * v + sign`, so that the negation
+of a literal `l` is simply `l ^ 1` and literals can index plain lists.
+All the clauses are stored in one flat `array('i')` arena as
+`[size, flags, lit_0, ..., lit_size-1]`, and a clause is referred to by
+the index of its `lit_0`. The engine uses:
+  - two-watched-literal unit propagation: the first two literals of every
+    clause are watched, and a clause is only visited when one of its
+    watched literals becomes false;
+  - first-UIP conflict analysis with clause minimization;
+  - non-chronological backjumping to the second highest level of the
+    learned clause;
+  - periodic deletion of long learned clauses;
+  - decision, phase and restart policies selected by name, see
+    `heuristics.py`.
+
+The engine is incremental: clauses may be added between calls to
+`solve`, which takes a list of assumption literals and keeps the learned
+clauses of the previous calls. When the assumptions are inconsistent
+with the clauses, `core` holds the subset of them that failed. `push`
+and `pop` scope clauses by guarding them with an activation literal,
+which is assumed while its frame is open and forced false once popped.
+
+Setting `proof` to a `DratWriter` (see `drat.py`) logs every learned and
+deleted clause, so that an unsatisfiability answer can be checked.
+Setting `exchange` shares learned clauses with other solvers of the same
+formula (see `portfolio.py`), and `interrupt` lets the caller stop the
+search, which then returns None.
+
+Setting `stats` to a dict of `new_stats()` counts the decisions, the
+propagations (above level 0), the conflicts, the restarts and the sizes
+of the learned clauses, and the peak size of the clause arena, and then
+`progress`, if set, is called with it every `PROGRESS_PERIOD` conflicts.
+The counters are only updated by the decisions, the conflicts and the
+backjumps, never by the propagation loop, and left at `None` they cost
+one test per event.
+"""
+
+import random
+import unittest
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional
+
+from clause_db import ClauseDB
+from heuristics import DECISIONS, PHASES, RESTARTS, make
+
+# truth values of literals
+UNDEF = 0
+TRUE = 1
+FALSE = -1
+
+# clause header: size and flags precede the literals in the arena
+HEADER = 2
+LEARNT = 1
+
+# conflicts between two calls to `interrupt`
+INTERRUPT_PERIOD = 64
+# conflicts between two calls to `progress`
+PROGRESS_PERIOD = 1000
+
+
+def new_stats() -> dict:
+    """Zeroed search counters, see `CDCL.stats`. `learned_sizes` maps a
+    clause size to the number of learned clauses of that size."""
+    return dict(decisions=0, propagations=0, conflicts=0, restarts=0, learned=0,
+                learned_literals=0, learned_sizes={}, peak_bytes=0)
+
+
+def to_internal(lit: int) -> int:
+    return 2 * lit if lit > 0 else -2 * lit + 1
+
+
+def to_dimacs(lit: int) -> int:
+    return -(lit >> 1) if lit & 1 else lit >> 1
+
+
+class CDCL:
+    def __init__(self, num_vars: int = 0, decision: str = "evsids", phase: str = "save",
+                 restart: str = "glucose", seed: Optional[int] = None):
+        self.num_vars = 0
+        # per literal: truth value and the clauses watching it
+        self.values: List[int] = [UNDEF, UNDEF]
+        self.watches: List[array] = [array('i'), array('i')]
+        # per variable: decision level and reason clause of its assignment
+        self.level: List[int] = [0]
+        self.reason: List[Optional[int]] = [None]
+        self.seen: List[bool] = [False]
+
+        self.arena = array('i')
+        self.learnts: List[int] = []
+        self.trail: List[int] = []
+        self.trail_lim: List[int] = []
+        self.qhead = 0
+        rng = None if seed is None else random.Random(seed)
+        self.order = make("decision", DECISIONS, decision, rng)
+        self.phase = make("phase", PHASES, phase, rng)
+        self.restarts = make("restart", RESTARTS, restart)
+        self.conflicts = 0
+        self.max_learnts = 2000
+        self.ok = True
+        self.model: Dict[int, bool] = {}
+        # the failed assumptions of the last unsatisfiable call
+        self.core: List[int] = []
+        # the activation variables of the open push frames
+        self.frames: List[int] = []
+        # the DRAT proof log, if any
+        self.proof = None
+        # an object with `export(lits, lbd)` and `receive()` sharing the
+        # learned clauses, and a callable telling when to give up
+        self.exchange = None
+        self.interrupt: Optional[Callable[[], bool]] = None
+        # the search counters, if any, and a callable reporting them
+        self.stats: Optional[dict] = None
+        self.progress: Optional[Callable[[dict], None]] = None
+
+        self.ensure_vars(num_vars)
+
+    @classmethod
+    def from_db(cls, db: ClauseDB) -> "CDCL":
+        solver = cls(db.num_vars)
+        for clause in db:
+            if not solver.add_clause(clause):
+                break
+        return solver
+
+    def ensure_vars(self, num_vars: int):
+        extra = num_vars - self.num_vars
+        if extra <= 0:
+            return
+        self.num_vars = num_vars
+        self.values += [UNDEF] * (2 * extra)
+        self.watches += [array('i') for _ in range(2 * extra)]
+        self.level += [0] * extra
+        self.reason += [None] * extra
+        self.seen += [False] * extra
+        self.order.new_vars(num_vars)
+        self.phase.new_vars(num_vars)
+
+    def new_var(self) -> int:
+        self.ensure_vars(self.num_vars + 1)
+        return self.num_vars
+
+    def decision_level(self) -> int:
+        return len(self.trail_lim)
+
+    def clause(self, ref: int) -> List[int]:
+        """The DIMACS literals of the clause `ref`."""
+        return [to_dimacs(lit) for lit in self.arena[ref:ref + self.arena[ref - HEADER]]]
+
+    def add_clause(self, clause: Iterable[int]) -> bool:
+        """Add a clause of DIMACS literals to the innermost frame, return
+        False if the formula became trivially unsatisfiable."""
+        if self.frames:
+            clause = list(clause)
+            clause.append(-self.frames[-1])
+        return self._add_clause(clause)
+
+    def push(self):
+        """Open a frame, the clauses added until the matching `pop` are
+        retracted by it. The frame takes a fresh variable from `new_var`,
+        so the variables of later clauses must be allocated past it."""
+        self.frames.append(self.new_var())
+
+    def pop(self):
+        unit = [-self.frames.pop()]
+        if self.proof is not None:
+            # a RAT lemma, the activation literal never occurs positively
+            self.proof.add(unit)
+        self._add_clause(unit)
+
+    def _add_clause(self, clause: Iterable[int], flags: int = 0) -> bool:
+        if not self.ok:
+            return False
+        assert self.decision_level() == 0
+        lits = []
+        # the literals kept, for constant time duplicate and tautology
+        # checks on wide clauses
+        kept = set()
+        shortened = False
+        for lit in clause:
+            self.ensure_vars(abs(lit))
+            p = to_internal(lit)
+            value = self.values[p]
+            if value == TRUE or p ^ 1 in kept:
+                # satisfied at top level, or a tautology
+                return True
+            if value == UNDEF and p not in kept:
+                kept.add(p)
+                lits.append(p)
+            shortened = shortened or value == FALSE
+        if shortened and self.proof is not None:
+            self.proof.add(map(to_dimacs, lits))
+
+        if len(lits) == 0:
+            self.ok = False
+        elif len(lits) == 1:
+            self._assign(lits[0], None)
+            if self._propagate() is not None:
+                self._refuted()
+        else:
+            ref = self._new_clause(lits, flags)
+            if flags & LEARNT:
+                self.learnts.append(ref)
+        return self.ok
+
+    def _new_clause(self, lits: List[int], flags: int) -> int:
+        arena = self.arena
+        arena.append(len(lits))
+        arena.append(flags)
+        ref = len(arena)
+        arena.extend(lits)
+        self.watches[lits[0]].append(ref)
+        self.watches[lits[1]].append(ref)
+        return ref
+
+    def _assign(self, lit: int, reason: Optional[int]):
+        var = lit >> 1
+        self.values[lit] = TRUE
+        self.values[lit ^ 1] = FALSE
+        self.level[var] = len(self.trail_lim)
+        self.reason[var] = reason
+        self.trail.append(lit)
+
+    def _propagate(self) -> Optional[int]:
+        """Unit propagation over the watch lists, return a conflicting
+        clause or None."""
+        values = self.values
+        watches = self.watches
+        arena = self.arena
+        trail = self.trail
+        while self.qhead < len(trail):
+            false_lit = trail[self.qhead] ^ 1
+            self.qhead += 1
+            watchers = watches[false_lit]
+            i = j = 0
+            n = len(watchers)
+            while i < n:
+                ref = watchers[i]
+                i += 1
+                # make sure the false literal is the second one
+                first = arena[ref]
+                if first == false_lit:
+                    first = arena[ref] = arena[ref + 1]
+                    arena[ref + 1] = false_lit
+                if values[first] == TRUE:
+                    watchers[j] = ref
+                    j += 1
+                    continue
+                # look for a new literal to watch
+                for k in range(ref + 2, ref + arena[ref - HEADER]):
+                    lit = arena[k]
+                    if values[lit] != FALSE:
+                        arena[ref + 1] = lit
+                        arena[k] = false_lit
+                        watches[lit].append(ref)
+                        break
+                else:
+                    # the clause is unit or conflicting under the assignment
+                    watchers[j] = ref
+                    j += 1
+                    if values[first] == FALSE:
+                        while i < n:
+                            watchers[j] = watchers[i]
+                            j += 1
+                            i += 1
+                        del watchers[j:]
+                        return ref
+                    self._assign(first, ref)
+            del watchers[j:]
+        return None
+
+    def _analyze(self, conflict: int):
+        """First-UIP conflict analysis, return the learned clause (asserting
+        literal first) and the level to backjump to."""
+        seen = self.seen
+        level = self.level
+        reason = self.reason
+        arena = self.arena
+        trail = self.trail
+        current = self.decision_level()
+        learnt = [0]
+        # the variables met, whose activity grows
+        bumped = []
+        pending = 0
+        index = len(trail) - 1
+        # the conflicting clause, then the reasons without their implied
+        # (first) literal
+        start = conflict
+        ref = conflict
+        while True:
+            for q in arena[start:ref + arena[ref - HEADER]]:
+                var = q >> 1
+                if not seen[var] and level[var] > 0:
+                    seen[var] = True
+                    bumped.append(var)
+                    if level[var] >= current:
+                        pending += 1
+                    else:
+                        learnt.append(q)
+            # the next literal on the trail involved in the conflict
+            while not seen[trail[index] >> 1]:
+                index -= 1
+            lit = trail[index]
+            index -= 1
+            seen[lit >> 1] = False
+            pending -= 1
+            if pending == 0:
+                break
+            ref = reason[lit >> 1]
+            start = ref + 1
+        learnt[0] = lit ^ 1
+        self.order.bump(bumped)
+
+        # drop literals implied by the other literals of the clause
+        kept = [learnt[0]]
+        for q in learnt[1:]:
+            ref = reason[q >> 1]
+            if ref is None or any(not seen[r >> 1] and level[r >> 1] > 0
+                                  for r in arena[ref + 1:ref + arena[ref - HEADER]]):
+                kept.append(q)
+        for q in learnt[1:]:
+            seen[q >> 1] = False
+        learnt = kept
+
+        if len(learnt) == 1:
+            return learnt, 0
+        # watch the literal of the highest level besides the asserting one
+        best = 1
+        for k in range(2, len(learnt)):
+            if level[learnt[k] >> 1] > level[learnt[best] >> 1]:
+                best = k
+        learnt[1], learnt[best] = learnt[best], learnt[1]
+        return learnt, level[learnt[1] >> 1]
+
+    def _backjump(self, target: int):
+        if self.decision_level() <= target:
+            return
+        values = self.values
+        bound = self.trail_lim[target]
+        reason = self.reason
+        undone = self.trail[bound:]
+        if self.stats is not None:
+            self.stats["propagations"] += sum(reason[lit >> 1] is not None for lit in undone)
+        for lit in undone:
+            values[lit] = values[lit ^ 1] = UNDEF
+            reason[lit >> 1] = None
+        self.phase.save(undone)
+        self.order.unassigned([lit >> 1 for lit in undone])
+        del self.trail[bound:]
+        del self.trail_lim[target:]
+        self.qhead = bound
+
+    def value(self, lit: int) -> Optional[bool]:
+        """The current value of a DIMACS literal, None if unassigned."""
+        value = self.values[to_internal(lit)]
+        return None if value == UNDEF else value == TRUE
+
+    def assume(self, lit: int) -> bool:
+        """Open a decision level asserting a DIMACS literal and propagate
+        it, return False on a conflict. `retract` undoes it."""
+        self.ensure_vars(abs(lit))
+        self.trail_lim.append(len(self.trail))
+        p = to_internal(lit)
+        if self.values[p] == FALSE:
+            return False
+        if self.values[p] == UNDEF:
+            self._assign(p, None)
+        return self._propagate() is None
+
+    def retract(self, level: int = 0):
+        """Undo the decision levels above `level`."""
+        self._backjump(level)
+
+    def probe(self, lit: int) -> Optional[List[int]]:
+        """Assert a DIMACS literal on top of the current assignment and
+        propagate it, return the literals implied (`lit` included), or
+        None on a conflict. The assignment is undone afterwards."""
+        p = to_internal(lit)
+        if self.values[p] != UNDEF:
+            return [] if self.values[p] == TRUE else None
+        level = self.decision_level()
+        bound = len(self.trail)
+        implied = None
+        if self.assume(lit):
+            implied = [to_dimacs(q) for q in self.trail[bound:]]
+        self.retract(level)
+        return implied
+
+    def _analyze_final(self, lit: int) -> List[int]:
+        """The assumptions on the trail that imply the (internal) literal
+        `lit`, together with the assumption `lit ^ 1` it falsifies."""
+        core = [lit ^ 1]
+        if self.level[lit >> 1] == 0:
+            return core
+        seen = self.seen
+        arena = self.arena
+        seen[lit >> 1] = True
+        for q in reversed(self.trail[self.trail_lim[0]:]):
+            var = q >> 1
+            if not seen[var]:
+                continue
+            ref = self.reason[var]
+            if ref is None:
+                # assumptions are the only decisions below the conflict
+                core.append(q)
+            else:
+                for r in arena[ref + 1:ref + arena[ref - HEADER]]:
+                    if self.level[r >> 1] > 0:
+                        seen[r >> 1] = True
+            seen[var] = False
+        return core
+
+    def _decide(self) -> Optional[int]:
+        var = self.order.next(self.values)
+        if var is None:
+            return None
+        return 2 * var if self.phase.polarity(var) else 2 * var + 1
+
+    def _import(self) -> bool:
+        """Add the clauses received from the exchange, at level 0."""
+        for clause in self.exchange.receive():
+            if not self._add_clause(clause, LEARNT):
+                return False
+        return True
+
+    def _reduce_learnts(self):
+        """Delete the longer half of the learned clauses which are not
+        currently the reason of an assignment, and compact the arena."""
+        arena = self.arena
+        locked = set()
+        for lit in self.trail:
+            ref = self.reason[lit >> 1]
+            if ref is not None:
+                locked.add(ref)
+        self.learnts.sort(key=lambda ref: arena[ref - HEADER])
+        half = len(self.learnts) // 2
+        deleted = set(ref for ref in self.learnts[half:]
+                      if ref not in locked and arena[ref - HEADER] > 2)
+        if self.proof is not None:
+            for ref in deleted:
+                self.proof.delete(self.clause(ref))
+        self._compact(deleted)
+
+    def _compact(self, deleted: set):
+        """Drop the clauses `deleted` from the arena, moving the others and
+        updating their references."""
+        arena = self.arena
+        moved = array('i')
+        remap = {}
+        pos = 0
+        while pos < len(arena):
+            ref = pos + HEADER
+            end = ref + arena[pos]
+            if ref not in deleted:
+                remap[ref] = len(moved) + HEADER
+                moved.extend(arena[pos:end])
+            pos = end
+        self.arena = moved
+        self.learnts = [remap[ref] for ref in self.learnts if ref in remap]
+        for lit in self.trail:
+            ref = self.reason[lit >> 1]
+            if ref is not None:
+                self.reason[lit >> 1] = remap[ref]
+        # the watched literals stay in place, so the watches stay valid
+        for lit, watchers in enumerate(self.watches):
+            self.watches[lit] = array('i', [remap[ref] for ref in watchers if ref in remap])
+
+    def _count(self, learnt: List[int]):
+        """Update the counters after a conflict."""
+        stats = self.stats
+        stats["conflicts"] += 1
+        stats["learned"] += 1
+        stats["learned_literals"] += len(learnt)
+        sizes = stats["learned_sizes"]
+        sizes[len(learnt)] = sizes.get(len(learnt), 0) + 1
+        stats["peak_bytes"] = max(stats["peak_bytes"], len(self.arena) * self.arena.itemsize)
+        if self.progress is not None and stats["conflicts"] % PROGRESS_PERIOD == 0:
+            self.progress(stats)
+
+    def _refuted(self):
+        self.ok = False
+        if self.proof is not None:
+            self.proof.add([])
+
+    def solve(self, assumptions: Iterable[int] = ()) -> Optional[bool]:
+        """Search for a satisfying assignment extending the assumption
+        literals, which is stored in `model`. On failure, `core` lists the
+        assumptions involved, and is empty when the clauses alone are
+        unsatisfiable. Return None if `interrupt` stopped the search."""
+        self.model = {}
+        self.core = []
+        if not self.ok:
+            return False
+        assumptions = [to_internal(lit) for lit in assumptions]
+        for lit in assumptions:
+            self.ensure_vars(lit >> 1)
+        assumptions += [2 * var for var in self.frames]
+        if self._propagate() is not None:
+            self._refuted()
+            return False
+        stats = self.stats
+        while True:
+            conflict = self._propagate()
+            if conflict is not None:
+                if self.decision_level() == 0:
+                    self._refuted()
+                    return False
+                learnt, target = self._analyze(conflict)
+                if self.proof is not None:
+                    self.proof.add(map(to_dimacs, learnt))
+                lbd = len(set(self.level[q >> 1] for q in learnt))
+                if self.exchange is not None:
+                    self.exchange.export([to_dimacs(q) for q in learnt], lbd)
+                self._backjump(target)
+                if len(learnt) == 1:
+                    self._assign(learnt[0], None)
+                else:
+                    ref = self._new_clause(learnt, LEARNT)
+                    self.learnts.append(ref)
+                    self._assign(learnt[0], ref)
+                self.order.decay()
+                self.conflicts += 1
+                if stats is not None:
+                    self._count(learnt)
+                if self.interrupt is not None and self.conflicts % INTERRUPT_PERIOD == 0 \
+                        and self.interrupt():
+                    self._backjump(0)
+                    return None
+                if self.restarts.conflict(lbd):
+                    if stats is not None:
+                        stats["restarts"] += 1
+                    self._backjump(0)
+                    if self.exchange is not None and not self._import():
+                        return False
+                continue
+
+            if len(self.learnts) - len(self.trail) >= self.max_learnts:
+                self._reduce_learnts()
+                self.max_learnts = self.max_learnts * 11 // 10
+
+            # assumptions are decided first, one level each
+            decision = None
+            while self.decision_level() < len(assumptions):
+                lit = assumptions[self.decision_level()]
+                value = self.values[lit]
+                if value == FALSE:
+                    frames = set(self.frames)
+                    self.core = list(dict.fromkeys(
+                        to_dimacs(q) for q in self._analyze_final(lit ^ 1)
+                        if q >> 1 not in frames))
+                    self._backjump(0)
+                    return False
+                if value == UNDEF:
+                    decision = lit
+                    break
+                # already implied, open an empty level to keep the count
+                self.trail_lim.append(len(self.trail))
+            if decision is None:
+                decision = self._decide()
+            if decision is None:
+                self.model = {v: self.values[2 * v] == TRUE
+                              for v in range(1, self.num_vars + 1)}
+                self._backjump(0)
+                return True
+            self.trail_lim.append(len(self.trail))
+            self._assign(decision, None)
+            if stats is not None:
+                stats["decisions"] += 1
+
+
+def solve(clauses: Iterable[Iterable[int]], num_vars: int = 0,
+          assumptions: Iterable[int] = ()) -> Optional[Dict[int, bool]]:
+    """Solve DIMACS clauses (e.g. a ClauseDB), return a model or None if
+    unsat."""
+    solver = CDCL(num_vars)
+    for clause in clauses:
+        solver.add_clause(clause)
+    if solver.solve(assumptions):
+        return solver.model
+    return None
+
+
+#####################
+# test cases:
+
+def pigeonhole(holes: int) -> List[List[int]]:
+    # variable p(i, j): pigeon i sits in hole j
+    def p(i, j):
+        return i * holes + j + 1
+    clauses = [[p(i, j) for j in range(holes)] for i in range(holes + 1)]
+    for j in range(holes):
+        for i in range(holes + 1):
+            for k in range(i + 1, holes + 1):
+                clauses.append([-p(i, j), -p(k, j)])
+    return clauses
+
+
+def satisfies(model: Dict[int, bool], clauses: List[List[int]]) -> bool:
+    return all(any(model[abs(lit)] == (lit > 0) for lit in clause)
+               for clause in clauses)
+
+
+class TestCDCL(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(solve([]), {})
+
+    def test_unit(self):
+        self.assertEqual(solve([[1], [-1, 2], [-2, -3]]), {1: True, 2: True, 3: False})
+
+    def test_empty_clause(self):
+        self.assertIsNone(solve([[1, 2], []]))
+
+    def test_wide_clause(self):
+        # 20000 literals, each twice, checked in linear time
+        n = 20000
+        solver = CDCL()
+        self.assertTrue(solver.add_clause(list(range(1, n + 1)) + list(range(n, 0, -1))))
+        self.assertEqual(len(solver.arena), n + 2)
+        self.assertTrue(solver.add_clause([-n] + list(range(1, n)) + [n]))
+        self.assertEqual(len(solver.arena), n + 2)
+        for var in range(1, n):
+            solver.add_clause([-var])
+        self.assertTrue(solver.solve())
+        self.assertTrue(solver.model[n])
+
+    def test_pigeonhole(self):
+        for holes in range(1, 6):
+            self.assertIsNone(solve(pigeonhole(holes)))
+
+    def test_reduce(self):
+        # delete learned clauses after every few conflicts
+        solver = CDCL()
+        for clause in pigeonhole(6):
+            solver.add_clause(clause)
+        solver.max_learnts = 20
+        self.assertFalse(solver.solve())
+        import random
+        rng = random.Random(7)
+        for _ in range(10):
+            clauses = [[rng.choice([-1, 1]) * rng.randint(1, 40) for _ in range(3)]
+                       for _ in range(160)]
+            solver = CDCL(40)
+            for clause in clauses:
+                solver.add_clause(clause)
+            solver.max_learnts = 5
+            if solver.solve():
+                self.assertTrue(satisfies(solver.model, clauses))
+
+    def test_from_db(self):
+        db = ClauseDB()
+        db.ensure_vars(3)
+        for clause in [[1, 2], [-1, 3], [-3], [-2, 1]]:
+            db.add_clause(clause)
+        self.assertIsNone(solve(db))
+        self.assertFalse(CDCL.from_db(db).solve())
+
+    def test_assumptions(self):
+        solver = CDCL()
+        for clause in [[1, 2], [-1, 3], [-2, 3], [-3, 4]]:
+            solver.add_clause(clause)
+        self.assertTrue(solver.solve([-4, 5]) is False)
+        self.assertEqual(solver.core, [-4])
+        self.assertFalse(solver.solve([-1, -2]))
+        self.assertEqual(sorted(solver.core), [-2, -1])
+        self.assertFalse(solver.solve([1, -1]))
+        self.assertEqual(sorted(solver.core), [-1, 1])
+        self.assertTrue(solver.solve([-1, 5]))
+        self.assertEqual(solver.model[1], False)
+        self.assertEqual(solver.model[5], True)
+        self.assertTrue(solver.ok)
+        # the failed assumptions of pigeonhole with one pigeon less
+        solver = CDCL()
+        clauses = pigeonhole(4)
+        for clause in clauses:
+            solver.add_clause(clause + [21 + clauses.index(clause)] if len(clause) == 4 else clause)
+        self.assertFalse(solver.solve([-21, -22, -23, -24, -25]))
+        self.assertEqual(len(solver.core), 5)
+        learnts = len(solver.learnts)
+        self.assertTrue(solver.solve([-21, -22, -23, -24]))
+        self.assertEqual(solver.decision_level(), 0)
+        self.assertGreaterEqual(len(solver.learnts), learnts)
+
+    def test_push_pop(self):
+        # the activation variables follow the declared ones
+        solver = CDCL(3)
+        solver.add_clause([1, 2])
+        solver.push()
+        solver.add_clause([-1])
+        solver.add_clause([-2])
+        self.assertFalse(solver.solve())
+        self.assertEqual(solver.core, [])
+        self.assertTrue(solver.ok)
+        solver.pop()
+        self.assertTrue(solver.solve([-1]))
+        self.assertTrue(solver.model[2])
+        solver.push()
+        solver.add_clause([-2])
+        solver.push()
+        solver.add_clause([2, 3])
+        self.assertTrue(solver.solve())
+        self.assertEqual((solver.model[1], solver.model[2], solver.model[3]), (True, False, True))
+        solver.pop()
+        solver.pop()
+        self.assertTrue(solver.solve([-1]))
+        self.assertEqual(solver.frames, [])
+
+    def test_random_3sat(self):
+        import io
+        import random
+        from drat import DratWriter, check_drat
+        rng = random.Random(2023)
+        for _ in range(50):
+            n = 30
+            clauses = [[rng.choice([-1, 1]) * rng.randint(1, n) for _ in range(3)]
+                       for _ in range(125)]
+            solver = CDCL(n)
+            proof = io.BytesIO()
+            solver.proof = DratWriter(proof)
+            for clause in clauses:
+                solver.add_clause(clause)
+            if solver.solve():
+                self.assertTrue(satisfies(solver.model, clauses))
+            else:
+                # check the refutation
+                self.assertTrue(check_drat(clauses, io.BytesIO(proof.getvalue())))
+
+    def test_stats(self):
+        global PROGRESS_PERIOD
+        saved, PROGRESS_PERIOD = PROGRESS_PERIOD, 10
+        try:
+            solver = CDCL()
+            solver.stats = stats = new_stats()
+            reports = []
+            solver.progress = lambda counters: reports.append(counters["conflicts"])
+            for clause in pigeonhole(5):
+                solver.add_clause(clause)
+            self.assertFalse(solver.solve())
+        finally:
+            PROGRESS_PERIOD = saved
+        self.assertEqual(stats["conflicts"], solver.conflicts)
+        self.assertEqual(sum(stats["learned_sizes"].values()), stats["learned"])
+        self.assertEqual(sum(size * count for size, count in stats["learned_sizes"].items()),
+                         stats["learned_literals"])
+        self.assertGreater(stats["decisions"], 0)
+        self.assertGreater(stats["propagations"], stats["decisions"])
+        self.assertGreater(stats["peak_bytes"], 0)
+        self.assertEqual(reports, list(range(10, stats["conflicts"] + 1, 10)))
+        # without counters, nothing is counted
+        solver = CDCL()
+        for clause in pigeonhole(4):
+            solver.add_clause(clause)
+        self.assertFalse(solver.solve())
+        self.assertIsNone(solver.stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,8 +7,11 @@ Hints:
  You can reuse the `sat_all` function that you've implemented in exercise 1
  if you think necessary."""
 
+import unittest
+
 from z3 import *
 from pro_print import pretty_print
+from model_count import count_prop
 
 # Exercise 4: Circuit Layout
 # Usually When EE-Engineers design a circuit layout, they will verify it to
@@ -20,49 +23,73 @@ from pro_print import pretty_print
 # for F and Not(F).
 # And then make sure that both F and Not(F) can be satisfied.
 # First we convert it into proposition
+# The solutions are counted by `count_prop` (see `model_count.py`) rather
+# than enumerated by `sat_all`, which needs a solver call per solution.
 def circuit_layout():
     a, b, c, d = Bools('a b c d')
+    names = [str(v) for v in (a, b, c, d)]
     # ( (d /\ (a /\ b)) \/ (c /\ (a /\ b)) )
     F = Or(And(d, And(a, b)), And(c, And(a, b)))
     print("F: ")
     pretty_print(F)
-    sat_all([a, b, c, d], F)
+    count = count_prop(F, names)
+    print("the number of solutions: ", count)
 
     print("Not(F): ")
     pretty_print(Not(F))
-    sat_all([a, b, c, d], Not(F))
-
-# steal code from Exercise 1-6 and modify it slightly
-def sat_all(props, f):
+    count_not = count_prop(Not(F), names)
+    print("the number of solutions: ", count_not)
+    return count, count_not
+
+# steal code from Exercise 1-6 and modify it slightly:
+# `f` is asserted once, and each model is blocked by a flat clause over
+# `props`, the models being generated one at a time
+def iter_models(props, f, assumptions=()):
     solver = Solver()
     solver.add(f)
-    result = []
-    while solver.check() == sat:
+    while solver.check(*assumptions) == sat:
         m = solver.model()
-        result.append(m)
-        block = []
-        for prop in props:
-            prop_is_true = m.eval(prop, model_completion=True)
-
-            if prop_is_true:
-                new_prop = prop
-            else:
-                new_prop = Not(prop)
-
-            block.append(new_prop)
-
-        r = block[0]
-        for b in block[1:]:
-            r = And(r, b)
-        solver.add(And(f, Not(r)))
+        yield m
+        solver.add(Or([Not(prop) if is_true(m.eval(prop, model_completion=True)) else prop
+                       for prop in props]))
 
-    print("the number of solutions: ", len(result))
 
+def sat_all(props, f, assumptions=()):
     def print_model(m):
         print(sorted([(d, m[d]) for d in m], key=lambda x: str(x[0])))
 
-    for m in result:
+    count = 0
+    for m in iter_models(props, f, assumptions):
         print_model(m)
+        count += 1
+    print("the number of solutions: ", count)
+    return count
+
+
+#####################
+# test cases:
+
+class TestCircuit(unittest.TestCase):
+    def test_circuit_layout(self):
+        self.assertEqual(circuit_layout(), (3, 13))
+
+    def test_sat_all(self):
+        a, b, c, d = Bools('a b c d')
+        F = Or(And(d, And(a, b)), And(c, And(a, b)))
+        self.assertEqual(sat_all([a, b, c, d], F), 3)
+        self.assertEqual(sat_all([a, b, c, d], Not(F)), 13)
+        # projected on a and b, under the assumption c
+        self.assertEqual(sat_all([a, b], Or(a, b), [c]), 3)
+        self.assertEqual(sat_all([a, b], F, [Not(a)]), 0)
+        self.assertEqual(sat_all([], F), 1)
+
+    def test_lazy(self):
+        # 2 ** 40 models, of which only the first few are computed
+        xs = [Bool(f"x{i}") for i in range(40)]
+        models = iter_models(xs, BoolVal(True))
+        first = [next(models) for _ in range(5)]
+        assignments = {tuple(is_true(m.eval(x, model_completion=True)) for x in xs) for m in first}
+        self.assertEqual(len(assignments), 5)
 
 
 if __name__ == '__main__':
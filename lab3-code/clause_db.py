@@ -0,0 +1,127 @@
+"""Flat clause database of DIMACS-style integer literals.
+
+All the clauses live in one contiguous `array('i')`, terminated by an
+`offsets` index: clause `i` is `lits[offsets[i]:offsets[i + 1]]`. A
+variable is an integer `v >= 1`, its negation is `-v`, and variables may
+carry a name, so that a model can be reported in terms of the `PVar`s of
+the original proposition. Variables without a name (e.g. the auxiliary
+variables of the Tseitin encoding) are left out of the reported model.
+"""
+
+import unittest
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+class ClauseDB:
+    def __init__(self):
+        self.lits = array('i')
+        self.offsets = array('q', [0])
+        # names[v] is the name of variable v, or None; ids is the inverse
+        self.names: List[Optional[str]] = [None]
+        self.ids: Dict[str, int] = {}
+
+    @property
+    def num_vars(self) -> int:
+        return len(self.names) - 1
+
+    @property
+    def num_lits(self) -> int:
+        return len(self.lits)
+
+    def new_var(self, name: Optional[str] = None) -> int:
+        self.names.append(name)
+        var = len(self.names) - 1
+        if name is not None:
+            self.ids[name] = var
+        return var
+
+    def set_name(self, var: int, name: str):
+        self.ensure_vars(var)
+        old = self.names[var]
+        if old is not None:
+            del self.ids[old]
+        self.names[var] = name
+        self.ids[name] = var
+
+    def var(self, name: str) -> int:
+        """The variable called `name`, created on first use."""
+        var = self.ids.get(name)
+        if var is None:
+            var = self.new_var(name)
+        return var
+
+    def ensure_vars(self, num_vars: int):
+        if num_vars > self.num_vars:
+            self.names.extend([None] * (num_vars - self.num_vars))
+
+    def add_clause(self, clause: Iterable[int]):
+        """Append a clause, its variables must exist already (see `var`,
+        `new_var` and `ensure_vars`)."""
+        self.lits.extend(clause)
+        self.offsets.append(len(self.lits))
+
+    def clear(self):
+        """Drop the clauses, keeping the variables and their names."""
+        del self.lits[:]
+        del self.offsets[1:]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def clause(self, i: int) -> array:
+        return self.lits[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self) -> Iterator[array]:
+        lits = self.lits
+        offsets = self.offsets
+        for i in range(len(offsets) - 1):
+            yield lits[offsets[i]:offsets[i + 1]]
+
+    def nbytes(self) -> int:
+        """Bytes held by the clause buffers."""
+        return (self.lits.buffer_info()[1] * self.lits.itemsize
+                + self.offsets.buffer_info()[1] * self.offsets.itemsize)
+
+    def named_model(self, model: Dict[int, bool]) -> Dict[str, bool]:
+        """Restrict a model over the variables to the named ones."""
+        return {name: model.get(var, False) for name, var in self.ids.items()}
+
+    def __str__(self):
+        def show(lit):
+            name = self.names[abs(lit)]
+            if name is None:
+                name = f"#{abs(lit)}"
+            return name if lit > 0 else "~" + name
+        return str([[show(lit) for lit in clause] for clause in self])
+
+
+#####################
+# test cases:
+
+class TestClauseDB(unittest.TestCase):
+    def test_clauses(self):
+        db = ClauseDB()
+        p, q = db.var("p"), db.var("q")
+        aux = db.new_var()
+        db.add_clause([p, -q])
+        db.add_clause([])
+        db.add_clause([-aux, q, p])
+        self.assertEqual(len(db), 3)
+        self.assertEqual(db.num_vars, 3)
+        self.assertEqual(db.var("q"), q)
+        self.assertEqual([list(c) for c in db], [[1, -2], [], [-3, 2, 1]])
+        self.assertEqual(list(db.clause(2)), [-3, 2, 1])
+        self.assertEqual(str(db), "[['p', '~q'], [], ['~#3', 'q', 'p']]")
+        self.assertEqual(db.named_model({1: True, 2: False, 3: True}), {"p": True, "q": False})
+        self.assertEqual(db.lits.itemsize, 4)
+        db.set_name(3, "r")
+        self.assertEqual(db.var("r"), 3)
+        db.set_name(5, "s")
+        self.assertEqual(db.names, [None, "p", "q", "r", None, "s"])
+        db.clear()
+        self.assertEqual((len(db), db.num_lits, db.num_vars), (0, 0, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
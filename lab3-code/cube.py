@@ -0,0 +1,258 @@
+"""Cube-and-conquer: split one hard CNF into independent subproblems.
+
+The cuber is a lookahead solver. At each node it probes both values of
+the most promising variables, branches on the one whose two sides imply
+the most literals (the product of the two counts, as in march), and
+stops at a given depth. A literal whose probe conflicts is false under
+the cube, and a cube both sides of which conflict is refuted on the spot.
+The leaves are the cubes: conjunctions of literals covering together
+every assignment not already refuted.
+
+The conquer step solves the cubes in a pool of processes. Each worker
+keeps one incremental CDCL engine over the whole formula, and solves its
+cubes as assumptions, so the clauses learned on one cube help with the
+next. A cube which runs past `CONFLICT_BUDGET` conflicts is split again
+by the worker's own lookahead, and the new cubes go back to the shared
+queue, where idle workers pick them up. The formula is sat as soon as a
+cube is, and unsat when every cube is refuted.
+"""
+
+import concurrent.futures as futures
+import math
+import multiprocessing
+import os
+import random
+import unittest
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cdcl import CDCL, pigeonhole, satisfies
+from clause_db import ClauseDB
+
+# the variables probed at each node of the lookahead
+CANDIDATES = 16
+# the conflicts a worker spends on a cube before splitting it
+CONFLICT_BUDGET = 2000
+# the depth of the splits of long running cubes
+RESPLIT_DEPTH = 2
+
+
+class Cuber:
+    """Lookahead over an engine, whose variables are pre-ranked by
+    occurrences, weighted towards short clauses."""
+
+    def __init__(self, engine: CDCL, db: ClauseDB):
+        self.engine = engine
+        weight = [0.0] * (engine.num_vars + 1)
+        for clause in db:
+            share = 2.0 ** -len(clause)
+            for lit in clause:
+                weight[abs(lit)] += share
+        self.ranked = sorted(range(1, engine.num_vars + 1), key=lambda v: -weight[v])
+
+    def _branch(self) -> Tuple[Optional[int], bool]:
+        """Probe the candidates at the current node, asserting the failed
+        literals. Return the variable to branch on (None when all the
+        candidates are assigned) and False if the node is refuted."""
+        engine = self.engine
+        candidates = [var for var in self.ranked if engine.value(var) is None][:CANDIDATES]
+        best, best_score = None, -1
+        for var in candidates:
+            if engine.value(var) is not None:
+                # implied by a failed literal
+                continue
+            pos = engine.probe(var)
+            neg = engine.probe(-var)
+            if pos is None and neg is None:
+                return None, False
+            if pos is None or neg is None:
+                if not engine.assume(var if pos is not None else -var):
+                    return None, False
+                continue
+            score = (len(pos) + 1) * (len(neg) + 1)
+            if score > best_score:
+                best, best_score = var, score
+        return best, True
+
+    def cubes(self, prefix: List[int], depth: int) -> List[List[int]]:
+        """Split the cube `prefix` into cubes of up to `depth` more
+        literals; the refuted parts are left out."""
+        engine = self.engine
+        base = engine.decision_level()
+        result = []
+        ok = all(engine.assume(lit) for lit in prefix)
+        if ok:
+            self._split(list(prefix), depth, result)
+        engine.retract(base)
+        return result
+
+    def _split(self, cube: List[int], depth: int, result: List[List[int]]):
+        engine = self.engine
+        if depth == 0:
+            result.append(cube)
+            return
+        level = engine.decision_level()
+        var, ok = self._branch()
+        if ok:
+            if var is None:
+                # nothing left to split on
+                result.append(cube)
+            else:
+                for lit in (var, -var):
+                    inner = engine.decision_level()
+                    if engine.assume(lit):
+                        self._split(cube + [lit], depth - 1, result)
+                    engine.retract(inner)
+        engine.retract(level)
+
+
+def _build(db: ClauseDB) -> CDCL:
+    engine = CDCL(db.num_vars)
+    for clause in db:
+        if not engine.add_clause(clause):
+            break
+    return engine
+
+
+def lookahead_cubes(clauses: ClauseDB, depth: int) -> List[List[int]]:
+    """The cubes of a lookahead split of the clauses, `depth` deep."""
+    engine = _build(clauses)
+    if not engine.ok:
+        return []
+    return Cuber(engine, clauses).cubes([], depth)
+
+
+# the state a worker process gets from the pool
+_stop = None
+_engine = None
+_cuber = None
+
+
+def _init_worker(stop, db: ClauseDB):
+    global _stop, _engine, _cuber
+    _stop = stop
+    _engine = _build(db)
+    _cuber = Cuber(_engine, db)
+
+
+def _conquer(cube: List[int], budget: int) -> Tuple[Optional[bool], Dict[int, bool], List[List[int]]]:
+    """Solve a cube, return the answer (None when it ran out of budget),
+    the model if sat, and the sub-cubes if it was split."""
+    engine = _engine
+    start = engine.conflicts
+
+    def interrupt() -> bool:
+        return _stop.is_set() or engine.conflicts - start >= budget
+
+    engine.interrupt = interrupt
+    result = engine.solve(cube)
+    if result is None and not _stop.is_set():
+        return None, {}, _cuber.cubes(cube, RESPLIT_DEPTH)
+    if result is False and not engine.core:
+        # the formula itself is unsat
+        return False, None, []
+    return result, engine.model, []
+
+
+def cube_and_conquer(clauses: Iterable[Iterable[int]], num_vars: int = 0, workers: int = None,
+                     depth: int = None, budget: int = CONFLICT_BUDGET
+                     ) -> Tuple[bool, Dict[int, bool], Dict[str, int]]:
+    """Solve the clauses by cube-and-conquer with up to `workers`
+    processes. The initial cubes are `depth` deep, enough for a few per
+    worker by default.
+
+    Returns
+    -------
+    Tuple[bool, Dict[int, bool], Dict[str, int]]
+        The answer, the model if it is sat, and the counts of the cubes
+        solved and split.
+
+    """
+    if isinstance(clauses, ClauseDB):
+        db = clauses
+    else:
+        db = ClauseDB()
+        db.ensure_vars(num_vars)
+        for clause in clauses:
+            clause = list(clause)
+            if clause:
+                db.ensure_vars(max(map(abs, clause)))
+            db.add_clause(clause)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if depth is None:
+        depth = max(1, math.ceil(math.log2(4 * workers)))
+    stats = {"cubes": 0, "split": 0}
+    cubes = lookahead_cubes(db, depth)
+    if not cubes:
+        return False, {}, stats
+
+    context = multiprocessing.get_context()
+    stop = context.Event()
+    answer, model, refuted = False, {}, False
+    with futures.ProcessPoolExecutor(workers, context, _init_worker, (stop, db)) as pool:
+        pending = {pool.submit(_conquer, cube, budget) for cube in cubes}
+        while pending and not answer and not refuted:
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                result, result_model, subcubes = future.result()
+                stats["cubes"] += 1
+                if result is None:
+                    stats["split"] += 1
+                    pending |= {pool.submit(_conquer, cube, budget) for cube in subcubes}
+                elif result:
+                    answer, model = True, result_model
+                elif result_model is None:
+                    # refuted without the cube
+                    refuted = True
+        # the queued cubes never start, the running ones return soon
+        stop.set()
+        for future in pending:
+            future.cancel()
+    return answer, model, stats
+
+
+#####################
+# test cases:
+
+class TestCube(unittest.TestCase):
+    def test_cubes(self):
+        clauses = pigeonhole(4)
+        db = ClauseDB()
+        db.ensure_vars(20)
+        for clause in clauses:
+            db.add_clause(clause)
+        cubes = lookahead_cubes(db, 3)
+        self.assertTrue(cubes)
+        self.assertTrue(all(len(cube) <= 3 for cube in cubes))
+        # every cube is unsat, and they cover the assignments together
+        for cube in cubes:
+            solver = CDCL()
+            for clause in clauses:
+                solver.add_clause(clause)
+            self.assertFalse(solver.solve(cube))
+        rng = random.Random(0)
+        sat_clauses = [[rng.choice([-1, 1]) * v for v in rng.sample(range(1, 41), 3)]
+                       for _ in range(120)]
+        db = ClauseDB()
+        db.ensure_vars(40)
+        for clause in sat_clauses:
+            db.add_clause(clause)
+        cubes = lookahead_cubes(db, 4)
+        self.assertTrue(any(CDCL.from_db(db).solve(cube) for cube in cubes))
+
+    def test_unsat(self):
+        answer, _, stats = cube_and_conquer(pigeonhole(6), workers=2, budget=100)
+        self.assertFalse(answer)
+        self.assertGreater(stats["split"], 0)
+
+    def test_sat(self):
+        rng = random.Random(5)
+        clauses = [[rng.choice([-1, 1]) * v for v in rng.sample(range(1, 61), 3)]
+                   for _ in range(240)]
+        answer, model, _ = cube_and_conquer(clauses, 60, workers=2, budget=50)
+        self.assertTrue(answer)
+        self.assertTrue(satisfies(model, clauses))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,251 @@
+"""Reading and writing CNF in the DIMACS format.
+
+    c comment
+    p cnf <variables> <clauses>
+    1 -3 0
+    2 3 -1 0
+
+Clauses are streamed from the file into a `ClauseDB` chunk by chunk, so
+the memory used is that of the clause store rather than the file text.
+Input compressed with gzip, bzip2 or xz is recognized by its magic bytes.
+
+The writer stores the names of named variables as `c var <id> <name>`
+comment lines, which the reader turns back into names.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import tempfile
+import unittest
+import warnings
+from array import array
+from typing import BinaryIO, List, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from clause_db import ClauseDB
+from dpll import Prop, PVar, PNot, PAnd, POr, encode_literal, add_clause, to_clause_db
+
+_MAGIC = [
+    (b"\x1f\x8b", gzip.open),
+    (b"BZh", bz2.open),
+    (b"\xfd7zXZ\x00", lzma.open),
+]
+
+
+def open_cnf(path: Union[str, os.PathLike], mode: str = "rb") -> BinaryIO:
+    """Open a (possibly compressed) DIMACS file as a binary stream. When
+    writing, the compression is chosen by the file suffix."""
+    if "r" in mode:
+        with open(path, "rb") as fp:
+            head = fp.read(6)
+        for magic, opener in _MAGIC:
+            if head.startswith(magic):
+                return opener(path, mode)
+        return open(path, mode)
+    suffix = os.fspath(path).rsplit(".", 1)[-1]
+    opener = {"gz": gzip.open, "bz2": bz2.open, "xz": lzma.open}.get(suffix, open)
+    return opener(path, mode)
+
+
+# bytes read from the stream at a time
+CHUNK_SIZE = 1 << 22
+
+
+def parse_dimacs(stream: BinaryIO, db: ClauseDB = None) -> ClauseDB:
+    """Read the clauses of a binary DIMACS stream into `db`."""
+    if db is None:
+        db = ClauseDB()
+    lits = db.lits
+    offsets = db.offsets
+    names = {}
+    declared = 0
+    # the largest variable met
+    used = 0
+
+    def add_numbers(numbers: bytes):
+        nonlocal used
+        # the literals go straight to the buffer, each 0 closes a clause
+        if np is not None:
+            with warnings.catch_warnings():
+                # numpy only warns when it cannot parse the whole text
+                warnings.simplefilter("error", DeprecationWarning)
+                try:
+                    nums = np.fromstring(numbers, dtype=np.int32, sep=" ")
+                except DeprecationWarning:
+                    raise ValueError(f"bad DIMACS clause data near {numbers[:40]!r}") from None
+            if len(nums):
+                used = max(used, int(np.abs(nums).max()))
+            zeros = np.flatnonzero(nums == 0)
+            offsets.frombytes((zeros - np.arange(len(zeros)) + len(lits)).astype(np.int64).tobytes())
+            lits.frombytes(nums[nums != 0].tobytes())
+            return
+        nums = array('i', map(int, numbers.split()))
+        if nums:
+            used = max(used, max(nums), -min(nums))
+        base = len(lits)
+        closed = 0
+        try:
+            zero = -1
+            while True:
+                zero = nums.index(0, zero + 1)
+                offsets.append(base + zero - closed)
+                closed += 1
+        except ValueError:
+            pass
+        lits.extend(filter(None, nums))
+
+    def add_lines(text: bytes) -> bool:
+        """Parse text holding comment or header lines, return False at the
+        end marker."""
+        nonlocal declared
+        block = []
+        for line in text.splitlines(keepends=True):
+            head = line.lstrip()[:1]
+            if head not in (b"c", b"p", b"%"):
+                block.append(line)
+                continue
+            # clause lines in between are parsed together
+            add_numbers(b"".join(block))
+            block = []
+            if head == b"c":
+                words = line.split(None, 3)
+                if len(words) == 4 and words[1] == b"var":
+                    names[int(words[2])] = words[3].strip().decode()
+            elif head == b"p":
+                words = line.split()
+                if len(words) != 4 or words[1] != b"cnf":
+                    raise ValueError(f"bad DIMACS header: {line!r}")
+                declared = int(words[2])
+            else:
+                # the end marker of the SATLIB benchmarks
+                return False
+        add_numbers(b"".join(block))
+        return True
+
+    rest = b""
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        # only parse whole lines
+        chunk = rest + chunk
+        cut = chunk.rfind(b"\n") + 1
+        rest = chunk[cut:]
+        chunk = chunk[:cut]
+        if b"c" in chunk or b"p" in chunk or b"%" in chunk:
+            if not add_lines(chunk):
+                rest = b""
+                break
+        else:
+            add_numbers(chunk)
+    if rest:
+        add_lines(rest)
+    if len(lits) > offsets[-1]:
+        # tolerate a missing terminator on the last clause
+        offsets.append(len(lits))
+
+    db.ensure_vars(max(declared, used))
+    for var, name in names.items():
+        db.set_name(var, name)
+    return db
+
+
+def read_dimacs(path: Union[str, os.PathLike]) -> ClauseDB:
+    with open_cnf(path, "rb") as stream:
+        return parse_dimacs(stream)
+
+
+def clauses_of(source: Union[ClauseDB, Prop, List[List[Prop]]]) -> ClauseDB:
+    """The ClauseDB of any result of the pipeline: a ClauseDB, a
+    proposition, or clauses as produced by `flatten` and `tseitin`."""
+    if isinstance(source, ClauseDB):
+        return source
+    if isinstance(source, Prop):
+        return to_clause_db(source)
+    db = ClauseDB()
+    for prop_list in source:
+        add_clause(db, [encode_literal(db, atom) for atom in prop_list])
+    return db
+
+
+def dump_dimacs(source: Union[ClauseDB, Prop, List[List[Prop]]], stream: BinaryIO):
+    """Write the clauses of `source` to a binary stream in DIMACS."""
+    db = clauses_of(source)
+    stream.write(b"p cnf %d %d\n" % (db.num_vars, len(db)))
+    for var, name in enumerate(db.names):
+        if name is not None:
+            stream.write(b"c var %d %s\n" % (var, name.encode()))
+    lits = db.lits
+    offsets = db.offsets
+    lines = []
+    for i in range(len(offsets) - 1):
+        lits_i = lits[offsets[i]:offsets[i + 1]]
+        lines.append(" ".join(map(str, lits_i)) + " 0\n" if lits_i else "0\n")
+        if len(lines) >= 4096:
+            stream.write("".join(lines).encode())
+            lines.clear()
+    stream.write("".join(lines).encode())
+
+
+def write_dimacs(source: Union[ClauseDB, Prop, List[List[Prop]]], path: Union[str, os.PathLike]):
+    with open_cnf(path, "wb") as stream:
+        dump_dimacs(source, stream)
+
+
+#####################
+# test cases:
+
+class TestDimacs(unittest.TestCase):
+    def test_parse(self):
+        text = b"""c a comment
+p cnf 5 4
+1 -3 0
+2 3
+ -1 0
+-5 0
+0
+"""
+        db = parse_dimacs(io.BytesIO(text))
+        self.assertEqual([list(c) for c in db], [[1, -3], [2, 3, -1], [-5], []])
+        self.assertEqual(db.num_vars, 5)
+        with self.assertRaises(ValueError):
+            parse_dimacs(io.BytesIO(b"p dnf 1 1\n"))
+        with self.assertRaises(ValueError):
+            parse_dimacs(io.BytesIO(b"1 2 0\n1 x 0\n"))
+
+    def test_parse_without_numpy(self):
+        global np
+        saved, np = np, None
+        try:
+            self.test_parse()
+            self.test_round_trip()
+        finally:
+            np = saved
+
+    def test_satlib(self):
+        db = parse_dimacs(io.BytesIO(b"p cnf 2 1\n1 2 0\n%\n0\n\n"))
+        self.assertEqual([list(c) for c in db], [[1, 2]])
+
+    def test_round_trip(self):
+        prop = PAnd(POr(PVar("p"), PNot(PVar("q"))), PNot(PVar("p")))
+        with tempfile.TemporaryDirectory() as tmp:
+            for suffix in ["cnf", "cnf.gz", "cnf.bz2", "cnf.xz"]:
+                path = os.path.join(tmp, "prop." + suffix)
+                write_dimacs(prop, path)
+                db = read_dimacs(path)
+                self.assertEqual(str(db), "[['p', '~q'], ['~p']]")
+            path = os.path.join(tmp, "flat.cnf")
+            write_dimacs([[PVar("a"), PNot(PVar("b"))], [PVar("b")]], path)
+            with open(path, "rb") as fp:
+                self.assertEqual(fp.read(), b"p cnf 2 2\nc var 1 a\nc var 2 b\n1 -2 0\n2 0\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,19 @@
+import gc
+import time
 import unittest
-import copy
-from typing import List
-from dataclasses import dataclass
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Set, Tuple
 
 from z3 import *
 
+from cdcl import CDCL, new_stats
+from clause_db import ClauseDB
+from cube import cube_and_conquer
+from local_search import local_search
+from portfolio import solve_portfolio
+from preprocess import Preprocessor
+
 # In this problem, you will implement the DPLL algorithm as discussed
 # in the class.
 
@@ -21,69 +30,136 @@ from z3 import *
 #     | ~P
 # '''
 
-@dataclass
+# The live nodes, keyed by their class and their fields (subformulas by
+# identity). The entries are weak, so that dead formulas are forgotten.
+_nodes = dict()
+
+
+class _NodeRef(weakref.ref):
+    __slots__ = ("key",)
+
+    def __new__(cls, node, key):
+        ref = weakref.ref.__new__(cls, node, _forget)
+        ref.key = key
+        return ref
+
+
+def _forget(ref: _NodeRef):
+    if _nodes.get(ref.key) is ref:
+        del _nodes[ref.key]
+
+
+def _new_node(cls: type, key: tuple, fields: tuple, hash_value: int):
+    node = object.__new__(cls)
+    for name, value in zip(cls.__match_args__, fields):
+        object.__setattr__(node, name, value)
+    object.__setattr__(node, "_hash", hash_value)
+    _nodes[key] = _NodeRef(node, key)
+    return node
+
+
 class Prop:
+    """Base class of the propositions.
+
+    Propositions are immutable and hash-consed: building a node which is
+    structurally equal to a live one returns that very node. Hence
+    equality is identity, hashes are computed once, shared subformulas
+    are stored once, and the transformations below memoize their results
+    per node.
+    """
+    __slots__ = ("_hash", "__weakref__")
+    __match_args__ = ()
+
+    def __new__(cls, *args: "Prop"):
+        key = (cls, *map(id, args))
+        ref = _nodes.get(key)
+        if ref is not None:
+            node = ref()
+            if node is not None:
+                return node
+        if len(args) != len(cls.__match_args__):
+            raise TypeError(f"{cls.__name__} takes {len(cls.__match_args__)} argument(s)")
+        for arg in args:
+            if not isinstance(arg, Prop):
+                raise TypeError(f"{cls.__name__} expects propositions, got {arg!r}")
+        return _new_node(cls, key, args, hash((cls.__name__, *[arg._hash for arg in args])))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, name) for name in self.__match_args__)
+
     def __repr__(self):
         return self.__str__()
-        
 
 
-@dataclass(repr=False)
 class PVar(Prop):
-    var: str
+    __slots__ = ("var",)
+    __match_args__ = ("var",)
+
+    def __new__(cls, var: str):
+        key = (cls, var)
+        ref = _nodes.get(key)
+        if ref is not None:
+            node = ref()
+            if node is not None:
+                return node
+        if type(var) is not str:
+            raise TypeError(f"PVar expects a name, got {var!r}")
+        return _new_node(cls, key, (var,), hash(var))
 
     def __str__(self):
         return self.var
-    
-    def __repr__(self):
-        return self.__str__()
-
-    def __hash__(self):
-        return hash(self.var)
 
 
-@dataclass(repr=False)
 class PTrue(Prop):
+    __slots__ = ()
+
     def __str__(self):
         return "True"
 
 
-@dataclass(repr=False)
 class PFalse(Prop):
+    __slots__ = ()
+
     def __str__(self):
         return "False"
-    
 
-@dataclass(repr=False)
+
 class PAnd(Prop):
-    left: Prop
-    right: Prop
+    __slots__ = ("left", "right")
+    __match_args__ = ("left", "right")
 
     def __str__(self):
         return f"({self.left} /\\ {self.right})"
 
 
-@dataclass(repr=False)
 class POr(Prop):
-    left: Prop
-    right: Prop
+    __slots__ = ("left", "right")
+    __match_args__ = ("left", "right")
 
     def __str__(self):
         return f"({self.left} \\/ {self.right})"
 
 
-@dataclass(repr=False)
 class PImplies(Prop):
-    left: Prop
-    right: Prop
+    __slots__ = ("left", "right")
+    __match_args__ = ("left", "right")
 
     def __str__(self):
         return f"({self.left} -> {self.right})"
 
 
-@dataclass(repr=False)
 class PNot(Prop):
-    p: Prop
+    __slots__ = ("p",)
+    __match_args__ = ("p",)
 
     def __str__(self):
         return f"~{self.p}"
@@ -93,24 +169,146 @@ class PNot(Prop):
 # we can convert the above defined syntax into Z3's representation, so
 # that we can check it's validity easily:
 def to_z3(prop: Prop) -> z3.BoolRef:
-    match prop:
-        case PVar(var):
-            return Bool(var)
-        case PTrue():
-            return Bool(True)
-        case PFalse():
-            return Bool(False)
-        case PAnd(l, r):
-            return And(to_z3(l), to_z3(r))
-        case POr(l, r):
-            return Or(to_z3(l), to_z3(r))
-        case PImplies(l, r):
-            return Implies(to_z3(l), to_z3(r))
-        case PNot(p):
-            return Not(to_z3(p))
+    """The Z3 formula of `prop`, built with `transform` so that deep
+    propositions convert too."""
+    def combine(node: Prop, args):
+        match node:
+            case PVar(var):
+                return Bool(var)
+            case PTrue():
+                return BoolVal(True)
+            case PFalse():
+                return BoolVal(False)
+            case PAnd():
+                return And(*args)
+            case POr():
+                return Or(*args)
+            case PImplies():
+                return Implies(*args)
+            case PNot():
+                return Not(*args)
+
+    return transform(prop, combine)
 
 
 
+#####################
+# All the transformations below walk the proposition with an explicit
+# stack instead of recursion, so that propositions of any depth (see
+# `monster.py`, a 100,000-deep chain of `And`) can be converted without
+# hitting the recursion limit, in time linear in their size.
+
+def children(prop: Prop) -> tuple:
+    kind = type(prop)
+    if kind is PNot:
+        return (prop.p,)
+    if kind is PAnd or kind is POr or kind is PImplies:
+        return prop.left, prop.right
+    return ()
+
+
+@contextmanager
+def paused_gc():
+    """Suspend the cyclic garbage collector. The transformations allocate
+    many acyclic nodes, which only make the collector rescan the whole
+    (large) heap again and again."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def transform(prop: Prop, combine, expand=children, key=id):
+    """Rebuild `prop` bottom-up without recursion.
+
+    `expand(node)` gives the children to descend into, and
+    `combine(node, args)` builds the result of `node` from the results
+    of these children, in order. The result of each compound node is
+    memoized under `key(node)`, so a shared subformula is rebuilt once.
+    """
+    results = []
+    memo = {}
+    stack = [(prop, None)]
+    push = stack.append
+    pop = stack.pop
+    with paused_gc():
+        while stack:
+            node, kids = pop()
+            if kids is None:
+                done = memo.get(key(node))
+                if done is not None:
+                    results.append(done)
+                    continue
+                kids = expand(node)
+                if kids:
+                    push((node, kids))
+                    for kid in reversed(kids):
+                        push((kid, None))
+                else:
+                    results.append(combine(node, ()))
+            else:
+                n = len(results) - len(kids)
+                args = results[n:]
+                del results[n:]
+                done = memo[key(node)] = combine(node, args)
+                results.append(done)
+    return results[0]
+
+
+def operands(prop: Prop, kind: type, unique: bool = False) -> List[Prop]:
+    """Operands of the n-ary `kind` (PAnd or POr) rooted at `prop`, left
+    to right. With `unique`, each shared operand is listed once, which is
+    sound as both connectives are idempotent."""
+    result = []
+    visited = set()
+    stack = [prop]
+    while stack:
+        node = stack.pop()
+        if unique:
+            if id(node) in visited:
+                continue
+            visited.add(id(node))
+        if type(node) is kind:
+            stack.append(node.right)
+            stack.append(node.left)
+        else:
+            result.append(node)
+    return result
+
+
+def from_z3(expr: z3.BoolRef) -> Prop:
+    """Convert a propositional Z3 formula back into a `Prop`, the inverse
+    of `to_z3`. The n-ary `And` and `Or` nest to the left, `==` between
+    booleans becomes a pair of implications and `Xor` its negation."""
+    def combine(node: z3.BoolRef, args) -> Prop:
+        if is_true(node):
+            return PTrue()
+        if is_false(node):
+            return PFalse()
+        if is_const(node) and is_bool(node):
+            return PVar(node.decl().name())
+        if is_not(node):
+            return PNot(args[0])
+        if is_implies(node):
+            return PImplies(*args)
+        if is_and(node) or is_or(node):
+            kind = PAnd if is_and(node) else POr
+            result = args[0]
+            for arg in args[1:]:
+                result = kind(result, arg)
+            return result
+        if (is_eq(node) or is_app_of(node, Z3_OP_XOR)) and len(args) == 2:
+            iff = PAnd(PImplies(args[0], args[1]), PImplies(args[1], args[0]))
+            return iff if is_eq(node) else PNot(iff)
+        raise ValueError(f"not a propositional formula: {node}")
+
+    return transform(expr, combine, lambda node: tuple(node.children()),
+                     key=lambda node: node.get_id())
+
+
 #####################
 # Exercise 3-2: try to implement the `ie()` method to do the 
 # implication elimination, as we've discussed in the class.
@@ -122,22 +320,19 @@ def to_z3(prop: Prop) -> z3.BoolRef:
 #   C(P->Q)   = ~C(P) \/ C(Q)
 
 def ie(prop: Prop) -> Prop:
-    match prop:
-        case PVar(var):
-            return prop
-        case PTrue():
-            return prop
-        case PFalse():
-            return prop
-        case PAnd(l, r):
-            return PAnd(ie(l), ie(r))
-        case POr(l, r):
-            return POr(ie(l), ie(r))
-        case PImplies(l, r):
-            return POr(PNot(ie(l)), ie(r))
-        case PNot(p):
-            return PNot(ie(p))
-    return prop
+    def combine(node: Prop, args) -> Prop:
+        match node:
+            case PAnd():
+                return PAnd(*args)
+            case POr():
+                return POr(*args)
+            case PImplies():
+                return POr(PNot(args[0]), args[1])
+            case PNot():
+                return PNot(*args)
+        return node
+
+    return transform(prop, combine)
 
 
 # Exercise 3-3: try to implement the `nnf()` method to convert the
@@ -151,28 +346,129 @@ def ie(prop: Prop) -> Prop:
 #   C(~(P/\Q)) = C(~P) \/ C(~Q)
 #   C(~(P\/Q)) = C(~P) /\ C(~Q)
 def nnf(prop_without_implies: Prop) -> Prop:
-    match prop_without_implies:
-        case PImplies(left, right):
+    # the negations are pushed down as a flag of each stack entry
+    def expand(entry) -> tuple:
+        node, negated = entry
+        kind = type(node)
+        if kind is PAnd or kind is POr:
+            return (node.left, negated), (node.right, negated)
+        if kind is PNot:
+            return ((node.p, not negated),)
+        if kind is PImplies:
             raise Exception("Proposition should not contain implication in NNF conversion")
-        case POr(left, right):
-            return POr(nnf(left), nnf(right))
-        case PVar(var):
-            return prop_without_implies
-        case PTrue():
-            return prop_without_implies
-        case PFalse():
-            return prop_without_implies
-        case PAnd(l, r):
-            return PAnd(nnf(l), nnf(r))
-        case PNot(PAnd(l, r)):
-            return POr(nnf(PNot(l)), nnf(PNot(r)))
-        case PNot(POr(l, r)):
-            return PAnd(nnf(PNot(l)), nnf(PNot(r)))
-        case PNot(PNot(p)):
-            return nnf(p)
-        case PNot(p):
-            return PNot(nnf(p))
-    return prop_without_implies
+        return ()
+
+    def combine(entry, args) -> Prop:
+        node, negated = entry
+        kind = type(node)
+        if kind is PAnd:
+            return POr(*args) if negated else PAnd(*args)
+        if kind is POr:
+            return PAnd(*args) if negated else POr(*args)
+        if kind is PNot:
+            return args[0]
+        return PNot(node) if negated else node
+
+    def key(entry) -> int:
+        return 2 * id(entry[0]) + entry[1]
+
+    return transform((prop_without_implies, False), combine, expand, key)
+
+# A NNF proposition often carries constants, repeated operands and
+# absorbable ones into the CNF, where the distributive `cnf()` multiplies
+# them. `shrink` rewrites it first, seeing nested `/\` (and `\/`) as one
+# n-ary node over its operands:
+#   constants:   P /\ T = P,  P /\ F = F,  ~T = F  (and dually)
+#   duplicates:  P /\ P = P
+#   complements: p /\ ~p = F,  p \/ ~p = T
+#   absorption:  P /\ (P \/ Q) = P,  P \/ (P /\ Q) = P
+# where absorption drops an operand of the other kind which has a sibling
+# among its own operands. The n-ary nodes are rebuilt nesting to the left.
+
+def prop_size(prop: Prop) -> int:
+    """Number of distinct nodes of `prop`."""
+    visited = set()
+    stack = [prop]
+    while stack:
+        node = stack.pop()
+        if id(node) not in visited:
+            visited.add(id(node))
+            stack.extend(children(node))
+    return len(visited)
+
+
+def shrink(nnf_prop: Prop) -> Tuple[Prop, dict]:
+    """Simplify a NNF proposition into an equivalent one, no larger.
+
+    Returns
+    -------
+    Tuple[Prop, dict]
+        The simplified proposition, and the statistics of the rewriting:
+        the node numbers before and after ("nodes", "shrunk_nodes"), and
+        the number of "constants", "duplicates", "complements" and
+        "absorbed" operands removed.
+    """
+    stats = dict(nodes=prop_size(nnf_prop), constants=0, duplicates=0, complements=0, absorbed=0)
+    true, false = PTrue(), PFalse()
+    # the operands of the n-ary nodes built here
+    flat = dict()
+
+    def expand(node: Prop) -> tuple:
+        kind = type(node)
+        if kind is PAnd or kind is POr:
+            return tuple(operands(node, kind))
+        return children(node)
+
+    def members(prop: Prop, kind: type) -> List[Prop]:
+        if type(prop) is not kind:
+            return [prop]
+        found = flat.get(id(prop))
+        return found if found is not None else operands(prop, kind)
+
+    def combine(node: Prop, args) -> Prop:
+        kind = type(node)
+        if kind is PNot:
+            if args[0] is true or args[0] is false:
+                stats["constants"] += 1
+                return false if args[0] is true else true
+            return node if args[0] is node.p else PNot(args[0])
+        if kind is not PAnd and kind is not POr:
+            return node
+        unit, zero = (true, false) if kind is PAnd else (false, true)
+        dual = POr if kind is PAnd else PAnd
+        ops = []
+        seen = set()
+        for arg in args:
+            for op in members(arg, kind):
+                if op is unit:
+                    stats["constants"] += 1
+                elif op is zero:
+                    stats["constants"] += 1
+                    return zero
+                elif op in seen:
+                    stats["duplicates"] += 1
+                else:
+                    seen.add(op)
+                    ops.append(op)
+        for op in ops:
+            if type(op) is PNot and op.p in seen:
+                stats["complements"] += 1
+                return zero
+        kept = [op for op in ops if type(op) is not dual
+                or not any(member in seen for member in members(op, dual))]
+        stats["absorbed"] += len(ops) - len(kept)
+        if not kept:
+            return unit
+        result = kept[0]
+        for op in kept[1:]:
+            result = kind(result, op)
+        if len(kept) > 1:
+            flat[id(result)] = kept
+        return result
+
+    result = transform(nnf_prop, combine, expand)
+    stats["shrunk_nodes"] = prop_size(result)
+    return result, stats
 
 # Exercise 3-4: try to implement the `cnf()` method to convert the
 # proposition to cnf, as we've discussed in the class.
@@ -186,23 +482,37 @@ def nnf(prop_without_implies: Prop) -> Prop:
 #   D(P, Q=Q1/\Q2) = D(P, Q1) /\ D(P, Q2)
 #   D(P, Q)        = P \/ Q
 def cnf(nnf_prop: Prop) -> Prop:
+    def conjuncts(prop: Prop) -> tuple:
+        return (prop.left, prop.right) if type(prop) is PAnd else ()
+
     def cnf_d(left: Prop, right: Prop) -> Prop:
-        match (left, right):
-            case (PAnd(P1, P2), Q):
-                return PAnd(cnf_d(P1, Q), cnf_d(P2, Q))
-            case (P, PAnd(Q1, Q2)):
-                return PAnd(cnf_d(P, Q1), cnf_d(P, Q2))
-            case _:
-                return POr(left, right)
+        # D keeps the conjunction tree of `left`, and replaces each leaf
+        # P of it by the conjunction tree of `right` with leaves P \/ Q.
+        def distribute_leaf(node: Prop, args) -> Prop:
+            if args:
+                return PAnd(*args)
+            return transform(right, lambda q, qs: PAnd(*qs) if qs else POr(node, q), conjuncts)
 
-            
-    match nnf_prop:
-        case PAnd(left, right):
-            return PAnd(cnf(left), cnf(right))
-        case POr(left, right):
-            return cnf_d(cnf(left), cnf(right))
-        case _:
-            return nnf_prop
+        return transform(left, distribute_leaf, conjuncts)
+
+    def combine(node: Prop, args) -> Prop:
+        match node:
+            case PAnd():
+                return PAnd(*args)
+            case POr():
+                return cnf_d(*args)
+        return node
+
+    def expand(node: Prop) -> tuple:
+        return (node.left, node.right) if type(node) in (PAnd, POr) else ()
+
+    return transform(nnf_prop, combine, expand)
+
+def iter_clauses(cnf_prop: Prop) -> Iterator[List[Prop]]:
+    """Yield the clauses of a CNF proposition one by one, left to right,
+    see `flatten`."""
+    for clause in operands(cnf_prop, PAnd):
+        yield operands(clause, POr)
 
 def flatten(cnf_prop: Prop) -> List[List[Prop]]:
     """Flatten CNF Propositions to nested list structure .
@@ -224,138 +534,406 @@ def flatten(cnf_prop: Prop) -> List[List[Prop]]:
         and second level lists is connected by `Or`.
 
     """
-    
-    def get_atom_from_disjunction(prop: Prop) -> List[Prop]:
-        match prop:
-            case POr(left, right):
-                return get_atom_from_disjunction(left) + get_atom_from_disjunction(right)
-            case _:
-                return [prop]
-    
-    match cnf_prop:
-        case PAnd(left, right):
-            return flatten(left) + flatten(right)
-        case POr():
-            return [get_atom_from_disjunction(cnf_prop)]
-        case _ :
-            return [[cnf_prop]]
-
-def simplify_true(s: str, target: List[Prop]) -> List[Prop]:
-    # var = T
-    ret = list()
-    has_false = False
-    for prop in target:
-        match prop:
-            case PVar(str):
-                if str == s:
-                    return [PTrue()]
-                ret.append(prop)
-            case PNot(PVar(str)):
-                if str == s:
-                    has_false = True
-                else:
-                    ret.append(prop)
-    # 在前面没有返回说明ret中没有PTrue
-    if len(ret) == 0:
-        if has_false:
-            ret.append(PFalse())
-        else:
-            ret.append(PTrue())
-    return ret
-
-def simplify_false(s: str, target: List[Prop]) -> List[Prop]:
-    # var = F
-    ret = list()
-    has_false = False
-    for prop in target:
-        match prop:
-            case PVar(str):
-                if str == s:
-                    has_false = True
-                else:
-                    ret.append(prop)
-            case PNot(PVar(str)):
-                if str == s:
-                    return [PTrue()]
-                ret.append(prop)
-    # 在前面没有返回说明ret中没有PTrue
-    if len(ret) == 0:
-        if has_false:
-            ret.append(PFalse())
-        else:
-            ret.append(PTrue())
-    return ret
+    with paused_gc():
+        return list(iter_clauses(cnf_prop))
 
-def dfs(var_list: List, cur: int, cnf: List[List[Prop]], res: dict) -> bool:
-    if cur == len(var_list):
-        return True
-    var = var_list[cur]
-    s = var.__str__()
-    # T
-    cnf_simplified: List[List[Prop]] = list()
-    can_simplify = True
-    for prop_list in cnf:
-        st = simplify_true(s, prop_list)
-        if len(st) > 1 or (type(st[0]) != PTrue and type(st[0]) != PFalse):
-            cnf_simplified.append(st)
-            continue
+# The distributive `cnf()` can blow up exponentially: every `\/` multiplies
+# the clause numbers of its sides. The definitional (Tseitin) conversion
+# instead names every compound subformula by a fresh variable `x`, and
+# only emits the clauses defining `x`:
+#   x <-> (A1 /\ ... /\ An):  (~x \/ Ai) for all i,  (x \/ ~A1 \/ ... \/ ~An)
+#   x <-> (A1 \/ ... \/ An):  (~x \/ A1 \/ ... \/ An),  (x \/ ~Ai) for all i
+# so the clause number stays linear in the size of the proposition. In
+# NNF every subformula occurs positively, hence the Plaisted-Greenbaum
+# encoding only needs the `x -> ...` half of each definition. The full
+# encoding keeps the number of models, the polarity-aware one does not.
 
-        if type(st[0]) == PFalse:
-            can_simplify = False
-            break
-        elif type(st[0]) == PTrue:
-            continue
-    if can_simplify:
-        res[s] = True
-        if dfs(var_list, cur + 1, cnf_simplified, res):
-            return True
-        res.pop(s)
-    # F
-    cnf_simplified = list()
-    can_simplify = True
-    for prop_list in cnf:
-        st = simplify_false(s, prop_list)
-        if len(st) > 1 or (type(st[0] != PTrue and type(st[0] != PFalse))):
-            cnf_simplified.append(st)
-            continue
+# the auxiliary variables are named TSEITIN_PREFIX + number
+TSEITIN_PREFIX = "_t"
+
+# `dpll()` switches to the definitional conversion when the distributive
+# CNF would have more clauses than this.
+DISTRIBUTE_LIMIT = 1000
+
+
+def cnf_size(nnf_prop: Prop, limit: int = DISTRIBUTE_LIMIT) -> int:
+    """Number of clauses `flatten(cnf(nnf_prop))` would produce, computed
+    without building them. Counting stops once `limit` is exceeded."""
+    def combine(node: Prop, args) -> int:
+        match node:
+            case PAnd():
+                return min(args[0] + args[1], limit + 1)
+            case POr():
+                return min(args[0] * args[1], limit + 1)
+        return 1
+
+    def expand(node: Prop) -> tuple:
+        return (node.left, node.right) if type(node) in (PAnd, POr) else ()
+
+    return transform(nnf_prop, combine, expand)
 
-        if type(st[0]) == PFalse:
-            can_simplify = False
-            break
-        elif type(st[0]) == PTrue:
+
+def variables(prop: Prop) -> List[str]:
+    """Names of the variables of `prop`, in order of first occurrence."""
+    names = dict()
+    visited = set()
+    stack = [prop]
+    while stack:
+        node = stack.pop()
+        if id(node) in visited:
             continue
-    if can_simplify:
-        res[s] = False
-        if dfs(var_list, cur + 1, cnf_simplified, res):
+        visited.add(id(node))
+        if type(node) is PVar:
+            names[node.var] = None
+        stack.extend(reversed(children(node)))
+    return list(names)
+
+
+def literal(prop: Prop):
+    """Classify an atom of a flattened clause: return a pair of the
+    variable name and its polarity, or a bool for a constant."""
+    match prop:
+        case PVar(var):
+            return var, True
+        case PNot(PVar(var)):
+            return var, False
+        case PTrue() | PNot(PFalse()):
             return True
-        res.pop(s)
-    return False
-def dpll(prop: Prop) -> dict:
-    cnf_flat = flatten(cnf(nnf(ie(prop))))
-    print(cnf_flat)
-    
-    # Challenge: implement the dpll algorithm we've discussed in the lecture
-    # you can deal with flattened cnf which generated by `flatten` method for convenience,
-    # or, as another choice, you can process the original cnf destructure generated by `cnf` method
-    #
-    # your implementation should output the result as dict like :
-    # {"p1": True, "p2": False, "p3": False, "p4": True} if there is solution;
-    # output "unsat" if there is no solution
-    #
-    # feel free to add new method.
-    var_set = set()
-    for i in range(len(cnf_flat)):
-        for j in range(len(cnf_flat[i])):
-            str = cnf_flat[i][j].__str__()
-            if len(str) > 1 and str[0] == '~':
-                var_set.add(PVar(str[1:]))
+        case PFalse() | PNot(PTrue()):
+            return False
+    raise Exception(f"{prop} is not a literal")
+
+
+def encode_literal(db: ClauseDB, atom: Prop):
+    """The DIMACS literal of an atom, or a bool for a constant."""
+    lit = literal(atom)
+    if type(lit) is bool:
+        return lit
+    var, positive = lit
+    return db.var(var) if positive else -db.var(var)
+
+
+def add_clause(db: ClauseDB, clause: list):
+    """Add a clause of DIMACS literals and constants to `db`, dropping the
+    false constants and the clauses holding a true one."""
+    if any(lit is True for lit in clause):
+        return
+    db.add_clause([lit for lit in clause if lit is not False])
+
+
+def encode_tseitin(nnf_prop: Prop, db: ClauseDB, polarity: bool = True,
+                   aux_prefix: str = None):
+    """Emit the definitional CNF of a NNF proposition into `db`.
+
+    Nested conjunctions and disjunctions are collapsed, so that one
+    auxiliary variable names a whole n-ary `/\\` or `\\/`; conjunctions at
+    the top level become separate clauses without any auxiliary variable.
+    The auxiliary variables are anonymous, unless an `aux_prefix` is given
+    to name them.
+    """
+    for name in variables(nnf_prop):
+        db.var(name)
+    aux_count = 0
+
+    def fresh() -> int:
+        nonlocal aux_count
+        aux_count += 1
+        if aux_prefix is None:
+            return db.new_var()
+        name = f"{aux_prefix}{aux_count}"
+        while name in db.ids:
+            name = "_" + name
+        return db.new_var(name)
+
+    def negate(lit):
+        return (not lit) if type(lit) is bool else -lit
+
+    def atom(prop: Prop):
+        return encode_literal(db, prop)
+
+    # the literals naming the already defined subformulas, by identity
+    defined = dict()
+
+    def define(prop: Prop):
+        """Return a literal equivalent to `prop`, emitting the definitions
+        of it and of its compound operands, innermost first."""
+        if type(prop) not in (PAnd, POr):
+            return atom(prop)
+        if id(prop) in defined:
+            return defined[id(prop)]
+        # frames of [node, operands left to define (reversed), literals of
+        # the operands defined so far]
+        stack = [[prop, operands(prop, type(prop), True)[::-1], []]]
+        while True:
+            node, todo, args = stack[-1]
+            if todo:
+                operand = todo.pop()
+                if id(operand) in defined:
+                    args.append(defined[id(operand)])
+                elif type(operand) in (PAnd, POr):
+                    stack.append([operand, operands(operand, type(operand), True)[::-1], []])
+                else:
+                    args.append(atom(operand))
+                continue
+            stack.pop()
+            x = fresh()
+            if type(node) is PAnd:
+                for a in args:
+                    add_clause(db, [-x, a])
+                if not polarity:
+                    add_clause(db, [x] + [negate(a) for a in args])
             else:
-                var_set.add(PVar(str))
-    var_list = list(var_set)
-    res = dict()
-    if not dfs(var_list, 0, cnf_flat, res):
+                add_clause(db, [-x] + args)
+                if not polarity:
+                    for a in args:
+                        add_clause(db, [x, negate(a)])
+            defined[id(node)] = x
+            if not stack:
+                return x
+            stack[-1][2].append(x)
+
+    with paused_gc():
+        for conjunct in operands(nnf_prop, PAnd, True):
+            add_clause(db, [define(a) for a in operands(conjunct, POr, True)])
+
+
+def tseitin(nnf_prop: Prop, polarity: bool = True) -> Tuple[List[List[Prop]], Set[str]]:
+    """Convert a NNF proposition into an equisatisfiable CNF in linear size.
+
+    Parameters
+    ----------
+    nnf_prop : Prop
+        Proposition in NNF, as produced by `nnf`.
+    polarity : bool
+        Emit the Plaisted-Greenbaum encoding (only the implications the
+        positive occurrences need) instead of the full equivalences.
+
+    Returns
+    -------
+    Tuple[List[List[Prop]], Set[str]]
+        The flattened clauses, in the same shape `flatten` returns, and
+        the names of the introduced auxiliary variables, which start with
+        `TSEITIN_PREFIX`.
+
+    """
+    db = ClauseDB()
+    encode_tseitin(nnf_prop, db, polarity, TSEITIN_PREFIX)
+    originals = len(variables(nnf_prop))
+    atoms = [None] + [PVar(name) for name in db.names[1:]]
+    clauses = [[atoms[lit] if lit > 0 else PNot(atoms[-lit]) for lit in clause]
+               for clause in db]
+    return clauses, set(db.names[originals + 1:])
+
+
+def to_clause_db(prop: Prop, mode: str = "auto", simplify_prop: bool = False,
+                 stats: dict = None) -> ClauseDB:
+    """Run the whole pipeline on `prop`, and emit its CNF into a ClauseDB.
+
+    `mode` selects the CNF conversion: "distribute" uses `cnf()`,
+    "tseitin" the definitional encoding, and "auto" picks the
+    definitional one when the distributive CNF would exceed
+    `DISTRIBUTE_LIMIT` clauses. With `simplify_prop`, the NNF goes
+    through `shrink` first, whose statistics are added to `stats` if
+    given. The variables of `prop` are numbered in order of occurrence
+    and named after it (even those `shrink` removes), auxiliary ones are
+    anonymous.
+    """
+    db = ClauseDB()
+    encode_prop(prop, db, mode, simplify_prop, stats)
+    return db
+
+
+@contextmanager
+def timed(stats: Optional[dict], phase: str):
+    """Add the time spent in the block to `stats["time"][phase]`, if
+    `stats` is given."""
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        times = stats.setdefault("time", {})
+        times[phase] = times.get(phase, 0.0) + time.perf_counter() - start
+
+
+def encode_prop(prop: Prop, db: ClauseDB, mode: str = "auto", simplify_prop: bool = False,
+                stats: dict = None):
+    """Emit the CNF of `prop` into `db`, see `to_clause_db`. Given
+    `stats`, the time of each phase goes to `stats["time"]`."""
+    with timed(stats, "ie"):
+        prop = ie(prop)
+    with timed(stats, "nnf"):
+        nnf_prop = nnf(prop)
+    if simplify_prop:
+        for name in variables(nnf_prop):
+            db.var(name)
+        with timed(stats, "shrink"):
+            nnf_prop, shrink_stats = shrink(nnf_prop)
+        if stats is not None:
+            stats.update(shrink_stats)
+    if mode == "auto":
+        mode = "distribute" if cnf_size(nnf_prop) <= DISTRIBUTE_LIMIT else "tseitin"
+    if mode == "distribute":
+        for name in variables(nnf_prop):
+            db.var(name)
+        with timed(stats, "cnf"):
+            cnf_prop = cnf(nnf_prop)
+        with timed(stats, "flatten"), paused_gc():
+            for prop_list in iter_clauses(cnf_prop):
+                add_clause(db, [encode_literal(db, atom) for atom in prop_list])
+    elif mode == "tseitin":
+        with timed(stats, "cnf"):
+            encode_tseitin(nnf_prop, db)
+    else:
+        raise ValueError(f"unknown CNF conversion mode: {mode}")
+
+
+def dpll(prop: Prop, mode: str = "auto", proof=None, simplify_cnf: bool = True,
+         search: str = "cdcl", max_flips: int = 100000, simplify_prop: bool = True,
+         stats: bool = False, progress: Optional[Callable[[dict], None]] = None,
+         **heuristics):
+    """Decide the satisfiability of `prop`, see `to_clause_db` for `mode`
+    and `simplify_prop`. A `DratWriter` passed as `proof` receives the
+    refutation of the CNF when the answer is unsat: the CNF of
+    `to_clause_db(prop, mode)`, as `write_dimacs` emits it, so `shrink`
+    is skipped then whatever `simplify_prop` says. The CNF goes through
+    `preprocess` first, unless `simplify_cnf` is False. The `decision`, `phase` and `restart`
+    policies of the search are chosen by name, see `heuristics.py`.
+
+    `search` may also be "walksat" or "probsat", to look for a model by
+    local search first (see `local_search.py`); after `max_flips` flips
+    without success the CDCL search takes over. "portfolio" races the
+    engines of `portfolio.PORTFOLIO` in several processes, and "cube"
+    splits the CNF into cubes solved in several processes (see `cube.py`);
+    neither logs a proof. When no engine answers (e.g. a portfolio of
+    local searches only), the CDCL search decides.
+
+    With `stats`, the result comes in a pair with the statistics of the
+    run: the counters of the CDCL search (see `cdcl.new_stats`, where
+    `peak_bytes` also covers the clause database), those of `shrink`
+    and of `preprocess` (under "preprocess"), and the seconds spent in
+    each phase under "time": "ie", "nnf", "shrink", "cnf", "flatten",
+    "preprocess" and "search". `progress` is called with these
+    statistics every `cdcl.PROGRESS_PERIOD` conflicts. Without either,
+    nothing is measured.
+    """
+    counters = None
+    if stats or progress is not None:
+        counters = new_stats()
+        counters["time"] = {}
+    result = _dpll(prop, mode, proof, simplify_cnf, search, max_flips, simplify_prop, counters,
+                   progress, heuristics)
+    if result == "unsat":
         print("unsat")
-    return res
+    return (result, counters) if stats else result
+
+
+def _dpll(prop: Prop, mode, proof, simplify_cnf, search, max_flips, simplify_prop,
+          counters: Optional[dict], progress, heuristics):
+    # the proof refutes the CNF of the unshrunk prop
+    db = to_clause_db(prop, mode, simplify_prop and proof is None, counters)
+    if counters is not None:
+        counters["peak_bytes"] = db.nbytes()
+    clauses = db
+    if simplify_cnf:
+        clauses = Preprocessor(db, db.num_vars, proof)
+        with timed(counters, "preprocess"):
+            simplified = clauses.run()
+        if counters is not None:
+            counters["preprocess"] = dict(clauses.stats)
+        if not simplified:
+            return "unsat"
+    model = None
+    with timed(counters, "search"):
+        if search in ("portfolio", "cube"):
+            if search == "portfolio":
+                answer, model, _ = solve_portfolio(clauses, db.num_vars)
+            else:
+                answer, model, _ = cube_and_conquer(clauses, db.num_vars)
+            if answer is False:
+                return "unsat"
+            if answer is None:
+                # only incomplete searches ran, CDCL decides
+                model = None
+        elif search != "cdcl":
+            model = local_search(clauses, db.num_vars, search, max_flips)
+        if model is None:
+            solver = CDCL(db.num_vars, **heuristics)
+            solver.proof = proof
+            solver.stats = counters
+            solver.progress = progress
+            for clause in clauses:
+                if not solver.add_clause(clause):
+                    break
+            if not solver.solve():
+                return "unsat"
+            model = solver.model
+    if simplify_cnf:
+        model = clauses.extend(model)
+    return db.named_model(model)
+
+
+class DpllSolver:
+    """A persistent solver for propositions, keeping the CDCL engine (and
+    so its learned clauses) alive between the calls to `solve`.
+
+    Constraints are added with `add` (any proposition) or `add_clause` (a
+    list of literals, i.e. `PVar`s and negated `PVar`s), and scoped with
+    `push` and `pop`. `solve` takes assumption literals; after a failed
+    call, `core` lists the assumptions responsible for it.
+    """
+
+    def __init__(self, mode: str = "auto", **heuristics):
+        self.mode = mode
+        # the variable numbering, and the clauses not yet in the engine
+        self.db = ClauseDB()
+        self.engine = CDCL(**heuristics)
+        self.model = {}
+        self.core = []
+
+    def _flush(self):
+        for clause in self.db:
+            self.engine.add_clause(clause)
+        self.db.clear()
+
+    def add(self, prop: Prop):
+        encode_prop(prop, self.db, self.mode)
+        self._flush()
+
+    def add_clause(self, clause: List[Prop]):
+        add_clause(self.db, [encode_literal(self.db, atom) for atom in clause])
+        self._flush()
+
+    def push(self):
+        # the numbering may have variables the engine has not seen, whose
+        # clauses were simplified away: the activation variable comes after
+        self.engine.ensure_vars(self.db.num_vars)
+        self.engine.push()
+        # keep the activation variable out of the numbering
+        self.db.ensure_vars(self.engine.num_vars)
+
+    def pop(self):
+        self.engine.pop()
+
+    def solve(self, assumptions: List[Prop] = ()) -> bool:
+        self.model = {}
+        self.core = []
+        lits = {}
+        for atom in assumptions:
+            lit = encode_literal(self.db, atom)
+            if lit is False:
+                self.core = [atom]
+                return False
+            if lit is not True:
+                lits.setdefault(lit, atom)
+        if not self.engine.solve(lits):
+            failed = set(self.engine.core)
+            self.core = [atom for lit, atom in lits.items() if lit in failed]
+            return False
+        self.model = self.db.named_model(self.engine.model)
+        return True
 
 #####################
 # test cases:
@@ -378,6 +956,19 @@ class TestDpll(unittest.TestCase):
     def test_to_z3_2(self):
         self.assertEqual(str(to_z3(test_prop_2)), "Not(And(Or(p1, Not(p2)), Or(p3, Not(p4))))")
 
+    def test_from_z3(self):
+        self.assertIs(from_z3(to_z3(test_prop_1)), test_prop_1)
+        self.assertIs(from_z3(to_z3(test_prop_2)), test_prop_2)
+        a, b, c = Bools("a b c")
+        self.assertEqual(str(from_z3(Or(a, b, Not(c)))), "((a \\/ b) \\/ ~c)")
+        self.assertEqual(str(from_z3(a == BoolVal(True))), "((a -> True) /\\ (True -> a))")
+        with self.assertRaises(ValueError):
+            from_z3(If(a, b, c))
+        chain = BoolVal(True)
+        for i in range(5000):
+            chain = And(chain, Bool(f"b_{i}"))
+        self.assertEqual(len(variables(from_z3(chain))), 5000)
+
     def test_ie_1(self):
         self.assertEqual(str(ie(test_prop_1)), "(~p \\/ (~q \\/ p))")
     
@@ -419,6 +1010,266 @@ class TestDpll(unittest.TestCase):
         s.add(Not(Not(And(Or(res["p1"], Not(res["p2"])), Or(res["p3"], Not(res["p4"]))))))
         self.assertEqual(str(s.check()), "unsat")
 
+    def test_dpll_unsat(self):
+        p, q = PVar("p"), PVar("q")
+        prop = PAnd(PAnd(POr(p, q), POr(p, PNot(q))), PAnd(POr(PNot(p), q), POr(PNot(p), PNot(q))))
+        self.assertEqual(dpll(prop), "unsat")
+
+    def test_cnf_size(self):
+        self.assertEqual(cnf_size(nnf(ie(test_prop_1))), 1)
+        self.assertEqual(cnf_size(nnf(ie(test_prop_2))), 4)
+
+    def test_shrink(self):
+        p, q, r = PVar("p"), PVar("q"), PVar("r")
+        self.assertIs(shrink(POr(p, PAnd(q, p)))[0], p)
+        self.assertIs(shrink(PAnd(POr(q, p), PAnd(p, PTrue())))[0], p)
+        self.assertIs(shrink(nnf(ie(test_prop_1)))[0], PTrue())
+        self.assertIs(shrink(PAnd(p, PAnd(q, PNot(p))))[0], PFalse())
+        self.assertIs(shrink(POr(PNot(PTrue()), PAnd(q, PAnd(r, q))))[0], PAnd(q, r))
+        prop, stats = shrink(PAnd(PAnd(POr(r, PFalse()), PAnd(p, r)), POr(PAnd(q, p), r)))
+        self.assertEqual(str(prop), "(r /\\ p)")
+        self.assertEqual((stats["constants"], stats["duplicates"], stats["absorbed"]), (1, 1, 1))
+        self.assertLess(stats["shrunk_nodes"], stats["nodes"])
+        # fewer clauses from the distributive CNF
+        prop = PAnd(POr(p, PAnd(q, PTrue())), POr(PAnd(p, r), POr(q, PAnd(p, PAnd(r, q)))))
+        self.assertEqual(cnf_size(nnf(prop)), 8)
+        self.assertEqual(cnf_size(shrink(nnf(prop))[0]), 3)
+        stats = {}
+        db = to_clause_db(POr(p, PAnd(q, PNot(q))), simplify_prop=True, stats=stats)
+        self.assertEqual((db.names, [list(c) for c in db]), ([None, "p", "q"], [[1]]))
+        self.assertEqual(stats["complements"], 1)
+        self.assertEqual(dpll(POr(p, PNot(p))).keys(), {"p"})
+        # the n-ary nodes keep the rewriting linear
+        n = 100000
+        chain = PTrue()
+        for i in range(n):
+            chain = PAnd(chain, PVar(f"b_{i % (n // 2)}"))
+        prop, stats = shrink(chain)
+        self.assertEqual(stats["duplicates"], n // 2)
+        self.assertEqual(len(operands(prop, PAnd)), n // 2)
+
+    def test_stats(self):
+        res, stats = dpll(test_prop_2, stats=True)
+        self.assertEqual(set(res), {"p1", "p2", "p3", "p4"})
+        self.assertEqual(set(stats["time"]),
+                         {"ie", "nnf", "shrink", "cnf", "flatten", "preprocess", "search"})
+        self.assertGreater(stats["peak_bytes"], 0)
+        self.assertEqual(stats["preprocess"]["tautologies"], 0)
+        # a pigeonhole formula: 6 pigeons, 5 holes
+        pigeons = [[PVar(f"p{i}_{j}") for j in range(5)] for i in range(6)]
+        prop = PTrue()
+        for row in pigeons:
+            clause = PFalse()
+            for atom in row:
+                clause = POr(clause, atom)
+            prop = PAnd(prop, clause)
+        for j in range(5):
+            for i in range(6):
+                for k in range(i):
+                    prop = PAnd(prop, PNot(PAnd(pigeons[i][j], pigeons[k][j])))
+        import cdcl
+        reports = []
+        saved, cdcl.PROGRESS_PERIOD = cdcl.PROGRESS_PERIOD, 5
+        try:
+            res, stats = dpll(prop, mode="tseitin", stats=True,
+                              progress=lambda counters: reports.append(counters["conflicts"]))
+        finally:
+            cdcl.PROGRESS_PERIOD = saved
+        self.assertEqual(res, "unsat")
+        self.assertGreater(stats["decisions"], 0)
+        self.assertEqual(sum(stats["learned_sizes"].values()), stats["learned"])
+        self.assertEqual(reports, list(range(5, stats["conflicts"] + 1, 5)))
+        # the leading True and the False of each clause
+        self.assertEqual(stats["constants"], 7)
+        self.assertEqual(dpll(test_prop_1).keys(), {"p", "q"})
+
+    def test_tseitin(self):
+        clauses, aux = tseitin(nnf(ie(test_prop_2)))
+        self.assertEqual(str(clauses), "[[~_t1, ~p1], [~_t1, p2], [~_t2, ~p3], [~_t2, p4], [_t1, _t2]]")
+        self.assertEqual(aux, {"_t1", "_t2"})
+        clauses, aux = tseitin(nnf(ie(test_prop_2)), polarity=False)
+        self.assertEqual(len(clauses), 7)
+
+    def test_dpll_tseitin(self):
+        # (x1 /\ y1) \/ ... \/ (xn /\ yn) has 2^n clauses in distributive CNF
+        prop = PAnd(PVar("x0"), PVar("y0"))
+        for i in range(1, 30):
+            prop = POr(prop, PAnd(PVar(f"x{i}"), PNot(PVar(f"y{i}"))))
+        prop = PAnd(prop, PAnd(PNot(PVar("x0")), PNot(PVar("x1"))))
+        self.assertGreater(cnf_size(nnf(ie(prop))), DISTRIBUTE_LIMIT)
+        res = dpll(prop)
+        self.assertEqual(len(res), 60)
+        s = Solver()
+        s.add(Not(to_z3(prop)))
+        s.add([Bool(var) == value for var, value in res.items()])
+        self.assertEqual(s.check(), unsat)
+        self.assertEqual(dpll(test_prop_2, mode="tseitin").keys(), {"p1", "p2", "p3", "p4"})
+
+    def test_deep(self):
+        # the proposition of monster.py, which is far deeper than the
+        # recursion limit
+        n = 100000
+        prop = PTrue()
+        for i in range(n):
+            prop = PAnd(prop, PVar(f"b_{i}"))
+        self.assertEqual(len(flatten(cnf(nnf(ie(prop))))), n + 1)
+        res = dpll(prop)
+        self.assertEqual(len(res), n)
+        self.assertTrue(all(res.values()))
+
+        n = 20000
+        prop = PVar("b")
+        for i in range(n):
+            prop = PImplies(PVar(f"b_{i}"), prop)
+        clauses, aux = tseitin(nnf(ie(prop)))
+        self.assertEqual(len(clauses), 1)
+        self.assertEqual(len(clauses[0]), n + 1)
+        self.assertEqual(cnf_size(nnf(ie(prop))), 1)
+
+    def test_hash_consing(self):
+        self.assertIs(PVar("p"), PVar("p"))
+        self.assertIs(PTrue(), PTrue())
+        self.assertIs(ie(test_prop_1), ie(PImplies(PVar('p'), PImplies(PVar('q'), PVar('p')))))
+        self.assertIsNot(PAnd(PVar("p"), PVar("q")), PAnd(PVar("q"), PVar("p")))
+        self.assertEqual(len({PNot(PVar("p")), PNot(PVar("p")), PNot(PVar("q"))}), 2)
+        self.assertFalse(hasattr(PVar("p"), "__dict__"))
+        with self.assertRaises(AttributeError):
+            PVar("p").var = "q"
+        with self.assertRaises(TypeError):
+            PAnd(PVar("p"), "q")
+        match test_prop_2:
+            case PNot(PAnd(POr(PVar(p1), _), _)):
+                self.assertEqual(p1, "p1")
+            case _:
+                self.fail()
+
+    def test_shared(self):
+        # a chain of n nodes sharing both operands describes a tree of
+        # 2^n leaves, which is converted in linear time
+        prop = PVar("p")
+        for i in range(200):
+            prop = POr(PAnd(prop, PVar(f"a{i}")), PAnd(prop, PNot(PVar(f"b{i}"))))
+        clauses, aux = tseitin(nnf(ie(prop)))
+        self.assertEqual(len(aux), 3 * 200 - 1)
+        res = dpll(PAnd(prop, PNot(PVar("a199"))))
+        self.assertEqual(len(res), 401)
+        self.assertFalse(res["a199"] or res["b199"])
+
+    def test_to_clause_db(self):
+        db = to_clause_db(test_prop_2)
+        self.assertEqual(db.names, [None, "p1", "p2", "p3", "p4"])
+        self.assertEqual([list(c) for c in db], [[-1, -3], [-1, 4], [2, -3], [2, 4]])
+        db = to_clause_db(test_prop_2, mode="tseitin")
+        self.assertEqual(str(db), "[['~#5', '~p1'], ['~#5', 'p2'], ['~#6', '~p3'], ['~#6', 'p4'], ['#5', '#6']]")
+        db = to_clause_db(POr(PVar("p"), PAnd(PTrue(), PFalse())))
+        self.assertEqual(str(db), "[['p']]")
+
+    def test_dpll_constants(self):
+        self.assertEqual(dpll(PAnd(PTrue(), PNot(PVar("p")))), {"p": False})
+        self.assertEqual(dpll(POr(PFalse(), PNot(PTrue()))), "unsat")
+
+    def test_local_search(self):
+        for search in ["walksat", "probsat"]:
+            res = dpll(test_prop_2, search=search)
+            solver = Solver()
+            solver.add(to_z3(test_prop_2))
+            solver.add([Bool(name) == value for name, value in res.items()])
+            self.assertEqual(solver.check(), sat)
+            self.assertEqual(dpll(PAnd(PVar("p"), PNot(PVar("p"))), simplify_cnf=False,
+                                  search=search, max_flips=100), "unsat")
+
+    def test_portfolio(self):
+        res = dpll(test_prop_2, search="portfolio")
+        solver = Solver()
+        solver.add(to_z3(test_prop_2))
+        solver.add([Bool(name) == value for name, value in res.items()])
+        self.assertEqual(solver.check(), sat)
+        self.assertEqual(dpll(PAnd(PVar("p"), PNot(PVar("p"))), simplify_cnf=False,
+                              search="portfolio"), "unsat")
+        # local searches without a flip find no answer, CDCL takes over
+        import portfolio
+        atoms = [PVar(f"a{i}") for i in range(12)]
+        prop = atoms[0]
+        for atom in atoms[1:]:
+            prop = PAnd(prop, atom)
+        configs = portfolio.PORTFOLIO
+        portfolio.PORTFOLIO = [{"search": "walksat", "max_flips": 0}]
+        try:
+            self.assertEqual(dpll(prop, simplify_cnf=False, search="portfolio"),
+                             {f"a{i}": True for i in range(12)})
+        finally:
+            portfolio.PORTFOLIO = configs
+
+    def test_cube(self):
+        res = dpll(test_prop_2, search="cube")
+        solver = Solver()
+        solver.add(to_z3(test_prop_2))
+        solver.add([Bool(name) == value for name, value in res.items()])
+        self.assertEqual(solver.check(), sat)
+        self.assertEqual(dpll(PAnd(PVar("p"), PNot(PVar("p"))), simplify_cnf=False,
+                              search="cube"), "unsat")
+
+    def test_preprocess(self):
+        db = to_clause_db(test_prop_1)
+        pre = Preprocessor(db, db.num_vars)
+        self.assertTrue(pre.run())
+        self.assertEqual(list(pre), [])
+        self.assertEqual(pre.stats["tautologies"], 1)
+        self.assertEqual(set(dpll(test_prop_1)), {"p", "q"})
+        # the eliminated variables get values satisfying the proposition
+        p, q, r, s = PVar("p"), PVar("q"), PVar("r"), PVar("s")
+        prop = PAnd(POr(p, q), PAnd(PImplies(q, r), PAnd(PNot(PAnd(p, r)), POr(s, PNot(r)))))
+        res = dpll(prop, decision="vsids", restart="luby")
+        self.assertEqual(len(res), 4)
+        solver = Solver()
+        solver.add(to_z3(prop))
+        solver.add([Bool(name) == value for name, value in res.items()])
+        self.assertEqual(solver.check(), sat)
+
+    def test_incremental(self):
+        p, q, r = PVar("p"), PVar("q"), PVar("r")
+        solver = DpllSolver()
+        solver.add(POr(p, PAnd(q, r)))
+        # enumerate the models over p, q, r by blocking clauses
+        models = []
+        while solver.solve():
+            models.append(solver.model)
+            solver.add_clause([PNot(PVar(v)) if b else PVar(v) for v, b in solver.model.items()])
+        self.assertEqual(len(models), 5)
+        self.assertFalse(solver.solve())
+
+        solver = DpllSolver()
+        solver.add(PImplies(p, q))
+        solver.add_clause([PNot(q), r])
+        self.assertFalse(solver.solve([p, PNot(r), PTrue()]))
+        self.assertEqual(solver.core, [p, PNot(r)])
+        self.assertFalse(solver.solve([PFalse()]))
+        self.assertTrue(solver.solve([p]))
+        self.assertEqual(solver.model, {"p": True, "q": True, "r": True})
+        solver.push()
+        solver.add(PNot(r))
+        self.assertFalse(solver.solve([p]))
+        self.assertEqual(solver.core, [p])
+        self.assertTrue(solver.solve())
+        solver.pop()
+        solver.add(PVar("s"))
+        self.assertTrue(solver.solve([p]))
+        self.assertEqual(solver.model, {"p": True, "q": True, "r": True, "s": True})
+
+    def test_push_after_simplified(self):
+        # x is numbered, but its clause never reaches the engine
+        x = PVar("x")
+        solver = DpllSolver()
+        solver.add(POr(x, PTrue()))
+        solver.push()
+        self.assertTrue(solver.solve([PNot(x)]))
+        self.assertEqual(solver.model, {"x": False})
+        solver.add(x)
+        self.assertFalse(solver.solve([PNot(x)]))
+        self.assertEqual(solver.core, [PNot(x)])
+        solver.pop()
+        self.assertTrue(solver.solve([PNot(x)]))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,469 @@
+"""DRAT proofs of unsatisfiability: logging and checking.
+
+A DRAT proof is the sequence of clauses a solver learned and deleted,
+ending with the empty clause:
+
+    -2 3 0
+    d 1 -2 -3 0
+    0
+
+Each added clause (lemma) must be RUP with respect to the clauses alive
+at that point: assigning the negation of its literals and running unit
+propagation yields a conflict. Failing that, it must be RAT on its first
+literal `p`: every resolvent with a clause containing `-p` is RUP. The
+binary format of drat-trim encodes the same steps more compactly, as
+`a`/`d` followed by the literals as variable-length integers and 0.
+
+`DratWriter` streams the proof of a `CDCL` run (set it as its `proof`),
+and `check_drat` verifies it backwards: starting from the empty clause,
+only the lemmas used by the RUP checks of later lemmas are checked, and
+unit propagation prefers the clauses already known to be used
+("core-first"), so that the checks keep to a small core.
+"""
+
+import io
+import os
+import tempfile
+import unittest
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
+
+from cdcl import CDCL, to_internal, pigeonhole
+from clause_db import ClauseDB
+from dimacs import open_cnf, read_dimacs, write_dimacs
+from dpll import PVar, PNot, PAnd, POr, PImplies, PFalse, dpll, nnf, shrink, to_clause_db
+
+# truth values of literals, as in the CDCL engine
+UNDEF = 0
+TRUE = 1
+FALSE = -1
+
+
+class DratWriter:
+    """Write the proof steps to a file (compressed by its suffix, as in
+    `open_cnf`) or a binary stream."""
+
+    def __init__(self, target: Union[str, os.PathLike, BinaryIO], binary: bool = False):
+        if isinstance(target, (str, os.PathLike)):
+            self.stream = open_cnf(target, "wb")
+            self.owned = True
+        else:
+            self.stream = target
+            self.owned = False
+        self.binary = binary
+        self.lemmas = 0
+        self.deletions = 0
+
+    def _encode(self, tag: bytes, lits: Iterable[int]) -> bytes:
+        if not self.binary:
+            text = " ".join(map(str, lits))
+            prefix = b"d " if tag == b"d" else b""
+            return prefix + (text + " 0\n" if text else "0\n").encode()
+        out = bytearray(tag)
+        for lit in lits:
+            u = 2 * lit if lit > 0 else -2 * lit + 1
+            while u > 127:
+                out.append(u & 127 | 128)
+                u >>= 7
+            out.append(u)
+        out.append(0)
+        return bytes(out)
+
+    def add(self, lits: Iterable[int]):
+        self.lemmas += 1
+        self.stream.write(self._encode(b"a", lits))
+
+    def delete(self, lits: Iterable[int]):
+        self.deletions += 1
+        self.stream.write(self._encode(b"d", lits))
+
+    def close(self):
+        if self.owned:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _is_binary(head: bytes) -> bool:
+    # text proofs only hold digits, signs, blanks, deletions and comments
+    return any(byte not in b"0123456789- \t\r\ndc" for byte in head[:64])
+
+
+def read_proof(stream: BinaryIO, binary: Optional[bool] = None) -> Iterator[Tuple[bool, List[int]]]:
+    """Yield the steps of a DRAT proof as (deletion, literals) pairs."""
+    data = stream.read()
+    if binary is None:
+        binary = _is_binary(data)
+    if not binary:
+        for line in data.splitlines():
+            words = line.split()
+            if not words or words[0] == b"c":
+                continue
+            deletion = words[0] == b"d"
+            if deletion:
+                words = words[1:]
+            lits = [int(word) for word in words]
+            if not lits or lits[-1] != 0:
+                raise ValueError(f"bad DRAT line: {line!r}")
+            yield deletion, lits[:-1]
+        return
+    pos = 0
+    while pos < len(data):
+        tag = data[pos]
+        pos += 1
+        if tag not in b"ad":
+            raise ValueError(f"bad binary DRAT step at byte {pos - 1}")
+        lits = []
+        while True:
+            u = shift = 0
+            while True:
+                byte = data[pos]
+                pos += 1
+                u |= (byte & 127) << shift
+                shift += 7
+                if byte < 128:
+                    break
+            if u == 0:
+                break
+            lits.append(-(u >> 1) if u & 1 else u >> 1)
+        yield tag == ord("d"), lits
+
+
+class DratChecker:
+    """Backward checker of a DRAT proof against a formula.
+
+    All the clauses, original or learned, are kept in `clauses` (as lists
+    of internal literals, see `cdcl.py`); `active` tells which of them
+    are alive at the current step of the check, and `core` which of them
+    were needed so far. The first `num_originals` clauses are the
+    formula's.
+    """
+
+    def __init__(self, formula: Iterable[Iterable[int]]):
+        self.clauses: List[List[int]] = []
+        self.active: List[bool] = []
+        self.core: List[bool] = []
+        # the proof steps as (clause, deletion) pairs
+        self.steps: List[Tuple[int, bool]] = []
+        # the alive clauses by their literal sets, to resolve deletions
+        self.by_key = {}
+        self.num_vars = 0
+        self.refuted = False
+        for clause in formula:
+            self._add(list(clause))
+        self.num_originals = len(self.clauses)
+
+    def _add(self, lits: List[int]) -> int:
+        cid = len(self.clauses)
+        if lits:
+            self.num_vars = max(self.num_vars, max(map(abs, lits)))
+        else:
+            self.refuted = True
+        self.clauses.append([to_internal(lit) for lit in dict.fromkeys(lits)])
+        self.active.append(True)
+        self.core.append(False)
+        self.by_key.setdefault(frozenset(lits), []).append(cid)
+        return cid
+
+    def check(self, proof: Iterable[Tuple[bool, List[int]]]) -> bool:
+        """Check the proof steps, see `read_proof`."""
+        if self.refuted:
+            # the formula holds the empty clause
+            return True
+        # forward: replay the steps up to the first empty clause
+        empty = None
+        for deletion, lits in proof:
+            if deletion:
+                cids = self.by_key.get(frozenset(lits))
+                # like drat-trim, ignore the deletions of unit clauses
+                # and of clauses which were never added
+                if cids and len(lits) > 1:
+                    cid = cids.pop()
+                    self.active[cid] = False
+                    self.steps.append((cid, True))
+                continue
+            cid = self._add(lits)
+            self.steps.append((cid, False))
+            if not lits:
+                empty = cid
+                break
+        if empty is None:
+            # the formula may still be refuted by unit propagation
+            empty = self._add([])
+            self.steps.append((empty, False))
+
+        # backward: undo the steps, checking the lemmas in the core
+        self.values = [UNDEF] * (2 * self.num_vars + 2)
+        self.reason: List[Optional[int]] = [None] * (self.num_vars + 1)
+        self.watches: List[List[int]] = [[] for _ in range(2 * self.num_vars + 2)]
+        self.units = set()
+        for cid in range(len(self.clauses)):
+            if self.active[cid]:
+                self._attach(cid)
+        self.core[empty] = True
+        for cid, deletion in reversed(self.steps):
+            if deletion:
+                self.active[cid] = True
+                self._attach(cid)
+                continue
+            self.active[cid] = False
+            self.units.discard(cid)
+            if self.core[cid] and not self._implied(cid):
+                return False
+        return True
+
+    def core_clauses(self) -> List[int]:
+        """The indices of the original clauses used by the proof."""
+        return [cid for cid in range(self.num_originals) if self.core[cid]]
+
+    def _attach(self, cid: int):
+        clause = self.clauses[cid]
+        if len(clause) == 1:
+            self.units.add(cid)
+        elif len(clause) > 1:
+            self.watches[clause[0]].append(cid)
+            self.watches[clause[1]].append(cid)
+
+    def _implied(self, cid: int) -> bool:
+        lits = self.clauses[cid]
+        if self._rup(lits):
+            return True
+        if not lits:
+            return False
+        # RAT on the first literal
+        pivot = lits[0] ^ 1
+        for other in range(len(self.clauses)):
+            if self.active[other] and pivot in self.clauses[other]:
+                resolvent = lits + [q for q in self.clauses[other] if q != pivot]
+                if not self._rup(resolvent):
+                    return False
+                self.core[other] = True
+        return True
+
+    def _rup(self, lits: List[int]) -> bool:
+        values = self.values
+        trail = []
+        conflict = None
+        for lit in lits:
+            if values[lit] == FALSE:
+                # a tautology
+                conflict = -1
+                break
+            if values[lit] == UNDEF:
+                self._assign(trail, lit ^ 1, None)
+        if conflict is None:
+            for cid in self.units:
+                lit = self.clauses[cid][0]
+                if values[lit] == FALSE:
+                    conflict = cid
+                    break
+                if values[lit] == UNDEF:
+                    self._assign(trail, lit, cid)
+        if conflict is None:
+            conflict = self._propagate(trail)
+        if conflict is not None and conflict >= 0:
+            self._mark(conflict)
+        for lit in trail:
+            values[lit] = values[lit ^ 1] = UNDEF
+            self.reason[lit >> 1] = None
+        return conflict is not None
+
+    def _assign(self, trail: List[int], lit: int, reason: Optional[int]):
+        self.values[lit] = TRUE
+        self.values[lit ^ 1] = FALSE
+        self.reason[lit >> 1] = reason
+        trail.append(lit)
+
+    def _propagate(self, trail: List[int]) -> Optional[int]:
+        """Unit propagation, core clauses first: the other clauses are
+        only used one implication at a time, when the core ones are
+        exhausted. Return a conflicting clause or None."""
+        values = self.values
+        watches = self.watches
+        clauses = self.clauses
+        active = self.active
+        core = self.core
+        heads = [0, 0]
+        while True:
+            # mode 1: the core clauses, mode 0: the others
+            mode = 1 if heads[1] < len(trail) else 0
+            if mode == 0 and heads[0] >= len(trail):
+                return None
+            false_lit = trail[heads[mode]] ^ 1
+            watchers = watches[false_lit]
+            i = j = 0
+            n = len(watchers)
+            implied = False
+            while i < n:
+                cid = watchers[i]
+                i += 1
+                if not active[cid]:
+                    # undone lemmas never come back
+                    continue
+                if core[cid] != mode or implied:
+                    watchers[j] = cid
+                    j += 1
+                    continue
+                clause = clauses[cid]
+                if clause[0] == false_lit:
+                    clause[0], clause[1] = clause[1], false_lit
+                first = clause[0]
+                if values[first] == TRUE:
+                    watchers[j] = cid
+                    j += 1
+                    continue
+                for k in range(2, len(clause)):
+                    lit = clause[k]
+                    if values[lit] != FALSE:
+                        clause[1] = lit
+                        clause[k] = false_lit
+                        watches[lit].append(cid)
+                        break
+                else:
+                    watchers[j] = cid
+                    j += 1
+                    if values[first] == FALSE:
+                        watchers[j:] = watchers[i:n]
+                        return cid
+                    self._assign(trail, first, cid)
+                    # back to the core clauses after a non-core implication
+                    implied = mode == 0
+            del watchers[j:]
+            if not implied:
+                heads[mode] += 1
+
+    def _mark(self, conflict: int):
+        """Add the clauses of the implication graph of a conflict to the
+        core."""
+        seen = set()
+        stack = [conflict]
+        while stack:
+            cid = stack.pop()
+            self.core[cid] = True
+            for lit in self.clauses[cid]:
+                var = lit >> 1
+                ref = self.reason[var]
+                if ref is not None and var not in seen:
+                    seen.add(var)
+                    stack.append(ref)
+
+
+def check_drat(formula: Union[str, os.PathLike, Iterable[Iterable[int]]],
+               proof: Union[str, os.PathLike, BinaryIO],
+               binary: Optional[bool] = None) -> bool:
+    """Check a DRAT refutation of a formula, given as a DIMACS file or as
+    clauses (e.g. a ClauseDB). The proof is a file or a binary stream,
+    the format is detected unless `binary` is given."""
+    if isinstance(formula, (str, os.PathLike)):
+        formula = read_dimacs(formula)
+    checker = DratChecker(formula)
+    if isinstance(proof, (str, os.PathLike)):
+        with open_cnf(proof) as stream:
+            return checker.check(read_proof(stream, binary))
+    return checker.check(read_proof(proof, binary))
+
+
+#####################
+# test cases:
+
+def refute(clauses: List[List[int]], binary: bool = False, max_learnts: int = 2000) -> bytes:
+    """Solve unsatisfiable clauses, return the proof."""
+    stream = io.BytesIO()
+    solver = CDCL()
+    solver.proof = DratWriter(stream, binary)
+    solver.max_learnts = max_learnts
+    for clause in clauses:
+        solver.add_clause(clause)
+    assert not solver.solve()
+    return stream.getvalue()
+
+
+class TestDrat(unittest.TestCase):
+    def test_writer(self):
+        stream = io.BytesIO()
+        writer = DratWriter(stream)
+        writer.add([1, -2])
+        writer.delete([3, 4, -5])
+        writer.add([])
+        self.assertEqual(stream.getvalue(), b"1 -2 0\nd 3 4 -5 0\n0\n")
+        stream = io.BytesIO()
+        writer = DratWriter(stream, binary=True)
+        writer.add([1, -63, 64])
+        writer.delete([-2])
+        self.assertEqual(stream.getvalue(), b"a\x02\x7f\x80\x01\x00d\x05\x00")
+        self.assertEqual(list(read_proof(io.BytesIO(stream.getvalue()))),
+                         [(False, [1, -63, 64]), (True, [-2])])
+
+    def test_pigeonhole(self):
+        for holes in range(2, 7):
+            clauses = pigeonhole(holes)
+            for binary in [False, True]:
+                proof = refute(clauses, binary, max_learnts=10)
+                checker = DratChecker(clauses + [[100, -101]])
+                self.assertTrue(checker.check(read_proof(io.BytesIO(proof))))
+                # the pigeonhole formulas are minimally unsatisfiable
+                self.assertEqual(checker.core_clauses(), list(range(len(clauses))))
+
+    def test_bad_proofs(self):
+        clauses = pigeonhole(4)
+        # no lemmas at all
+        self.assertFalse(check_drat(clauses, io.BytesIO(b"0\n")))
+        # a lemma which is not implied
+        self.assertFalse(check_drat(clauses, io.BytesIO(b"1 0\n2 0\n0\n")))
+        # a valid proof cut in half
+        lines = refute(clauses).splitlines(keepends=True)
+        self.assertFalse(check_drat(clauses, io.BytesIO(b"".join(lines[:len(lines) // 2]))))
+        # the empty clause is not required when propagation refutes the formula
+        self.assertTrue(check_drat([[1, 2], [-1], [-2]], io.BytesIO(b"")))
+        self.assertTrue(check_drat([[1], []], io.BytesIO(b"")))
+
+    def test_rat(self):
+        # neither RUP nor RAT on -1
+        self.assertFalse(check_drat([[1], [2]], io.BytesIO(b"-1 -2 0\n0\n")))
+        # a popped frame
+        stream = io.BytesIO()
+        solver = CDCL(2)
+        solver.proof = DratWriter(stream)
+        solver.add_clause([1, 2])
+        solver.push()
+        solver.add_clause([-1])
+        solver.pop()
+        solver.add_clause([-1])
+        solver.add_clause([-2])
+        self.assertFalse(solver.solve())
+        self.assertTrue(check_drat([[1, 2], [-1, -3], [-1], [-2]], io.BytesIO(stream.getvalue())))
+
+    def test_files(self):
+        prop = PAnd(POr(PVar("p"), PVar("q")),
+                    PAnd(PImplies(PVar("p"), PVar("r")),
+                         PAnd(PImplies(PVar("q"), PVar("r")), PNot(PVar("r")))))
+        with tempfile.TemporaryDirectory() as tmp:
+            cnf_path = os.path.join(tmp, "prop.cnf")
+            proof_path = os.path.join(tmp, "prop.drat.gz")
+            write_dimacs(to_clause_db(prop), cnf_path)
+            with DratWriter(proof_path) as writer:
+                self.assertEqual(dpll(prop, proof=writer), "unsat")
+            self.assertTrue(check_drat(cnf_path, proof_path))
+
+    def test_shrunk(self):
+        # `shrink` folds this to False, the proof still refutes the CNF
+        # written out for the prop
+        p, q = PVar("p"), PVar("q")
+        prop = POr(PAnd(p, PNot(p)), PAnd(q, PNot(q)))
+        self.assertIs(shrink(nnf(prop))[0], PFalse())
+        with tempfile.TemporaryDirectory() as tmp:
+            cnf_path = os.path.join(tmp, "prop.cnf")
+            proof_path = os.path.join(tmp, "prop.drat")
+            write_dimacs(to_clause_db(prop), cnf_path)
+            with DratWriter(proof_path) as writer:
+                self.assertEqual(dpll(prop, proof=writer), "unsat")
+            self.assertTrue(check_drat(cnf_path, proof_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,368 @@
+"""Decision heuristics and restart policies of the CDCL engine.
+
+Each policy is chosen by name when creating a `CDCL` solver:
+
+    decision: "static"  the lowest unassigned variable first;
+              "vsids"   Chaff's VSIDS, +1 for each variable of a conflict,
+                        all the activities halved every `HALVING_PERIOD`
+                        conflicts;
+              "evsids"  MiniSat's exponential VSIDS, the increment grows by
+                        1 / `DECAY` after each conflict instead;
+    phase:    "true", "false" or "save", which reuses the last value a
+              variable had before being unassigned;
+    restart:  "none";
+              "luby"    after `LUBY_UNIT` times the Luby sequence
+                        1, 1, 2, 1, 1, 2, 4, ... conflicts;
+              "glucose" when the average LBD (number of decision levels)
+                        of the last `GLUCOSE_WINDOW` learned clauses exceeds
+                        the overall average by the factor 1 / `GLUCOSE_K`.
+
+The activity based orders keep the variables in a binary max-heap, ties
+are broken by the variable index so that runs are reproducible. Given a
+random generator, they start from tiny random activities instead, and
+phase saving from random phases, to diversify otherwise equal runs.
+"""
+
+import random
+import unittest
+from collections import deque
+from typing import List, Optional
+
+DECAY = 0.95
+HALVING_PERIOD = 256
+LUBY_UNIT = 100
+GLUCOSE_WINDOW = 50
+GLUCOSE_K = 0.8
+
+
+class VarHeap:
+    """A binary max-heap of variables ordered by `activity`."""
+
+    def __init__(self, activity: List[float]):
+        self.activity = activity
+        self.heap: List[int] = []
+        # position of each variable in the heap, -1 when absent
+        self.index: List[int] = [-1]
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def __contains__(self, var: int) -> bool:
+        return var < len(self.index) and self.index[var] >= 0
+
+    def _before(self, a: int, b: int) -> bool:
+        activity = self.activity
+        return activity[a] > activity[b] or (activity[a] == activity[b] and a < b)
+
+    def _up(self, pos: int):
+        heap = self.heap
+        index = self.index
+        var = heap[pos]
+        while pos > 0:
+            parent = (pos - 1) >> 1
+            if not self._before(var, heap[parent]):
+                break
+            heap[pos] = heap[parent]
+            index[heap[pos]] = pos
+            pos = parent
+        heap[pos] = var
+        index[var] = pos
+
+    def _down(self, pos: int):
+        heap = self.heap
+        index = self.index
+        var = heap[pos]
+        n = len(heap)
+        while True:
+            child = 2 * pos + 1
+            if child >= n:
+                break
+            if child + 1 < n and self._before(heap[child + 1], heap[child]):
+                child += 1
+            if not self._before(heap[child], var):
+                break
+            heap[pos] = heap[child]
+            index[heap[pos]] = pos
+            pos = child
+        heap[pos] = var
+        index[var] = pos
+
+    def push(self, var: int):
+        if var >= len(self.index):
+            self.index.extend([-1] * (var + 1 - len(self.index)))
+        if self.index[var] >= 0:
+            return
+        self.heap.append(var)
+        self._up(len(self.heap) - 1)
+
+    def increased(self, var: int):
+        """Restore the order after the activity of `var` grew."""
+        if var in self:
+            self._up(self.index[var])
+
+    def pop(self) -> int:
+        heap = self.heap
+        top = heap[0]
+        last = heap.pop()
+        self.index[top] = -1
+        if heap:
+            heap[0] = last
+            self._down(0)
+        return top
+
+
+class StaticOrder:
+    """Decide the variables by increasing index."""
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        # the lowest variable which may still be unassigned
+        self.next_var = 1
+        self.num_vars = 0
+
+    def new_vars(self, num_vars: int):
+        self.num_vars = num_vars
+
+    def bump(self, variables: List[int]):
+        pass
+
+    def decay(self):
+        pass
+
+    def unassigned(self, variables: List[int]):
+        if variables:
+            self.next_var = min(self.next_var, min(variables))
+
+    def next(self, values: List[int]) -> Optional[int]:
+        var = self.next_var
+        while var <= self.num_vars and values[2 * var] != 0:
+            var += 1
+        self.next_var = var
+        return var if var <= self.num_vars else None
+
+
+class EVSIDS:
+    """Exponential VSIDS: bumps grow geometrically, so that recent
+    conflicts weigh more."""
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.activity: List[float] = [0.0]
+        self.heap = VarHeap(self.activity)
+        self.increment = 1.0
+        self.rng = rng
+
+    def new_vars(self, num_vars: int):
+        first = len(self.activity)
+        if self.rng is None:
+            self.activity.extend([0.0] * (num_vars + 1 - first))
+        else:
+            self.activity.extend([self.rng.random() * 1e-5 for _ in range(first, num_vars + 1)])
+        for var in range(first, num_vars + 1):
+            self.heap.push(var)
+
+    def bump(self, variables: List[int]):
+        activity = self.activity
+        for var in variables:
+            activity[var] += self.increment
+            self.heap.increased(var)
+        if self.increment > 1e100:
+            # rescale, the order is unchanged
+            for var in range(len(activity)):
+                activity[var] *= 1e-100
+            self.increment *= 1e-100
+
+    def decay(self):
+        self.increment /= DECAY
+
+    def unassigned(self, variables: List[int]):
+        push = self.heap.push
+        for var in variables:
+            push(var)
+
+    def next(self, values: List[int]) -> Optional[int]:
+        heap = self.heap
+        while heap:
+            var = heap.pop()
+            if values[2 * var] == 0:
+                return var
+        return None
+
+
+class VSIDS(EVSIDS):
+    """The original VSIDS: constant bumps and periodic halving."""
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        super().__init__(rng)
+        self.conflicts = 0
+
+    def decay(self):
+        self.conflicts += 1
+        if self.conflicts % HALVING_PERIOD == 0:
+            activity = self.activity
+            for var in range(len(activity)):
+                activity[var] *= 0.5
+
+
+class ConstantPhase:
+    def __init__(self, value: bool):
+        self.value = value
+
+    def new_vars(self, num_vars: int):
+        pass
+
+    def save(self, lits: List[int]):
+        pass
+
+    def polarity(self, var: int) -> bool:
+        return self.value
+
+
+class PhaseSaving:
+    """Branch on the value a variable had last, false at first."""
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.saved: List[bool] = [False]
+        self.rng = rng
+
+    def new_vars(self, num_vars: int):
+        first = len(self.saved)
+        if self.rng is None:
+            self.saved.extend([False] * (num_vars + 1 - first))
+        else:
+            self.saved.extend([self.rng.random() < 0.5 for _ in range(first, num_vars + 1)])
+
+    def save(self, lits: List[int]):
+        # internal literals: positive ones are even
+        saved = self.saved
+        for lit in lits:
+            saved[lit >> 1] = not lit & 1
+
+    def polarity(self, var: int) -> bool:
+        return self.saved[var]
+
+
+class NoRestarts:
+    def conflict(self, lbd: int) -> bool:
+        return False
+
+
+def luby(i: int) -> int:
+    """The i-th element (from 0) of the Luby sequence."""
+    size, seq = 1, 0
+    while size < i + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != i:
+        size = (size - 1) >> 1
+        seq -= 1
+        i %= size
+    return 1 << seq
+
+
+class LubyRestarts:
+    def __init__(self, unit: int = LUBY_UNIT):
+        self.unit = unit
+        self.restarts = 0
+        self.conflicts = 0
+
+    def conflict(self, lbd: int) -> bool:
+        self.conflicts += 1
+        if self.conflicts < self.unit * luby(self.restarts):
+            return False
+        self.restarts += 1
+        self.conflicts = 0
+        return True
+
+
+class GlucoseRestarts:
+    def __init__(self, window: int = GLUCOSE_WINDOW, k: float = GLUCOSE_K):
+        self.k = k
+        self.recent = deque(maxlen=window)
+        self.recent_sum = 0
+        self.total = 0
+        self.count = 0
+
+    def conflict(self, lbd: int) -> bool:
+        self.total += lbd
+        self.count += 1
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_sum -= self.recent[0]
+        self.recent.append(lbd)
+        self.recent_sum += lbd
+        if len(self.recent) < self.recent.maxlen:
+            return False
+        if self.recent_sum / len(self.recent) * self.k <= self.total / self.count:
+            return False
+        self.recent.clear()
+        self.recent_sum = 0
+        return True
+
+
+DECISIONS = {"static": StaticOrder, "vsids": VSIDS, "evsids": EVSIDS}
+PHASES = {"true": lambda rng=None: ConstantPhase(True),
+          "false": lambda rng=None: ConstantPhase(False),
+          "save": PhaseSaving}
+RESTARTS = {"none": NoRestarts, "luby": LubyRestarts, "glucose": GlucoseRestarts}
+
+
+def make(kind: str, registry: dict, name: str, *args):
+    """Create the policy called `name` from one of the registries."""
+    if name not in registry:
+        raise ValueError(f"unknown {kind} policy: {name}, expected one of {', '.join(registry)}")
+    return registry[name](*args)
+
+
+#####################
+# test cases:
+
+class TestHeuristics(unittest.TestCase):
+    def test_heap(self):
+        activity = [0.0, 3.0, 1.0, 4.0, 1.0, 5.0]
+        heap = VarHeap(activity)
+        for var in range(1, 6):
+            heap.push(var)
+        activity[2] = 4.5
+        heap.increased(2)
+        self.assertEqual([heap.pop() for _ in range(5)], [5, 2, 3, 1, 4])
+        self.assertNotIn(1, heap)
+
+    def test_luby(self):
+        self.assertEqual([luby(i) for i in range(15)], [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8])
+        restarts = LubyRestarts(unit=2)
+        self.assertEqual([restarts.conflict(1) for _ in range(8)],
+                         [False, True, False, True, False, False, False, True])
+
+    def test_glucose(self):
+        restarts = GlucoseRestarts(window=3, k=0.8)
+        # the window must fill up again after a restart
+        self.assertEqual([restarts.conflict(lbd) for lbd in [2, 2, 2, 2, 9, 9]],
+                         [False, False, False, False, True, False])
+        self.assertEqual(len(restarts.recent), 1)
+
+    def test_phase_saving(self):
+        phase = PhaseSaving()
+        phase.new_vars(3)
+        phase.save([2 * 1, 2 * 3 + 1])
+        self.assertEqual([phase.polarity(v) for v in (1, 2, 3)], [True, False, False])
+        phase = PhaseSaving(random.Random(1))
+        phase.new_vars(64)
+        self.assertEqual(len(set(phase.saved[1:])), 2)
+
+    def test_policies(self):
+        from cdcl import CDCL, pigeonhole
+        with self.assertRaises(ValueError):
+            CDCL(decision="random")
+        for decision in DECISIONS:
+            for phase in PHASES:
+                for restart in RESTARTS:
+                    solver = CDCL(decision=decision, phase=phase, restart=restart)
+                    for clause in pigeonhole(5):
+                        solver.add_clause(clause)
+                    self.assertFalse(solver.solve())
+                    solver = CDCL(decision=decision, phase=phase, restart=restart)
+                    for clause in pigeonhole(5)[1:]:
+                        solver.add_clause(clause)
+                    self.assertTrue(solver.solve())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,293 @@
+"""Stochastic local search for satisfiable CNF: WalkSAT and ProbSAT.
+
+Starting from a random assignment, both repeatedly pick a random
+falsified clause and flip one of its variables:
+  - WalkSAT (SKC) flips a variable breaking no clause if there is one,
+    else with probability `noise` a random one of the clause, else one
+    breaking the fewest clauses;
+  - ProbSAT flips a variable with probability proportional to
+    `(EPS + break) ** -noise`, so that a larger `noise` is greedier.
+
+The break count of a variable is the number of clauses it alone
+satisfies, and its make count the number of falsified clauses it
+appears in. Both are maintained incrementally on each flip, from the
+number of true literals of every clause and the XOR of their variables
+(which is the satisfying variable when there is only one).
+
+Local search cannot prove unsatisfiability: `solve` gives up after
+`max_flips` flips.
+"""
+
+import random
+import unittest
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional
+
+from cdcl import satisfies
+from clause_db import ClauseDB
+
+DEFAULT_NOISE = {"walksat": 0.567, "probsat": 2.3}
+EPS = 1.0
+# flips between two calls to `interrupt`
+INTERRUPT_PERIOD = 1024
+
+
+class LocalSearch:
+    def __init__(self, clauses: Iterable[Iterable[int]], num_vars: int = 0, seed: int = 0):
+        # the counters take each literal once: duplicate literals are
+        # merged and tautologies, always true, dropped
+        if isinstance(clauses, ClauseDB):
+            num_vars = max(num_vars, clauses.num_vars)
+        db = ClauseDB()
+        for clause in clauses:
+            clause = list(dict.fromkeys(clause))
+            if any(-lit in clause for lit in clause):
+                continue
+            if clause:
+                db.ensure_vars(max(map(abs, clause)))
+            db.add_clause(clause)
+        self.db = db
+        self.num_vars = max(num_vars, db.num_vars)
+        self.rng = random.Random(seed)
+        self.model: Dict[int, bool] = {}
+        self.flips = 0
+
+        # clauses of each literal, literal `l` at 2 * |l| + (l < 0)
+        occurs = [array('i') for _ in range(2 * self.num_vars + 2)]
+        lits = db.lits
+        offsets = db.offsets
+        for c in range(len(db)):
+            for k in range(offsets[c], offsets[c + 1]):
+                lit = lits[k]
+                occurs[2 * lit if lit > 0 else -2 * lit + 1].append(c)
+        self.occurs = occurs
+
+    def _reset(self, assignment: Optional[Dict[int, bool]]):
+        """Set up the counters for an initial assignment, random where not
+        given."""
+        rng = self.rng
+        n = self.num_vars
+        value = [False] * (n + 1)
+        for var in range(1, n + 1):
+            if assignment is not None and var in assignment:
+                value[var] = assignment[var]
+            else:
+                value[var] = rng.random() < 0.5
+        self.value = value
+        db = self.db
+        lits = db.lits
+        offsets = db.offsets
+        m = len(db)
+        self.true_count = array('i', [0]) * m
+        # XOR of the variables of the true literals
+        self.true_xor = array('i', [0]) * m
+        self.breaks = [0] * (n + 1)
+        self.makes = [0] * (n + 1)
+        # the falsified clauses, and the position of each in the list
+        self.unsat: List[int] = []
+        self.unsat_pos = array('i', [-1]) * m
+        for c in range(m):
+            count = 0
+            xor = 0
+            for k in range(offsets[c], offsets[c + 1]):
+                lit = lits[k]
+                if value[abs(lit)] == (lit > 0):
+                    count += 1
+                    xor ^= abs(lit)
+            self.true_count[c] = count
+            self.true_xor[c] = xor
+            if count == 1:
+                self.breaks[xor] += 1
+            elif count == 0:
+                self._falsified(c)
+
+    def _falsified(self, c: int):
+        self.unsat_pos[c] = len(self.unsat)
+        self.unsat.append(c)
+        makes = self.makes
+        lits = self.db.lits
+        for k in range(self.db.offsets[c], self.db.offsets[c + 1]):
+            makes[abs(lits[k])] += 1
+
+    def _satisfied(self, c: int):
+        unsat = self.unsat
+        pos = self.unsat_pos[c]
+        last = unsat.pop()
+        if last != c:
+            unsat[pos] = last
+            self.unsat_pos[last] = pos
+        self.unsat_pos[c] = -1
+        makes = self.makes
+        lits = self.db.lits
+        for k in range(self.db.offsets[c], self.db.offsets[c + 1]):
+            makes[abs(lits[k])] -= 1
+
+    def flip(self, var: int):
+        value = self.value
+        value[var] = not value[var]
+        true_lit = 2 * var if value[var] else 2 * var + 1
+        true_count = self.true_count
+        true_xor = self.true_xor
+        breaks = self.breaks
+        for c in self.occurs[true_lit]:
+            count = true_count[c] + 1
+            true_count[c] = count
+            if count == 1:
+                self._satisfied(c)
+                breaks[var] += 1
+            elif count == 2:
+                # the formerly critical variable is relieved
+                breaks[true_xor[c]] -= 1
+            true_xor[c] ^= var
+        for c in self.occurs[true_lit ^ 1]:
+            count = true_count[c] - 1
+            true_count[c] = count
+            true_xor[c] ^= var
+            if count == 0:
+                breaks[var] -= 1
+                self._falsified(c)
+            elif count == 1:
+                breaks[true_xor[c]] += 1
+        self.flips += 1
+
+    def _pick_walksat(self, variables: List[int], noise: float) -> int:
+        breaks = self.breaks
+        best = min(breaks[var] for var in variables)
+        if best > 0 and self.rng.random() < noise:
+            return self.rng.choice(variables)
+        candidates = [var for var in variables if breaks[var] == best]
+        if len(candidates) > 1:
+            # prefer the most clauses made
+            makes = self.makes
+            most = max(makes[var] for var in candidates)
+            candidates = [var for var in candidates if makes[var] == most]
+        return self.rng.choice(candidates)
+
+    def _pick_probsat(self, variables: List[int], noise: float) -> int:
+        breaks = self.breaks
+        weights = [(EPS + breaks[var]) ** -noise for var in variables]
+        return self.rng.choices(variables, weights)[0]
+
+    def solve(self, max_flips: int = 100000, algorithm: str = "walksat",
+              noise: Optional[float] = None,
+              assignment: Optional[Dict[int, bool]] = None,
+              interrupt: Optional[Callable[[], bool]] = None) -> bool:
+        """Search for a model within `max_flips` flips (or until
+        `interrupt` returns True), starting from `assignment` where given.
+        The model found is stored in `model`."""
+        if algorithm not in DEFAULT_NOISE:
+            raise ValueError(f"unknown local search algorithm: {algorithm}")
+        pick = self._pick_walksat if algorithm == "walksat" else self._pick_probsat
+        if noise is None:
+            noise = DEFAULT_NOISE[algorithm]
+        self.model = {}
+        self.flips = 0
+        db = self.db
+        if any(db.offsets[c] == db.offsets[c + 1] for c in range(len(db))):
+            # the empty clause
+            return False
+        self._reset(assignment)
+        lits = db.lits
+        offsets = db.offsets
+        unsat = self.unsat
+        rng = self.rng
+        while unsat:
+            if self.flips >= max_flips:
+                return False
+            if interrupt is not None and self.flips % INTERRUPT_PERIOD == 0 and interrupt():
+                return False
+            c = unsat[rng.randrange(len(unsat))]
+            variables = [abs(lits[k]) for k in range(offsets[c], offsets[c + 1])]
+            self.flip(pick(variables, noise))
+        self.model = {var: self.value[var] for var in range(1, self.num_vars + 1)}
+        return True
+
+
+def local_search(clauses: Iterable[Iterable[int]], num_vars: int = 0, algorithm: str = "walksat",
+                 max_flips: int = 100000, noise: Optional[float] = None,
+                 seed: int = 0) -> Optional[Dict[int, bool]]:
+    """Return a model of the clauses, or None if none was found."""
+    search = LocalSearch(clauses, num_vars, seed)
+    if search.solve(max_flips, algorithm, noise):
+        return search.model
+    return None
+
+
+#####################
+# test cases:
+
+def random_ksat(n: int, m: int, k: int, rng: random.Random) -> List[List[int]]:
+    return [[var if rng.random() < 0.5 else -var for var in rng.sample(range(1, n + 1), k)]
+            for _ in range(m)]
+
+
+class TestLocalSearch(unittest.TestCase):
+    def test_counters(self):
+        rng = random.Random(3)
+        clauses = random_ksat(30, 120, 3, rng)
+        search = LocalSearch(clauses)
+        search._reset(None)
+        for _ in range(300):
+            search.flip(rng.randint(1, 30))
+        # recount from scratch
+        value = search.value
+        breaks = [0] * 31
+        makes = [0] * 31
+        unsat = set()
+        for c, clause in enumerate(clauses):
+            true_vars = [abs(lit) for lit in clause if value[abs(lit)] == (lit > 0)]
+            if len(true_vars) == 1:
+                breaks[true_vars[0]] += 1
+            if not true_vars:
+                unsat.add(c)
+                for lit in clause:
+                    makes[abs(lit)] += 1
+        self.assertEqual(search.breaks, breaks)
+        self.assertEqual(search.makes, makes)
+        self.assertEqual(set(search.unsat), unsat)
+
+    def test_random(self):
+        rng = random.Random(4)
+        for algorithm in DEFAULT_NOISE:
+            for _ in range(5):
+                clauses = random_ksat(100, 380, 3, rng)
+                model = local_search(clauses, 100, algorithm, seed=rng.randint(0, 99))
+                self.assertIsNotNone(model)
+                self.assertTrue(satisfies(model, clauses))
+
+    def test_budget(self):
+        # unsatisfiable
+        clauses = [[1, 2], [-1, 2], [1, -2], [-1, -2]]
+        search = LocalSearch(clauses)
+        self.assertFalse(search.solve(max_flips=50))
+        self.assertEqual(search.flips, 50)
+        self.assertIsNone(local_search([[1], []]))
+        with self.assertRaises(ValueError):
+            search.solve(algorithm="gsat")
+
+    def test_duplicates(self):
+        # [1, 1, 2] is satisfied by 1 alone and [-2, 3, -2] by -2 alone,
+        # [-1, 1] is dropped
+        search = LocalSearch([[1, 1, 2], [-1, 1], [-2, 3, -2]])
+        search._reset({1: True, 2: False, 3: False})
+        self.assertEqual(len(search.db), 2)
+        self.assertEqual(search.breaks[1:], [1, 1, 0])
+        self.assertEqual(search.makes[1:], [0, 0, 0])
+        search.flip(1)
+        self.assertEqual(search.unsat, [0])
+        self.assertEqual(search.makes[1:], [1, 1, 0])
+        db = ClauseDB()
+        db.ensure_vars(2)
+        db.add_clause([1, 1, 2])
+        db.add_clause([-1, -1])
+        model = local_search(db)
+        self.assertEqual(model, {1: False, 2: True})
+
+    def test_assignment(self):
+        search = LocalSearch([[1, 2], [-1, 3]])
+        self.assertTrue(search.solve(assignment={1: True, 2: False, 3: True}))
+        self.assertEqual(search.flips, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,425 @@
+"""Weighted partial MaxSAT on the CDCL engine.
+
+A MaxSAT problem has hard clauses, which must hold, and soft clauses with
+positive weights. The cost of an assignment satisfying the hard clauses
+is the total weight of the soft clauses it falsifies; the task is to find
+one of least cost. Optimization problems like the 0-1 knapsack (soft
+unit clauses `x_i` of weight `v_i`, under the hard capacity constraint)
+or seat arrangements with preferences are solved this way on the same
+incremental solver as the decision problems.
+
+Each soft clause gets a selector literal, which the search assumes: the
+literal itself for a unit clause, a fresh variable `s` for the others,
+added as `~s \\/ clause`. Two strategies are built on top:
+
+OLL (core-guided, as in RC2): assuming all the selectors, every
+unsatisfiable call returns a core, a set of selectors not all true
+together. Its least weight `w` is added to the lower bound and taken off
+the weight of each of its selectors, and a totalizer counting the
+falsified selectors of the core is added: its output `o_k` is implied by
+at least `k` of them being false. As one of them must be false, only the
+second and further ones cost more, so `~o_2` becomes a new soft literal
+of weight `w`, and `~o_3` once `~o_2` shows up in a core, and so on. The
+first satisfiable call is an optimum.
+
+Stratification: the selectors are assumed by decreasing weight, the ones
+of at least the weight threshold first, so that the cores found early
+are the heavy ones. A satisfiable call under a threshold gives an upper
+bound, and lowers the threshold to the next weight down.
+
+Linear SAT-UNSAT search: solve, then require a cost below the one of the
+model found, by a pseudo-Boolean constraint over the selectors, and
+again until it is unsatisfiable. It is used when asked for, and as the
+fallback of OLL when its totalizers grow beyond `TOTALIZER_LIMIT`
+clauses, which happens with many large cores. It carries on with the
+lower bound and the clauses (all implied ones) of OLL.
+
+The pseudo-Boolean constraints `sum w_i l_i <= k` are encoded as their
+decision diagram: a variable per pair (first remaining literal, remaining
+capacity), with the pairs of equal constraints shared.
+"""
+
+import itertools
+import random
+import unittest
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from cdcl import CDCL
+from clause_db import ClauseDB
+from dpll import Prop, cnf, encode_literal, encode_prop, flatten, from_z3, nnf, ie
+
+Clause = Sequence[int]
+
+# the totalizer clauses beyond which OLL hands over to linear search
+TOTALIZER_LIMIT = 100000
+
+
+def at_most_weight(lits: Sequence[int], weights: Sequence[int], bound: int,
+                   new_var: Callable[[], int]) -> List[List[int]]:
+    """The clauses of `sum weights[i] * lits[i] <= bound`, with auxiliary
+    variables from `new_var`."""
+    # the weight left from each position on
+    suffix = list(itertools.accumulate(reversed(weights), initial=0))[::-1]
+    clauses = []
+    nodes: Dict[Tuple[int, int], object] = {}
+
+    def node(i: int, k: int):
+        """The literal of `sum of the literals from i on <= k`, or a bool."""
+        if k < 0:
+            return False
+        if suffix[i] <= k:
+            return True
+        key = (i, k)
+        if key not in nodes:
+            nodes[key] = new_var()
+            pending.append(key)
+        return nodes[key]
+
+    pending = []
+    root = node(0, bound)
+    if root is False:
+        return [[]]
+    if root is True:
+        return []
+    clauses.append([root])
+    while pending:
+        i, k = pending.pop()
+        y = nodes[(i, k)]
+        # y -> (lit -> taken) and y -> skipped
+        for child, premise in ((node(i + 1, k - weights[i]), [-lits[i]]), (node(i + 1, k), [])):
+            if child is not True:
+                clauses.append([-y] + premise + ([] if child is False else [child]))
+    return clauses
+
+
+class MaxSAT:
+    """A weighted partial MaxSAT problem over DIMACS clauses.
+
+    The clauses are collected by `add_hard`, `add_soft` and `add_at_most`,
+    and sent to the engine by `solve`, which returns the least cost (None
+    if the hard clauses are unsatisfiable) and leaves an optimal
+    assignment in `model`. `method` is "oll" or "linear", see above.
+    """
+
+    def __init__(self, num_vars: int = 0, method: str = "oll", stratify: bool = True):
+        if method not in ("oll", "linear"):
+            raise ValueError(f"unknown method {method}")
+        self.num_vars = num_vars
+        self.method = method
+        self.stratify = stratify
+        self.hard: List[List[int]] = []
+        self.soft: List[Tuple[List[int], int]] = []
+        self.pb: List[Tuple[List[int], List[int], int]] = []
+        self.model: Dict[int, bool] = {}
+        self.cost: Optional[int] = None
+        self.solver_calls = 0
+        self.cores = 0
+
+    def _note(self, clause: Iterable[int]) -> List[int]:
+        clause = list(clause)
+        self.num_vars = max([self.num_vars] + [abs(lit) for lit in clause])
+        return clause
+
+    def add_hard(self, clause: Iterable[int]):
+        self.hard.append(self._note(clause))
+
+    def add_soft(self, clause: Iterable[int], weight: int = 1):
+        if weight <= 0:
+            raise ValueError("soft clauses need a positive weight")
+        self.soft.append((self._note(clause), weight))
+
+    def add_at_most(self, lits: Iterable[int], weights: Iterable[int], bound: int):
+        """The hard constraint `sum weights[i] * lits[i] <= bound`."""
+        self.pb.append((self._note(lits), list(weights), bound))
+
+    def _cost(self, model: Dict[int, bool]) -> int:
+        return sum(weight for clause, weight in self.soft
+                   if not any(model[abs(lit)] == (lit > 0) for lit in clause))
+
+    def _solve(self, assumptions: Iterable[int] = ()) -> bool:
+        self.solver_calls += 1
+        return self.engine.solve(assumptions)
+
+    def _improve(self):
+        """Keep the model of the last call if it is the best so far."""
+        cost = self._cost(self.engine.model)
+        if self.cost is None or cost < self.cost:
+            self.cost = cost
+            self.model = {var: self.engine.model[var] for var in range(1, self.num_vars + 1)}
+
+    def solve(self) -> Optional[int]:
+        self.engine = engine = CDCL(self.num_vars)
+        for clause in self.hard:
+            engine.add_clause(clause)
+        for lits, weights, bound in self.pb:
+            for clause in at_most_weight(lits, weights, bound, engine.new_var):
+                engine.add_clause(clause)
+        # the weight of each selector
+        self.selectors: Dict[int, int] = {}
+        for clause, weight in self.soft:
+            if len(clause) == 1:
+                selector = clause[0]
+            else:
+                selector = engine.new_var()
+                engine.add_clause(clause + [-selector])
+            self.selectors[selector] = self.selectors.get(selector, 0) + weight
+        self.cost = None
+        self.model = {}
+        if not self._solve():
+            return None
+        self._improve()
+        lower = 0 if self.method == "linear" else self._oll()
+        if self.cost > lower:
+            self._linear(lower)
+        return self.cost
+
+    def _oll(self) -> int:
+        """Core-guided search, return the lower bound it proves: the cost
+        when it completes, less when it gives up."""
+        engine = self.engine
+        weights = dict(self.selectors)
+        # the totalizer outputs after each of their soft literals
+        following: Dict[int, Tuple[List[int], int]] = {}
+        lower = 0
+        size = 0
+        levels = sorted(set(weights.values()), reverse=True)
+        threshold = levels[0] if self.stratify and levels else 1
+        while self.cost > lower:
+            assumptions = [lit for lit, weight in weights.items() if weight >= threshold]
+            if self._solve(assumptions):
+                self._improve()
+                lower_weights = [weight for weight in weights.values() if weight < threshold]
+                if not lower_weights:
+                    break
+                threshold = max(lower_weights)
+                continue
+            core = engine.core
+            self.cores += 1
+            w = min(weights[lit] for lit in core)
+            lower += w
+            for lit in core:
+                weights[lit] -= w
+                if not weights[lit]:
+                    del weights[lit]
+            if len(core) == 1:
+                engine.add_clause([-core[0]])
+            else:
+                outputs, clauses = self._totalizer([-lit for lit in core])
+                size += clauses
+                self._relax(weights, following, outputs, 2, w)
+            # the bounds whose soft literal was in the core are raised
+            for lit in core:
+                if lit in following:
+                    outputs, k = following.pop(lit)
+                    self._relax(weights, following, outputs, k + 1, w)
+            if size > TOTALIZER_LIMIT:
+                break
+        return lower
+
+    def _relax(self, weights, following, outputs: List[int], k: int, weight: int):
+        """Make `~o_k` a soft literal."""
+        if k <= len(outputs):
+            lit = -outputs[k - 1]
+            weights[lit] = weights.get(lit, 0) + weight
+            following[lit] = (outputs, k)
+
+    def _totalizer(self, lits: List[int]) -> Tuple[List[int], int]:
+        """Outputs `o_1 ... o_n` with `o_k` implied by at least `k` of the
+        literals, and the number of clauses that took."""
+        engine = self.engine
+        count = 0
+        layer = [[lit] for lit in lits]
+        while len(layer) > 1:
+            merged = []
+            for a, b in zip(layer[::2], layer[1::2]):
+                out = [engine.new_var() for _ in range(len(a) + len(b))]
+                for i in range(len(a) + 1):
+                    for j in range(len(b) + 1):
+                        if i + j:
+                            engine.add_clause([-a[i - 1]] * (i > 0) + [-b[j - 1]] * (j > 0)
+                                              + [out[i + j - 1]])
+                            count += 1
+                merged.append(out)
+            if len(layer) % 2:
+                merged.append(layer[-1])
+            layer = merged
+        return layer[0], count
+
+    def _linear(self, lower: int):
+        """Tighten the cost below the best one until unsatisfiable."""
+        selectors = list(self.selectors)
+        weights = [self.selectors[lit] for lit in selectors]
+        falsified = [-lit for lit in selectors]
+        while self.cost > lower:
+            for clause in at_most_weight(falsified, weights, self.cost - 1, self.engine.new_var):
+                self.engine.add_clause(clause)
+            if not self._solve():
+                break
+            self._improve()
+
+
+def maxsat(hard: Iterable[Clause], soft: Iterable[Tuple[Clause, int]], num_vars: int = 0,
+           method: str = "oll") -> Optional[Tuple[int, Dict[int, bool]]]:
+    """The least cost of the DIMACS clauses, with an optimal model, None
+    if the hard clauses are unsatisfiable."""
+    problem = MaxSAT(num_vars, method)
+    for clause in hard:
+        problem.add_hard(clause)
+    for clause, weight in soft:
+        problem.add_soft(clause, weight)
+    if problem.solve() is None:
+        return None
+    return problem.cost, problem.model
+
+
+def maxsat_props(hard: Iterable, soft: Iterable[Tuple[object, int]],
+                 method: str = "oll") -> Optional[Tuple[int, Dict[str, bool]]]:
+    """`maxsat` on propositions: the hard constraints are `Prop`s or
+    propositional Z3 formulas, each soft one is a clause as given by
+    `flatten` (a list of literals), or a whole `Prop` or Z3 formula. The
+    model is given by variable names."""
+    db = ClauseDB()
+    problem = MaxSAT(method=method)
+
+    def encode(constraint) -> List[List[int]]:
+        prop = constraint if isinstance(constraint, Prop) else from_z3(constraint)
+        start = len(db)
+        encode_prop(prop, db)
+        return [list(db.clause(i)) for i in range(start, len(db))]
+
+    for constraint in hard:
+        for clause in encode(constraint):
+            problem.add_hard(clause)
+    relaxed = []
+    for constraint, weight in soft:
+        if isinstance(constraint, list):
+            clause = [encode_literal(db, atom) for atom in constraint]
+            if not any(lit is True for lit in clause):
+                problem.add_soft([lit for lit in clause if lit is not False], weight)
+        else:
+            relaxed.append((encode(constraint), weight))
+    for clauses, weight in relaxed:
+        selector = db.new_var()
+        for clause in clauses:
+            problem.add_hard(clause + [-selector])
+        problem.add_soft([selector], weight)
+    problem.num_vars = max(problem.num_vars, db.num_vars)
+    if problem.solve() is None:
+        return None
+    return problem.cost, db.named_model(problem.model)
+
+
+#####################
+# test cases:
+
+def brute_force(hard: List[Clause], soft: List[Tuple[Clause, int]], num_vars: int) -> Optional[int]:
+    best = None
+    for bits in itertools.product([False, True], repeat=num_vars):
+        def holds(clause):
+            return any(bits[abs(lit) - 1] == (lit > 0) for lit in clause)
+
+        if all(holds(clause) for clause in hard):
+            cost = sum(weight for clause, weight in soft if not holds(clause))
+            best = cost if best is None else min(best, cost)
+    return best
+
+
+def knapsack(weights: List[int], values: List[int], cap: int, method: str = "oll") -> int:
+    """The best value of a 0-1 knapsack, item `i` being the variable
+    `i + 1`."""
+    problem = MaxSAT(len(weights), method)
+    problem.add_at_most(range(1, len(weights) + 1), weights, cap)
+    for i, value in enumerate(values):
+        problem.add_soft([i + 1], value)
+    return sum(values) - problem.solve()
+
+
+class TestMaxSAT(unittest.TestCase):
+    def test_small(self):
+        cost, model = maxsat([[1, 2]], [([-1], 3), ([-2], 2), ([1, -2], 2)])
+        self.assertEqual(cost, 3)
+        self.assertEqual((model[1], model[2]), (True, False))
+        self.assertIsNone(maxsat([[1], [-1]], [([2], 1)]))
+        self.assertEqual(maxsat([], [([1], 1), ([-1], 1), ([-1], 2)])[0], 1)
+        self.assertEqual(maxsat([[1]], [], method="linear")[0], 0)
+
+    def test_at_most_weight(self):
+        for bound in range(-1, 9):
+            problem = MaxSAT(4)
+            problem.add_at_most([1, 2, 3, 4], [1, 2, 3, 2], bound)
+            for var in range(1, 5):
+                problem.add_soft([var], 1)
+            cost = problem.solve()
+            if bound < 0:
+                self.assertIsNone(cost)
+            else:
+                chosen = [var for var in range(1, 5) if problem.model[var]]
+                self.assertLessEqual(sum([1, 2, 3, 2][var - 1] for var in chosen), bound)
+
+    def test_random(self):
+        rng = random.Random(10)
+        for method, stratify in (("oll", True), ("oll", False), ("linear", True)):
+            for _ in range(40):
+                n = rng.randint(2, 8)
+
+                def clause():
+                    return [var if rng.random() < 0.5 else -var
+                            for var in rng.sample(range(1, n + 1), rng.randint(1, min(3, n)))]
+
+                hard = [clause() for _ in range(rng.randint(0, n))]
+                soft = [(clause(), rng.randint(1, 5)) for _ in range(rng.randint(1, 3 * n))]
+                problem = MaxSAT(n, method, stratify)
+                for c in hard:
+                    problem.add_hard(c)
+                for c, weight in soft:
+                    problem.add_soft(c, weight)
+                cost = problem.solve()
+                self.assertEqual(cost, brute_force(hard, soft, n))
+                if cost is not None:
+                    self.assertEqual(problem._cost(problem.model), cost)
+                    self.assertTrue(all(any(problem.model[abs(lit)] == (lit > 0) for lit in c)
+                                        for c in hard))
+
+    def test_knapsack(self):
+        # the instances of `lab5-code/knapsack.py`
+        self.assertEqual(knapsack([4, 6, 2, 2, 5, 1], [8, 10, 6, 3, 7, 2], 12), 24)
+        weights = [23, 26, 20, 18, 32, 27, 29, 26, 30, 27]
+        values = [505, 352, 458, 220, 354, 414, 498, 545, 473, 543]
+        self.assertEqual(knapsack(weights, values, 67), 1270)
+        self.assertEqual(knapsack(weights, values, 67, "linear"), 1270)
+
+    def test_fallback(self):
+        global TOTALIZER_LIMIT
+        saved, TOTALIZER_LIMIT = TOTALIZER_LIMIT, 0
+        try:
+            # all of at most one of 8 variables: 7 falsified at best
+            hard = [[-a, -b] for a, b in itertools.combinations(range(1, 9), 2)]
+            problem = MaxSAT(8)
+            for clause in hard:
+                problem.add_hard(clause)
+            for var in range(1, 9):
+                problem.add_soft([var], 1)
+            self.assertEqual(problem.solve(), 7)
+        finally:
+            TOTALIZER_LIMIT = saved
+
+    def test_props(self):
+        from z3 import Bools, Not, Or
+        from dpll import PVar, PNot
+        from seat_arrange import seat_constraints
+        props, constraints = seat_constraints()
+        a1, a2, a3, b1, b2, b3, c1, c2, c3 = props
+        # Alice would like the middle seat, and Carol the first one: only
+        # Carol's wish can be granted
+        cost, model = maxsat_props(constraints, [(a2, 2), (c1, 1)])
+        self.assertEqual(cost, 2)
+        self.assertTrue(model["c1"] and model["b2"] and model["a3"])
+        # soft clauses as given by `flatten`
+        p, q = PVar("p"), PVar("q")
+        clauses = flatten(cnf(nnf(ie(from_z3(Or(Not(Bools("p")[0]), Bools("q")[0]))))))
+        soft = [(clause, 1) for clause in clauses] + [([p], 2), ([PNot(q)], 1)]
+        self.assertEqual(maxsat_props([], soft)[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,295 @@
+"""Exact model counting (#SAT) without enumerating the models.
+
+The counter is a DPLL search which adds up the counts of both branches
+instead of stopping at the first model, with three shortcuts:
+  - unit propagation: the literals implied at a node are fixed, as the
+    other value of their variable has no model;
+  - component decomposition: clauses which share no variable, directly
+    or through other clauses, are independent, so the count of a node is
+    the product of the counts of its connected components (and of two
+    for every unconstrained variable);
+  - component caching: the same component shows up under many partial
+    assignments, so the counts are cached by the component itself, its
+    clauses as sorted tuples of sorted literals, which is canonical. The
+    cache keeps the `CACHE_SIZE` most recently used components.
+
+A component is split on its most frequent variable. The counts are
+Python integers, hence exact whatever their size.
+"""
+
+import itertools
+import random
+import unittest
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from cdcl import pigeonhole
+from clause_db import ClauseDB
+from dpll import (DISTRIBUTE_LIMIT, PNot, Prop, cnf_size, encode_prop, encode_tseitin, from_z3,
+                  ie, nnf, test_prop_2)
+
+# components whose counts are kept
+CACHE_SIZE = 1 << 16
+
+Clause = Tuple[int, ...]
+
+# the kinds of frames of the search, see `ModelCounter._count`
+_NODE, _PRODUCT, _COMPONENT, _SPLIT = range(4)
+
+
+def _condition(clauses: Iterable[Clause], lits: Set[int]) -> Optional[List[Clause]]:
+    """The clauses under the literals `lits`, None if one is falsified."""
+    result = []
+    for clause in clauses:
+        reduced = []
+        satisfied = False
+        for lit in clause:
+            if lit in lits:
+                satisfied = True
+                break
+            if -lit not in lits:
+                reduced.append(lit)
+        if satisfied:
+            continue
+        if not reduced:
+            return None
+        result.append(tuple(reduced))
+    return result
+
+
+def _propagate(clauses: List[Clause]) -> Tuple[Optional[List[Clause]], Set[int]]:
+    """Fix the unit clauses until none is left, return the remaining
+    clauses (None on a conflict) and the literals fixed."""
+    fixed = set()
+    while clauses is not None:
+        units = {clause[0] for clause in clauses if len(clause) == 1}
+        if not units:
+            break
+        if any(-lit in units for lit in units):
+            return None, fixed
+        fixed |= units
+        clauses = _condition(clauses, units)
+    return clauses, fixed
+
+
+def _components(clauses: List[Clause]) -> List[List[Clause]]:
+    """The clauses grouped by connected component, through a union-find
+    over their variables."""
+    parent = {}
+
+    def find(var: int) -> int:
+        root = var
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        while parent[var] != root:
+            parent[var], var = root, parent[var]
+        return root
+
+    for clause in clauses:
+        first = find(abs(clause[0]))
+        for lit in clause[1:]:
+            other = find(abs(lit))
+            if other != first:
+                parent[other] = first
+    groups: Dict[int, List[Clause]] = {}
+    for clause in clauses:
+        groups.setdefault(find(abs(clause[0])), []).append(clause)
+    return list(groups.values())
+
+
+class ModelCounter:
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        self.cache: "OrderedDict[tuple, int]" = OrderedDict()
+        self.cache_size = cache_size
+        self.decisions = 0
+        self.hits = 0
+
+    def count(self, clauses: Iterable[Iterable[int]], num_vars: int = 0) -> int:
+        """The number of assignments of the variables 1 to `num_vars`
+        (at least those of the clauses) which satisfy the DIMACS clauses,
+        e.g. a ClauseDB."""
+        normalized = []
+        variables = set(range(1, num_vars + 1))
+        for clause in clauses:
+            lits = set(clause)
+            if not lits:
+                return 0
+            variables |= {abs(lit) for lit in lits}
+            if any(-lit in lits for lit in lits):
+                continue
+            normalized.append(tuple(sorted(lits)))
+        return self._count(normalized, len(variables))
+
+    def _count(self, clauses: Optional[List[Clause]], num_vars: int) -> int:
+        """Count the models of clauses over `num_vars` variables, which
+        include the variables of the clauses.
+
+        The search runs without recursion, on a stack of frames waiting
+        for the counts of their children on `results`:
+          - a node `(_NODE, clauses, num_vars)` propagates and splits its
+            clauses into components;
+          - `(_PRODUCT, components, i, total, free)` multiplies the counts
+            of the components of a node, one at a time so as to stop at
+            the first zero;
+          - `(_COMPONENT, clauses)` looks up the cache, else decides on a
+            variable and leaves `(_SPLIT, key)` to add up both branches.
+        """
+        results: List[int] = []
+        stack = [(_NODE, clauses, num_vars)]
+        push = stack.append
+        while stack:
+            frame = stack.pop()
+            kind = frame[0]
+            if kind is _NODE:
+                _, clauses, num_vars = frame
+                if clauses is not None:
+                    clauses, fixed = _propagate(clauses)
+                if clauses is None:
+                    results.append(0)
+                    continue
+                components = _components(clauses)
+                free = num_vars - len(fixed) - sum(
+                    len({abs(lit) for clause in component for lit in clause})
+                    for component in components)
+                push((_PRODUCT, components, 0, 1, free))
+            elif kind is _PRODUCT:
+                _, components, i, total, free = frame
+                if i:
+                    total *= results.pop()
+                if total == 0:
+                    results.append(0)
+                elif i == len(components):
+                    results.append(total << free)
+                else:
+                    push((_PRODUCT, components, i + 1, total, free))
+                    push((_COMPONENT, components[i]))
+            elif kind is _COMPONENT:
+                key = tuple(sorted(set(frame[1])))
+                count = self.cache.get(key)
+                if count is not None:
+                    self.cache.move_to_end(key)
+                    self.hits += 1
+                    results.append(count)
+                    continue
+                occurrences: Dict[int, int] = {}
+                for clause in key:
+                    for lit in clause:
+                        occurrences[abs(lit)] = occurrences.get(abs(lit), 0) + 1
+                var = max(occurrences, key=lambda v: (occurrences[v], -v))
+                self.decisions += 1
+                rest = len(occurrences) - 1
+                push((_SPLIT, key))
+                # the positive branch first, as it is popped first
+                push((_NODE, _condition(key, {-var}), rest))
+                push((_NODE, _condition(key, {var}), rest))
+            else:
+                key = frame[1]
+                count = results.pop() + results.pop()
+                cache = self.cache
+                cache[key] = count
+                if len(cache) > self.cache_size:
+                    cache.popitem(last=False)
+                results.append(count)
+        return results[0]
+
+
+def count_models(clauses: Iterable[Iterable[int]], num_vars: int = 0) -> int:
+    """The number of models of DIMACS clauses over the variables 1 to
+    `num_vars`, see `ModelCounter.count`."""
+    return ModelCounter().count(clauses, num_vars)
+
+
+def counting_db(prop, names: Iterable[str] = ()) -> ClauseDB:
+    """A CNF of a `Prop` (or a propositional Z3 formula) with as many
+    models, over its variables and the extra `names`.
+
+    The CNF is the distributive one, as from `flatten`, unless it would
+    exceed `DISTRIBUTE_LIMIT` clauses. The full definitional encoding is
+    used then, whose auxiliary (anonymous) variables are determined by
+    the others.
+    """
+    if not isinstance(prop, Prop):
+        prop = from_z3(prop)
+    db = ClauseDB()
+    nnf_prop = nnf(ie(prop))
+    if cnf_size(nnf_prop) <= DISTRIBUTE_LIMIT:
+        encode_prop(prop, db, "distribute")
+    else:
+        encode_tseitin(nnf_prop, db, polarity=False)
+    for name in names:
+        db.var(name)
+    return db
+
+
+def count_prop(prop, names: Iterable[str] = ()) -> int:
+    """The number of models of a `Prop` (or a propositional Z3 formula)
+    over its variables and the extra `names`, see `counting_db`."""
+    db = counting_db(prop, names)
+    return count_models(db, db.num_vars)
+
+
+#####################
+# test cases:
+
+def brute_force(clauses: List[List[int]], num_vars: int) -> int:
+    return sum(all(any(values[abs(lit) - 1] == (lit > 0) for lit in clause)
+                   for clause in clauses)
+               for values in itertools.product([False, True], repeat=num_vars))
+
+
+class TestModelCount(unittest.TestCase):
+    def test_random(self):
+        rng = random.Random(7)
+        for _ in range(100):
+            n = rng.randint(1, 10)
+            clauses = [[var if rng.random() < 0.5 else -var
+                        for var in rng.sample(range(1, n + 1), rng.randint(1, min(3, n)))]
+                       for _ in range(rng.randint(0, 3 * n))]
+            self.assertEqual(count_models(clauses, n), brute_force(clauses, n))
+        self.assertEqual(count_models([[1, -1]], 2), 4)
+        self.assertEqual(count_models([[1], []]), 0)
+        self.assertEqual(count_models(pigeonhole(4)), 0)
+
+    def test_components(self):
+        # 100 independent clauses, 3 ** 100 models
+        clauses = [[2 * i + 1, 2 * i + 2] for i in range(100)]
+        counter = ModelCounter()
+        self.assertEqual(counter.count(clauses, 201), 2 * 3 ** 100)
+        self.assertLessEqual(counter.decisions, 100)
+        # the same chain under both values of its head reaches the same tail
+        counter = ModelCounter()
+        chain = [[i, -(i + 1), i + 2] for i in range(1, 13)]
+        expected = brute_force(chain, 14)
+        self.assertEqual(counter.count(chain), expected)
+        self.assertGreater(counter.hits, 0)
+        small = ModelCounter(cache_size=2)
+        self.assertEqual(small.count(chain), expected)
+        self.assertLessEqual(len(small.cache), 2)
+
+    def test_deep(self):
+        # a path x1 \/ x2, x2 \/ x3, ...: the decisions nest about n / 2
+        # deep, and its models, without two false neighbours, are counted
+        # by the Fibonacci numbers
+        n = 1000
+        previous, models = 1, 2
+        for _ in range(n - 1):
+            previous, models = models, previous + models
+        self.assertEqual(count_models([[i, i + 1] for i in range(1, n)]), models)
+
+    def test_prop(self):
+        from bdd import interleaved
+        self.assertEqual(count_prop(test_prop_2), 7)
+        self.assertEqual(count_prop(test_prop_2, ["extra"]), 14)
+        # (x0 /\ y0) \/ ... \/ (x11 /\ y11), with 2 ** 12 distributed clauses
+        prop = interleaved(12)
+        self.assertGreater(cnf_size(nnf(ie(prop))), DISTRIBUTE_LIMIT)
+        self.assertEqual(count_prop(prop), 4 ** 12 - 3 ** 12)
+        self.assertEqual(count_prop(PNot(prop)), 3 ** 12)
+
+    def test_circuit(self):
+        from circuit import circuit_layout
+        self.assertEqual(circuit_layout(), (3, 13))
+
+
+if __name__ == '__main__':
+    unittest.main()
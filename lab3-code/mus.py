@@ -0,0 +1,250 @@
+"""Minimal unsatisfiable subsets (MUS) of clause groups.
+
+Given unsatisfiable constraints, a MUS is a subset of them which is still
+unsatisfiable, but becomes satisfiable without any one of its members:
+an explanation of the infeasibility with nothing superfluous in it.
+
+Every group of clauses (one constraint) gets a selector variable `s`, and
+its clauses are added to one incremental CDCL engine as `~s \\/ clause`,
+so that assuming `s` enables the group. Starting from all the groups:
+  - clause-set refinement: after each unsatisfiable call, the groups
+    outside the core of the failed assumptions are dropped at once;
+  - deletion: each remaining group in turn is left out; if the rest is
+    still unsatisfiable, the group is dropped for good (its selector is
+    fixed false), else it is necessary;
+  - model rotation: the model found when a group `g` is necessary
+    falsifies only `g`. Flipping a variable of a falsified clause of `g`
+    may give a model of the hard clauses falsifying only another group,
+    which is then necessary without any call, and so on from that model.
+
+Each call thus decides at least one group, usually more, and the learned
+clauses carry over from one call to the next.
+"""
+
+import random
+import unittest
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from cdcl import CDCL, pigeonhole
+from clause_db import ClauseDB
+from dpll import Prop, encode_prop, from_z3
+
+Clause = Sequence[int]
+
+
+class MUSExtractor:
+    """Extract a MUS of the `groups` of DIMACS clauses, on top of the
+    `hard` clauses which are always in."""
+
+    def __init__(self, groups: Iterable[Iterable[Clause]], hard: Iterable[Clause] = (),
+                 num_vars: int = 0):
+        self.groups = [[list(clause) for clause in group] for group in groups]
+        hard = [list(clause) for clause in hard]
+        num_vars = max([num_vars] + [abs(lit) for clause in hard for lit in clause]
+                       + [abs(lit) for group in self.groups for clause in group for lit in clause])
+        self.num_vars = num_vars
+        self.engine = CDCL(num_vars)
+        for clause in hard:
+            self.engine.add_clause(clause)
+        self.selectors = [self.engine.new_var() for _ in self.groups]
+        self._group = {selector: g for g, selector in enumerate(self.selectors)}
+        for selector, group in zip(self.selectors, self.groups):
+            for clause in group:
+                self.engine.add_clause(clause + [-selector])
+        # the groups of each variable
+        self.occurs: Dict[int, List[int]] = {}
+        for g, group in enumerate(self.groups):
+            for clause in group:
+                for lit in clause:
+                    occurs = self.occurs.setdefault(abs(lit), [])
+                    if not occurs or occurs[-1] != g:
+                        occurs.append(g)
+        # the hard clauses of each variable, which a rotation must keep true
+        self.hard_occurs: Dict[int, List[List[int]]] = {}
+        for clause in hard:
+            for var in {abs(lit) for lit in clause}:
+                self.hard_occurs.setdefault(var, []).append(clause)
+        self.solver_calls = 0
+        self.rotated = 0
+
+    def _solve(self, groups: Iterable[int]) -> bool:
+        self.solver_calls += 1
+        return self.engine.solve([self.selectors[g] for g in groups])
+
+    def _core(self) -> List[int]:
+        return [self._group[lit] for lit in self.engine.core if lit in self._group]
+
+    def _drop(self, groups: Iterable[int]):
+        for g in groups:
+            self.engine.add_clause([-self.selectors[g]])
+
+    def _falsified(self, clause: Clause, model: Dict[int, bool]) -> bool:
+        return not any(model[abs(lit)] == (lit > 0) for lit in clause)
+
+    def _rotate(self, g: int, model: Dict[int, bool], candidates: set, necessary: set):
+        """Find more necessary groups from a model falsifying only the
+        group `g` among the candidates."""
+        work = [(g, model)]
+        while work:
+            g, model = work.pop()
+            for clause in self.groups[g]:
+                if not self._falsified(clause, model):
+                    continue
+                for lit in clause:
+                    var = abs(lit)
+                    model[var] = not model[var]
+                    if not any(self._falsified(c, model) for c in self.groups[g]) and not any(
+                            self._falsified(c, model) for c in self.hard_occurs.get(var, ())):
+                        falsified = [h for h in self.occurs[var] if h in candidates and any(
+                            self._falsified(c, model) for c in self.groups[h])]
+                        if len(falsified) == 1 and falsified[0] not in necessary:
+                            h = falsified[0]
+                            necessary.add(h)
+                            self.rotated += 1
+                            work.append((h, dict(model)))
+                    model[var] = not model[var]
+
+    def extract(self) -> Optional[List[int]]:
+        """The indices of the groups of a MUS, None if all the groups
+        together are satisfiable."""
+        if not self._solve(range(len(self.groups))):
+            candidates = set(self._core())
+        else:
+            return None
+        self._drop(set(range(len(self.groups))) - candidates)
+        necessary = set()
+        while candidates - necessary:
+            g = max(candidates - necessary)
+            rest = sorted(candidates - {g})
+            if self._solve(rest):
+                necessary.add(g)
+                model = {var: self.engine.model[var] for var in range(1, self.num_vars + 1)}
+                self._rotate(g, model, candidates, necessary)
+            else:
+                core = set(self._core())
+                self._drop(candidates - core)
+                candidates = core
+        return sorted(candidates)
+
+
+def mus(groups: Iterable[Iterable[Clause]], hard: Iterable[Clause] = (),
+        num_vars: int = 0) -> Optional[List[int]]:
+    """The indices of a MUS of the clause groups, see `MUSExtractor`."""
+    return MUSExtractor(groups, hard, num_vars).extract()
+
+
+def mus_props(constraints: List, hard: Iterable = ()) -> Optional[List]:
+    """A MUS of the constraints, `Prop`s or propositional Z3 formulas,
+    each of which is one group, None if they are satisfiable."""
+    db = ClauseDB()
+
+    def encode(constraint) -> List[List[int]]:
+        prop = constraint if isinstance(constraint, Prop) else from_z3(constraint)
+        start = len(db)
+        encode_prop(prop, db)
+        return [list(db.clause(i)) for i in range(start, len(db))]
+
+    hard_clauses = [clause for constraint in hard for clause in encode(constraint)]
+    groups = [encode(constraint) for constraint in constraints]
+    found = mus(groups, hard_clauses, db.num_vars)
+    return None if found is None else [constraints[g] for g in found]
+
+
+#####################
+# test cases:
+
+def is_mus(groups: List[List[Clause]], indices: List[int], hard: List[Clause] = ()) -> bool:
+    def satisfiable(chosen):
+        solver = CDCL()
+        for clause in hard:
+            solver.add_clause(clause)
+        for g in chosen:
+            for clause in groups[g]:
+                solver.add_clause(clause)
+        return solver.solve()
+
+    return not satisfiable(indices) and all(satisfiable([h for h in indices if h != g])
+                                            for g in indices)
+
+
+class TestMUS(unittest.TestCase):
+    def test_small(self):
+        groups = [[[1]], [[-1, 2]], [[-2]], [[3]], [[-1, -3, 4]]]
+        self.assertEqual(mus(groups), [0, 1, 2])
+        self.assertIsNone(mus([[[1]], [[2]]]))
+        self.assertEqual(mus([[[1]]], hard=[[-1]]), [0])
+        self.assertEqual(mus([[[2]]], hard=[[1], [-1]]), [])
+        self.assertEqual(mus([[[1], [2]], [[-1, -2]], [[3]]]), [0, 1])
+
+    def test_random(self):
+        rng = random.Random(8)
+        for _ in range(20):
+            n = rng.randint(4, 12)
+            groups = [[[var if rng.random() < 0.5 else -var for var in rng.sample(range(1, n + 1), 3)]]
+                      for _ in range(8 * n)]
+            found = mus(groups)
+            if found is not None:
+                self.assertTrue(is_mus(groups, found))
+
+    def test_random_hard(self):
+        rng = random.Random(10)
+
+        def clause(n):
+            return [var if rng.random() < 0.5 else -var for var in rng.sample(range(1, n + 1), rng.randint(1, 3))]
+
+        for _ in range(300):
+            n = rng.randint(4, 8)
+            hard = [clause(n) for _ in range(rng.randint(1, 2))]
+            groups = [[clause(n)] for _ in range(rng.randint(6, 14))]
+            found = mus(groups, hard)
+            if found is not None:
+                self.assertTrue(is_mus(groups, found, hard))
+        groups = [[[1, 5]], [[1, 2, 6]], [[5, 3, -2]], [[5]], [[7, 5, -4]], [[-1]], [[1, -7]],
+                  [[-4, 7]], [[-7]], [[7, 4, -6]], [[7]], [[3]]]
+        self.assertEqual(mus(groups, [[-1, -7]]), [6, 10])
+
+    def test_calls(self):
+        # a pigeonhole core hidden among satisfiable clauses over other
+        # variables, with far fewer calls than clauses
+        rng = random.Random(9)
+        core = pigeonhole(4)
+        filler = [[var if rng.random() < 0.5 else -var for var in rng.sample(range(21, 221), 3)]
+                  for _ in range(2000)]
+        clauses = filler[:1000] + core + filler[1000:]
+        extractor = MUSExtractor([[clause] for clause in clauses])
+        found = extractor.extract()
+        self.assertEqual([clauses[i] for i in found], core)
+        self.assertLess(extractor.solver_calls, len(core) + 2)
+
+    def test_rotation(self):
+        # a chain x1 -> x2 -> ... -> x8 with x1 and ~x8: every model of all
+        # but one clause rotates into the others
+        groups = [[[1]]] + [[[-i, i + 1]] for i in range(1, 8)] + [[[-8]]]
+        extractor = MUSExtractor(groups)
+        self.assertEqual(extractor.extract(), list(range(9)))
+        self.assertGreater(extractor.rotated, 0)
+        self.assertLess(extractor.solver_calls, 9)
+
+    def test_seats(self):
+        from z3 import Solver, unsat
+        from seat_arrange import seat_constraints
+        props, constraints = seat_constraints()
+        self.assertIsNone(mus_props(constraints))
+        # Alice wants the middle seat, but then Carol sits near her
+        wish = props[1]
+        found = mus_props(constraints + [wish])
+        self.assertTrue(any(constraint is wish for constraint in found))
+        self.assertLess(len(found), len(constraints) + 1)
+
+        def check(chosen):
+            solver = Solver()
+            solver.add(chosen)
+            return solver.check()
+
+        self.assertEqual(check(found), unsat)
+        for k in range(len(found)):
+            self.assertNotEqual(check(found[:k] + found[k + 1:]), unsat)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+"""Portfolio solving: differently configured engines race on the same
+clauses in a pool of processes, and the first definite answer wins.
+
+A configuration is a dict of the keyword options of `CDCL` (`decision`,
+`phase`, `restart`, `seed`), or names a local search algorithm with
+`"search": "walksat"` or `"probsat"` (see `local_search.py`). Local
+search can only answer sat, so a portfolio should hold at least one
+complete configuration.
+
+The CDCL workers may share their short learned clauses through a ring
+buffer in shared memory: each worker appends the clauses it learns, and
+adds the ones of the others at its restarts. Clauses learned from the
+same formula are implied by it, so they can be added anywhere.
+
+Once an answer is in, the other workers are told to stop through a
+shared event, which the engines poll between conflicts (or flips); the
+pool is only left when all of them have returned.
+"""
+
+import concurrent.futures as futures
+import multiprocessing
+import os
+import random
+import time
+import unittest
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cdcl import CDCL, pigeonhole, satisfies
+from clause_db import ClauseDB
+from local_search import LocalSearch
+
+# the default portfolio, in order of priority
+PORTFOLIO = [
+    {"decision": "evsids", "phase": "save", "restart": "glucose"},
+    {"decision": "vsids", "phase": "save", "restart": "luby", "seed": 1},
+    {"search": "probsat", "seed": 2},
+    {"decision": "evsids", "phase": "false", "restart": "luby", "seed": 3},
+    {"decision": "static", "phase": "save", "restart": "glucose"},
+    {"search": "walksat", "seed": 4},
+    {"decision": "evsids", "phase": "save", "restart": "glucose", "seed": 5},
+    {"decision": "vsids", "phase": "true", "restart": "none", "seed": 6},
+]
+# learned clauses up to this size are shared
+SHARE_SIZE = 8
+# the clauses kept in the ring buffer
+SHARE_SLOTS = 4096
+
+
+class ClauseExchange:
+    """One worker's end of the shared ring buffer.
+
+    The buffer is an int array: its first item counts the clauses ever
+    written, followed by fixed size slots of `[owner, size, lits...]`.
+    A reader which fell behind by more than the number of slots skips the
+    overwritten clauses.
+    """
+
+    def __init__(self, buffer, owner: int, max_size: int = SHARE_SIZE):
+        self.buffer = buffer
+        self.owner = owner
+        self.max_size = max_size
+        self.width = max_size + 2
+        self.slots = (len(buffer) - 1) // self.width
+        self.read = 0
+        self.exported = 0
+        self.received = 0
+
+    @staticmethod
+    def allocate(context=multiprocessing, max_size: int = SHARE_SIZE, slots: int = SHARE_SLOTS):
+        return context.Array('i', 1 + slots * (max_size + 2))
+
+    def export(self, lits: List[int], lbd: int):
+        if len(lits) > self.max_size:
+            return
+        with self.buffer.get_lock():
+            data = self.buffer.get_obj()
+            head = data[0]
+            base = 1 + (head % self.slots) * self.width
+            data[base] = self.owner
+            data[base + 1] = len(lits)
+            data[base + 2:base + 2 + len(lits)] = lits
+            data[0] = head + 1
+        self.exported += 1
+
+    def receive(self) -> List[List[int]]:
+        clauses = []
+        with self.buffer.get_lock():
+            data = self.buffer.get_obj()
+            head = data[0]
+            for k in range(max(self.read, head - self.slots), head):
+                base = 1 + (k % self.slots) * self.width
+                if data[base] != self.owner:
+                    clauses.append(data[base + 2:base + 2 + data[base + 1]])
+        self.read = head
+        self.received += len(clauses)
+        return clauses
+
+
+# the state a worker process gets from the pool
+_stop = None
+_buffer = None
+
+
+def _init_worker(stop, buffer):
+    global _stop, _buffer
+    _stop = stop
+    _buffer = buffer
+
+
+def _run(index: int, config: dict, db: ClauseDB) -> Tuple[int, Optional[bool], Dict[int, bool]]:
+    """Solve `db` with one configuration, return its index, the answer
+    (None if stopped) and the model."""
+    options = dict(config)
+    search = options.pop("search", "cdcl")
+    seed = options.pop("seed", index)
+    if search != "cdcl":
+        local = LocalSearch(db, seed=seed)
+        max_flips = options.pop("max_flips", float("inf"))
+        if local.solve(max_flips, search, interrupt=_stop.is_set, **options):
+            return index, True, local.model
+        return index, None, {}
+    solver = CDCL(db.num_vars, seed=seed, **options)
+    solver.interrupt = _stop.is_set
+    if _buffer is not None:
+        solver.exchange = ClauseExchange(_buffer, index + 1)
+    for clause in db:
+        if not solver.add_clause(clause):
+            break
+    return index, solver.solve(), solver.model
+
+
+def solve_portfolio(clauses: Iterable[Iterable[int]], num_vars: int = 0,
+                    configs: List[dict] = None, workers: int = None,
+                    share: bool = True) -> Tuple[Optional[bool], Dict[int, bool], Optional[dict]]:
+    """Race the configurations (`PORTFOLIO` by default) on the clauses
+    with up to `workers` processes.
+
+    Returns
+    -------
+    Tuple[Optional[bool], Dict[int, bool], Optional[dict]]
+        The answer (None when no configuration found one), the model if
+        it is sat, and the configuration which answered.
+
+    """
+    if isinstance(clauses, ClauseDB):
+        db = clauses
+    else:
+        db = ClauseDB()
+        db.ensure_vars(num_vars)
+        for clause in clauses:
+            clause = list(clause)
+            if clause:
+                db.ensure_vars(max(map(abs, clause)))
+            db.add_clause(clause)
+    if configs is None:
+        configs = PORTFOLIO
+    if workers is None:
+        workers = min(len(configs), os.cpu_count() or 1)
+    context = multiprocessing.get_context()
+    stop = context.Event()
+    buffer = ClauseExchange.allocate(context) if share else None
+
+    answer, model, winner = None, {}, None
+    with futures.ProcessPoolExecutor(workers, context, _init_worker, (stop, buffer)) as pool:
+        pending = {pool.submit(_run, index, config, db) for index, config in enumerate(configs)}
+        while pending and winner is None:
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                index, result, result_model = future.result()
+                if result is not None and winner is None:
+                    answer, model, winner = result, result_model, configs[index]
+        # the queued workers never start, the running ones return soon
+        stop.set()
+        for future in pending:
+            future.cancel()
+    return answer, model, winner
+
+
+#####################
+# test cases:
+
+class TestPortfolio(unittest.TestCase):
+    def test_exchange(self):
+        buffer = ClauseExchange.allocate(max_size=3, slots=4)
+        first = ClauseExchange(buffer, 1, max_size=3)
+        second = ClauseExchange(buffer, 2, max_size=3)
+        first.export([1, -2], 2)
+        first.export([1, 2, 3, 4], 2)
+        second.export([5], 1)
+        self.assertEqual(second.receive(), [[1, -2]])
+        self.assertEqual(first.receive(), [[5]])
+        self.assertEqual(first.receive(), [])
+        for k in range(1, 7):
+            first.export([k, k + 1], 2)
+        # the two oldest were overwritten
+        self.assertEqual(second.receive(), [[3, 4], [4, 5], [5, 6], [6, 7]])
+
+        # the engines trade clauses at their restarts
+        buffer = ClauseExchange.allocate()
+        solvers = []
+        for owner in [1, 2]:
+            solver = CDCL(restart="luby", seed=owner)
+            solver.exchange = ClauseExchange(buffer, owner)
+            for clause in pigeonhole(5):
+                solver.add_clause(clause)
+            solvers.append(solver)
+        self.assertFalse(solvers[0].solve())
+        self.assertFalse(solvers[1].solve())
+        self.assertGreater(solvers[0].exchange.exported, 0)
+        self.assertGreater(solvers[1].exchange.received, 0)
+
+    def test_unsat(self):
+        answer, model, winner = solve_portfolio(pigeonhole(6), workers=4)
+        self.assertFalse(answer)
+        self.assertNotIn(winner.get("search"), ["walksat", "probsat"])
+
+    def test_sat(self):
+        rng = random.Random(12)
+        clauses = [[rng.choice([-1, 1]) * var for var in rng.sample(range(1, 81), 3)]
+                   for _ in range(300)]
+        for share in [False, True]:
+            answer, model, winner = solve_portfolio(clauses, 80, workers=3, share=share)
+            self.assertTrue(answer)
+            self.assertTrue(satisfies(model, clauses))
+
+    def test_cancel(self):
+        # local search alone never answers an unsatisfiable formula, and is
+        # stopped once the complete search has
+        configs = [{"search": "walksat"}, {"search": "probsat"}, {"restart": "luby"}]
+        start = time.perf_counter()
+        answer, _, winner = solve_portfolio(pigeonhole(5), configs=configs, workers=3)
+        self.assertFalse(answer)
+        self.assertEqual(winner, {"restart": "luby"})
+        self.assertLess(time.perf_counter() - start, 30)
+        answer, _, winner = solve_portfolio(pigeonhole(3), configs=[{"search": "walksat", "max_flips": 1000}])
+        self.assertIsNone(answer)
+        self.assertIsNone(winner)
+
+
+if __name__ == '__main__':
+    unittest.main()
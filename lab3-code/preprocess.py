@@ -0,0 +1,360 @@
+"""CNF preprocessing between the clause conversion and the search.
+
+The preprocessor works on clauses of DIMACS-style integers, kept with
+occurrence lists (the clauses each literal appears in), and applies:
+  - removal of tautologies and duplicate clauses;
+  - top-level unit propagation;
+  - subsumption: drop D when a clause C is a subset of it;
+  - self-subsuming resolution (strengthening): when C = C' \\/ l and D
+    contains C' and ~l, ~l is removed from D;
+  - bounded variable elimination: a variable is replaced by all the
+    resolvents of its positive and negative clauses, when these are no
+    more numerous than the clauses they replace;
+  - failed literal probing: a literal whose propagation conflicts is
+    false.
+
+Eliminating a variable keeps the formula equisatisfiable only, so the
+removed clauses are pushed onto a reconstruction stack, and `extend`
+turns a model of the simplified clauses into one of the original ones.
+Every step is a valid DRAT step, and is logged to `proof` if one is
+given (see `drat.py`).
+"""
+
+import random
+import unittest
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from cdcl import CDCL, UNDEF, to_internal, pigeonhole, satisfies, solve
+
+# variables with more occurrences than this are not eliminated
+ELIM_OCC_LIMIT = 16
+# the total number of literals failed literal probing may propagate
+PROBE_BUDGET = 200000
+
+
+class Preprocessor:
+    def __init__(self, clauses: Iterable[Iterable[int]], num_vars: int = 0, proof=None):
+        self.num_vars = num_vars
+        self.proof = proof
+        self.clauses: List[Optional[List[int]]] = []
+        self.occurs: Dict[int, Set[int]] = defaultdict(set)
+        # the assigned variables, and the units waiting to be propagated
+        self.fixed: Dict[int, bool] = {}
+        self.units: List[int] = []
+        # the clauses removed by variable elimination, as (witness, clause)
+        self.stack: List[Tuple[int, List[int]]] = []
+        self.eliminated: Set[int] = set()
+        # clauses to check for subsumption
+        self.touched: Set[int] = set()
+        self.ok = True
+        self.stats = dict.fromkeys(["tautologies", "duplicates", "subsumed", "strengthened",
+                                    "eliminated", "failed"], 0)
+        keys = set()
+        for clause in clauses:
+            lits = list(dict.fromkeys(clause))
+            if any(-lit in lits for lit in lits):
+                self.stats["tautologies"] += 1
+                continue
+            key = frozenset(lits)
+            if key in keys:
+                self.stats["duplicates"] += 1
+                continue
+            keys.add(key)
+            if lits:
+                self.num_vars = max(self.num_vars, max(map(abs, lits)))
+            self._attach(lits)
+
+    def _attach(self, lits: List[int]):
+        if not lits:
+            self.ok = False
+            return
+        if len(lits) == 1:
+            self.units.append(lits[0])
+            return
+        index = len(self.clauses)
+        self.clauses.append(lits)
+        for lit in lits:
+            self.occurs[lit].add(index)
+        self.touched.add(index)
+
+    def _learn(self, lits: List[int]):
+        """Add a clause implied by the current ones."""
+        if self.proof is not None:
+            self.proof.add(lits)
+        self._attach(lits)
+
+    def _remove(self, index: int):
+        clause = self.clauses[index]
+        self.clauses[index] = None
+        for lit in clause:
+            self.occurs[lit].discard(index)
+        self.touched.discard(index)
+        if self.proof is not None:
+            self.proof.delete(clause)
+
+    def _strengthen(self, index: int, lit: int):
+        """Remove a false literal from a clause."""
+        clause = self.clauses[index]
+        # the shorter clause goes first, the proof needs the longer one to
+        # derive it
+        self._learn([q for q in clause if q != lit])
+        self._remove(index)
+        self.stats["strengthened"] += 1
+
+    def _propagate(self) -> bool:
+        """Top-level unit propagation, return False on a conflict."""
+        while self.units and self.ok:
+            lit = self.units.pop()
+            var = abs(lit)
+            if var in self.fixed:
+                if self.fixed[var] != (lit > 0):
+                    self.ok = False
+                    if self.proof is not None:
+                        self.proof.add([])
+                continue
+            self.fixed[var] = lit > 0
+            for index in list(self.occurs[lit]):
+                self._remove(index)
+            for index in list(self.occurs[-lit]):
+                self._strengthen(index, -lit)
+        return self.ok
+
+    def _subsume(self, index: int):
+        """Remove the clauses subsumed by a clause, and strengthen those it
+        resolves with into a subset of themselves."""
+        clause = self.clauses[index]
+        occurs = self.occurs
+        lits = set(clause)
+        rarest = min(clause, key=lambda lit: len(occurs[lit]))
+        for other in list(occurs[rarest]):
+            if other != index and len(self.clauses[other]) >= len(clause) \
+                    and lits.issubset(self.clauses[other]):
+                self._remove(other)
+                self.stats["subsumed"] += 1
+        for lit in clause:
+            lits.discard(lit)
+            for other in list(occurs[-lit]):
+                if other != index and self.clauses[other] is not None \
+                        and len(self.clauses[other]) >= len(clause) \
+                        and lits.issubset(self.clauses[other]):
+                    self._strengthen(other, -lit)
+            lits.add(lit)
+            if self.clauses[index] is None:
+                # strengthened itself through a duplicate
+                return
+
+    def _eliminate(self, var: int) -> bool:
+        """Try to replace `var` by its resolvents, return whether it was
+        eliminated."""
+        pos = list(self.occurs[var])
+        neg = list(self.occurs[-var])
+        if len(pos) + len(neg) > ELIM_OCC_LIMIT:
+            return False
+        resolvents = []
+        for i in pos:
+            for j in neg:
+                resolvent = [lit for lit in self.clauses[i] if lit != var]
+                tautology = False
+                for lit in self.clauses[j]:
+                    if lit == -var or lit in resolvent:
+                        continue
+                    if -lit in resolvent:
+                        tautology = True
+                        break
+                    resolvent.append(lit)
+                if not tautology:
+                    resolvents.append(resolvent)
+                    if len(resolvents) > len(pos) + len(neg):
+                        return False
+        # the resolvents go first, the proof needs them to be implied
+        for resolvent in resolvents:
+            self._learn(resolvent)
+        for index in pos:
+            self.stack.append((var, self.clauses[index]))
+            self._remove(index)
+        for index in neg:
+            self.stack.append((-var, self.clauses[index]))
+            self._remove(index)
+        self.eliminated.add(var)
+        self.stats["eliminated"] += 1
+        return True
+
+    def _probe(self):
+        """Failed literal probing on the literals implying something through
+        a binary clause, within `PROBE_BUDGET`."""
+        candidates = dict()
+        for clause in self.clauses:
+            if clause is not None and len(clause) == 2:
+                candidates[-clause[0]] = candidates[-clause[1]] = None
+        if not candidates:
+            return
+        # the fixed variables are gone from the clauses
+        engine = CDCL(self.num_vars)
+        for clause in self.clauses:
+            if clause is not None:
+                engine.add_clause(clause)
+        budget = PROBE_BUDGET
+        for lit in candidates:
+            if budget <= 0 or not engine.ok:
+                break
+            if engine.values[to_internal(lit)] != UNDEF:
+                continue
+            implied = engine.probe(lit)
+            if implied is None:
+                self.stats["failed"] += 1
+                self._learn([-lit])
+                engine.add_clause([-lit])
+            else:
+                budget -= len(implied)
+        if not engine.ok:
+            self._learn([])
+            return
+        # the consequences of the failed literals
+        for q in engine.trail:
+            lit = -(q >> 1) if q & 1 else q >> 1
+            if abs(lit) not in self.fixed:
+                self._learn([lit])
+
+    def run(self) -> bool:
+        """Simplify the clauses, return False if they are unsatisfiable."""
+        if not self._propagate():
+            return False
+        while self.touched and self.ok:
+            for index in sorted(self.touched, key=lambda i: len(self.clauses[i])):
+                if self.clauses[index] is not None:
+                    self._subsume(index)
+            self.touched.clear()
+            if not self._propagate():
+                return False
+        self._probe()
+        if not self._propagate():
+            return False
+
+        order = sorted(range(1, self.num_vars + 1),
+                       key=lambda v: len(self.occurs[v]) * len(self.occurs[-v]))
+        for var in order:
+            if var in self.fixed or (not self.occurs[var] and not self.occurs[-var]):
+                continue
+            self._eliminate(var)
+            # new units and subsumptions among the resolvents
+            while self.touched and self.ok:
+                touched = sorted(self.touched, key=lambda i: len(self.clauses[i]))
+                self.touched.clear()
+                for index in touched:
+                    if self.clauses[index] is not None:
+                        self._subsume(index)
+                if not self._propagate():
+                    return False
+        return self.ok
+
+    def __iter__(self) -> Iterator[List[int]]:
+        """The simplified clauses, the fixed variables as units."""
+        for var, value in self.fixed.items():
+            yield [var if value else -var]
+        for clause in self.clauses:
+            if clause is not None:
+                yield clause
+
+    def extend(self, model: Dict[int, bool]) -> Dict[int, bool]:
+        """Turn a model of the simplified clauses into a model of the
+        original ones."""
+        model = dict(model)
+        for var in range(1, self.num_vars + 1):
+            model.setdefault(var, False)
+        for witness, clause in reversed(self.stack):
+            if not any(model[abs(lit)] == (lit > 0) for lit in clause):
+                model[abs(witness)] = witness > 0
+        return model
+
+
+def preprocess(clauses: Iterable[Iterable[int]], num_vars: int = 0, proof=None) -> Preprocessor:
+    pre = Preprocessor(clauses, num_vars, proof)
+    pre.run()
+    return pre
+
+
+#####################
+# test cases:
+
+class TestPreprocess(unittest.TestCase):
+    def test_tautologies(self):
+        pre = preprocess([[-1, -2, 1], [1, 2], [2, 1, 2], [3, -3]])
+        self.assertEqual(pre.stats["tautologies"], 2)
+        self.assertEqual(pre.stats["duplicates"], 1)
+
+    def test_subsumption(self):
+        pre = Preprocessor([[1, 2], [1, 2, 3], [-1, 2, 4], [5, 6, 7], [5, 6, -7]])
+        pre._subsume(0)
+        self.assertEqual(pre.clauses[1], None)
+        self.assertEqual(pre.stats["subsumed"], 1)
+        # [1, 2] and [-1, 2, 4] strengthen the latter to [2, 4]
+        self.assertIn([2, 4], pre.clauses)
+        pre._subsume(3)
+        self.assertIn([5, 6], pre.clauses)
+        self.assertEqual(pre.stats["strengthened"], 2)
+
+    def test_units(self):
+        pre = preprocess([[1], [-1, 2], [-2, 3, 4], [-3]])
+        self.assertEqual(pre.fixed, {1: True, 2: True, 3: False, 4: True})
+        self.assertEqual(sorted(pre), [[-3], [1], [2], [4]])
+        self.assertFalse(preprocess([[1], [-1, 2], [-2]]).ok)
+
+    def test_elimination(self):
+        # x2 only links x1 and x3
+        pre = preprocess([[1, 2], [-2, 3], [-1, -3, 4], [1, -4], [3, -4]])
+        self.assertTrue(pre.ok)
+        self.assertTrue(pre.eliminated)
+        model = solve(list(pre), pre.num_vars)
+        self.assertTrue(satisfies(pre.extend(model),
+                                  [[1, 2], [-2, 3], [-1, -3, 4], [1, -4], [3, -4]]))
+
+    def test_failed_literals(self):
+        # 1 implies 2 and -2
+        pre = Preprocessor([[-1, 2], [-1, 3], [-2, -3], [1, 4, 5], [4, -5, 6]])
+        pre._probe()
+        self.assertEqual(pre.stats["failed"], 1)
+        pre._propagate()
+        self.assertEqual(pre.fixed, {1: False})
+
+    def test_pigeonhole(self):
+        for holes in range(1, 6):
+            pre = preprocess(pigeonhole(holes))
+            self.assertTrue(not pre.ok or solve(list(pre), pre.num_vars) is None)
+
+    def test_random(self):
+        rng = random.Random(9)
+        for _ in range(100):
+            n = 25
+            clauses = [[rng.choice([-1, 1]) * rng.randint(1, n) for _ in range(rng.randint(1, 3))]
+                       for _ in range(rng.randint(20, 90))]
+            pre = preprocess(clauses, n)
+            model = solve(list(pre), n) if pre.ok else None
+            expected = solve(clauses, n)
+            self.assertEqual(model is None, expected is None)
+            if model is not None:
+                self.assertTrue(satisfies(pre.extend(model), clauses))
+
+    def test_proof(self):
+        import io
+        from drat import DratWriter, check_drat
+        rng = random.Random(10)
+        checked = 0
+        for _ in range(60):
+            clauses = [[rng.choice([-1, 1]) * rng.randint(1, 20) for _ in range(3)]
+                       for _ in range(100)]
+            stream = io.BytesIO()
+            proof = DratWriter(stream)
+            pre = preprocess(clauses, 20, proof)
+            solver = CDCL(20)
+            solver.proof = proof
+            for clause in pre:
+                solver.add_clause(clause)
+            if not pre.ok or not solver.solve():
+                self.assertTrue(check_drat(clauses, io.BytesIO(stream.getvalue())))
+                checked += 1
+        self.assertGreater(checked, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+"""Compile propositions into Python functions, for evaluating one formula
+under many assignments.
+
+Walking the tree with `match` costs a few dispatches per node and per
+assignment. Instead, `compile_prop` generates the source of a function
+over a sequence `v` of values, with the variables at integer slots in
+the order of `variables(prop)`. For instance, `(p /\\ ~q) \\/ p` becomes
+
+    def evaluate(v):
+        return ((v[0] and (not v[1])) or v[0])
+
+A subformula shared by several parents is computed once into a local,
+and so is one nested deeper than `INLINE_DEPTH`, so that the source of
+deep formulas (see `monster.py`) stays within the limits of the Python
+parser. The rest is inlined, and so keeps the short-circuits of `and`
+and `or`.
+
+The compiled form is cached per formula: propositions are hash-consed,
+so identity is structural equality, and the cache is weak, forgetting
+the formulas no longer alive.
+"""
+
+import operator
+import random
+import unittest
+import weakref
+from typing import Callable, Dict, Iterable, List, Mapping, Sequence, Union
+
+from dpll import (PAnd, PFalse, PImplies, PNot, POr, Prop, PTrue, PVar, children, paused_gc,
+                  test_prop_1, test_prop_2, transform, variables)
+
+# nesting of the inlined expressions
+INLINE_DEPTH = 50
+
+_cache = weakref.WeakKeyDictionary()
+
+Assignment = Union[Mapping[str, bool], Sequence[bool]]
+
+
+class CompiledProp:
+    def __init__(self, prop: Prop):
+        self.names = variables(prop)
+        self.slots = {name: k for k, name in enumerate(self.names)}
+        if len(self.names) == 1:
+            getter = operator.itemgetter(self.names[0])
+            self._row = lambda assignment: (getter(assignment),)
+        elif self.names:
+            self._row = operator.itemgetter(*self.names)
+        else:
+            self._row = lambda assignment: ()
+        statements, result = self._generate(prop)
+        body = "".join(f"    {line}\n" for line in statements)
+        loop = "".join(f"        {line}\n" for line in statements)
+        self.source = (f"def evaluate(v):\n{body}    return {result}\n\n"
+                       f"def evaluate_rows(rows):\n"
+                       f"    out = []\n"
+                       f"    append = out.append\n"
+                       f"    for v in rows:\n{loop}        append({result})\n"
+                       f"    return out\n")
+        namespace = {}
+        exec(compile(self.source, f"<compiled {len(self.names)} variables>", "exec"), namespace)
+        self.function: Callable[[Sequence[bool]], bool] = namespace["evaluate"]
+        self._evaluate_rows = namespace["evaluate_rows"]
+
+    def _generate(self, prop: Prop):
+        """The statements computing the shared or deep subformulas into
+        locals, and the expression of the whole."""
+        parents: Dict[int, int] = {}
+        visited = set()
+        stack = [prop]
+        while stack:
+            node = stack.pop()
+            if id(node) in visited:
+                continue
+            visited.add(id(node))
+            for kid in children(node):
+                parents[id(kid)] = parents.get(id(kid), 0) + 1
+                stack.append(kid)
+
+        statements: List[str] = []
+        slots = self.slots
+
+        def combine(node: Prop, args):
+            # the code of a node, and the depth of its nesting
+            match node:
+                case PVar(var):
+                    return f"v[{slots[var]}]", 0
+                case PTrue():
+                    return "True", 0
+                case PFalse():
+                    return "False", 0
+                case PNot():
+                    code, depth = f"(not {args[0][0]})", args[0][1] + 1
+                case PAnd():
+                    code, depth = f"({args[0][0]} and {args[1][0]})", max(args[0][1], args[1][1]) + 1
+                case POr():
+                    code, depth = f"({args[0][0]} or {args[1][0]})", max(args[0][1], args[1][1]) + 1
+                case PImplies():
+                    code, depth = f"(not {args[0][0]} or {args[1][0]})", max(args[0][1], args[1][1]) + 1
+            if parents.get(id(node), 0) > 1 or depth >= INLINE_DEPTH:
+                name = f"t{len(statements)}"
+                statements.append(f"{name} = {code}")
+                return name, 0
+            return code, depth
+
+        with paused_gc():
+            code, _ = transform(prop, combine)
+        return statements, code
+
+    def row(self, assignment: Mapping[str, bool]) -> Sequence[bool]:
+        """The values of an assignment of names, in slot order."""
+        return self._row(assignment)
+
+    def __call__(self, assignment: Assignment) -> bool:
+        """Evaluate under a mapping of the variables, or their values in
+        slot order."""
+        if isinstance(assignment, Mapping):
+            assignment = self._row(assignment)
+        return bool(self.function(assignment))
+
+    def evaluate_many(self, assignments: Iterable[Assignment]) -> List[bool]:
+        """Evaluate under each assignment in turn, in a single loop of the
+        generated code."""
+        rows = (self._row(a) if isinstance(a, Mapping) else a for a in assignments)
+        return [bool(value) for value in self._evaluate_rows(rows)]
+
+
+def compile_prop(prop: Prop) -> CompiledProp:
+    """The compiled form of `prop`, compiled on first use."""
+    compiled = _cache.get(prop)
+    if compiled is None:
+        compiled = _cache[prop] = CompiledProp(prop)
+    return compiled
+
+
+def evaluate(prop: Prop, assignment: Assignment) -> bool:
+    return compile_prop(prop)(assignment)
+
+
+def evaluate_many(prop: Prop, assignments: Iterable[Assignment]) -> List[bool]:
+    return compile_prop(prop).evaluate_many(assignments)
+
+
+#####################
+# test cases:
+
+def interpret(prop: Prop, assignment: Mapping[str, bool]) -> bool:
+    def combine(node: Prop, args) -> bool:
+        match node:
+            case PVar(var):
+                return assignment[var]
+            case PTrue():
+                return True
+            case PFalse():
+                return False
+            case PNot():
+                return not args[0]
+            case PAnd():
+                return args[0] and args[1]
+            case POr():
+                return args[0] or args[1]
+            case PImplies():
+                return not args[0] or args[1]
+
+    return transform(prop, combine)
+
+
+class TestPropCompile(unittest.TestCase):
+    def test_source(self):
+        p, q = PVar("p"), PVar("q")
+        prop = POr(PAnd(p, PNot(q)), p)
+        compiled = compile_prop(prop)
+        self.assertIn("return ((v[0] and (not v[1])) or v[0])", compiled.source)
+        self.assertEqual(compiled.names, ["p", "q"])
+        self.assertTrue(compiled({"p": True, "q": True}))
+        self.assertFalse(compiled([False, True]))
+        self.assertIs(compile_prop(POr(PAnd(p, PNot(q)), p)), compiled)
+        self.assertTrue(evaluate(PTrue(), {}))
+        self.assertTrue(evaluate(test_prop_1, {"p": False, "q": True}))
+        self.assertEqual(evaluate_many(test_prop_2, [[False, True, False, False], {
+            "p1": True, "p2": False, "p3": True, "p4": True}]), [True, False])
+
+    def test_random(self):
+        from bdd import random_prop
+        rng = random.Random(6)
+        names = [f"v{i}" for i in range(6)]
+        for _ in range(50):
+            prop = random_prop(rng, names, rng.randint(1, 60))
+            assignments = [{name: rng.random() < 0.5 for name in names} for _ in range(20)]
+            self.assertEqual(evaluate_many(prop, assignments),
+                             [interpret(prop, assignment) for assignment in assignments])
+
+    def test_shared_and_deep(self):
+        p = PVar("p")
+        shared = PAnd(p, PNot(PVar("q")))
+        prop = POr(shared, PImplies(shared, PFalse()))
+        self.assertIn("t0 = ", compile_prop(prop).source)
+        self.assertTrue(all(evaluate_many(prop, [[a, b] for a in (0, 1) for b in (0, 1)])))
+        chain = PTrue()
+        for i in range(20000):
+            chain = PAnd(chain, PVar(f"b_{i}"))
+        compiled = compile_prop(chain)
+        self.assertEqual(compiled.evaluate_many([[True] * 20000, [True] * 19999 + [False]]),
+                         [True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
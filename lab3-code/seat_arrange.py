@@ -21,8 +21,10 @@ from z3 import *
 # Now let us investigate the problem
 
 
-def seat_arrangement():
-    solver = Solver()
+def seat_constraints():
+    """The variables and the constraints of the problem, in that order:
+    Alice, Bob and Carol each take a seat, Alice does not sit near Carol,
+    and Bob does not sit right to Alice."""
     # First we need to modeling the problem
     # Let say:
     #   A_i means Alice takes seat Ai,
@@ -39,34 +41,42 @@ def seat_arrangement():
     alice_take_seat_1 = And(a1, Not(a2), Not(a3), Not(b1), Not(c1))
     alice_take_seat_2 = And(a2, Not(a1), Not(a3), Not(b2), Not(c2))
     alice_take_seat_3 = And(a3, Not(a1), Not(a2), Not(b3), Not(c3))
-    solver.add(Or(alice_take_seat_1, alice_take_seat_2, alice_take_seat_3))
+    alice_take_seat = Or(alice_take_seat_1, alice_take_seat_2, alice_take_seat_3)
 
     # Exercise 5-1: try to add constraints that indicate Bob must take a seat
     # bob must take a seat:
     bob_take_seat_1 = And(b1, Not(b2), Not(b3), Not(a1), Not(c1))
     bob_take_seat_2 = And(b2, Not(b1), Not(b3), Not(a2), Not(c2))
     bob_take_seat_3 = And(b3, Not(b1), Not(b2), Not(a3), Not(c3))
-    solver.add(Or(bob_take_seat_1, bob_take_seat_2, bob_take_seat_3))
+    bob_take_seat = Or(bob_take_seat_1, bob_take_seat_2, bob_take_seat_3)
 
     # Exercise 5-2: try to add constraints that indicate Carol must take a seat
     # carol must take a seat:
     carol_take_seat_1 = And(c1, Not(c2), Not(c3), Not(a1), Not(b1))
     carol_take_seat_2 = And(c2, Not(c1), Not(c3), Not(a2), Not(b2))
     carol_take_seat_3 = And(c3, Not(c1), Not(c2), Not(a3), Not(b3))
-    solver.add(Or(carol_take_seat_1, carol_take_seat_2, carol_take_seat_3))
+    carol_take_seat = Or(carol_take_seat_1, carol_take_seat_2, carol_take_seat_3)
 
     # alice can not sit near to carol:
     alice_not_near_carol = And(Implies(a1, Not(c2)), Implies(a2, Not(Or(c1, c3))), Implies(a3, Not(c2)))
-    solver.add(alice_not_near_carol)
 
     # Exercise 5-3: try to add constraints that indicate Bob can not sit right to Alice
     # bob can not sit right to Alice
     bob_not_right_to_alice = And(Implies(b2, Not(a1)), Implies(b3, Not(a2)), Implies(b3, Not(a1)))
-    solver.add(bob_not_right_to_alice)
+
+    props = [a1, a2, a3, b1, b2, b3, c1, c2, c3]
+    return props, [alice_take_seat, bob_take_seat, carol_take_seat,
+                   alice_not_near_carol, bob_not_right_to_alice]
+
+
+def seat_arrangement():
+    solver = Solver()
+    props, constraints = seat_constraints()
+    solver.add(constraints)
+    a1, a2, a3, b1, b2, b3, c1, c2, c3 = props
 
     # Hint: here only one solution is printed, you may change this to
     # print all the solutions to check your implementation.
-    props = [a1, a2, a3, b1, b2, b3, c1, c2, c3]
     while solver.check() == sat:
         model = solver.model()
         # print(model)
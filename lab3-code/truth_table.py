@@ -0,0 +1,260 @@
+"""Bit-parallel truth tables of small formulas, with NumPy.
+
+For a formula of `n` variables, the truth table is a column of `2 ** n`
+bits, the bit `i` being the value of the formula under the assignment
+which gives the `k`-th variable the bit `k` of `i`. The columns are
+packed 64 bits to an unsigned word, so that one bitwise NumPy operation
+on a word array evaluates a connective under 64 assignments per word.
+
+The formula, a `Prop` or a propositional Z3 formula, is compiled once
+into a straight-line program over registers, one instruction per
+distinct subformula (shared subformulas are evaluated once). Registers
+are reused once their value is dead, so the memory does not grow with
+the size of the formula beyond its widest point. The columns are
+evaluated `CHUNK_WORDS` words at a time, which keeps the working set in
+the cache, and lets `satisfiable` and `valid` stop at the first chunk
+which decides them. Up to `MAX_VARS` variables are accepted, beyond
+which a SAT solver is the better tool.
+"""
+
+import random
+import unittest
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from dpll import (PAnd, PFalse, PImplies, PNot, POr, Prop, PTrue, PVar, from_z3, test_prop_1,
+                  test_prop_2, transform, variables)
+from prop_compile import evaluate
+
+# words evaluated at a time
+CHUNK_WORDS = 1 << 12
+MAX_VARS = 32
+
+# the instructions of the compiled programs
+VAR, TRUE, FALSE, NOT, AND, OR, IMPLIES = range(7)
+
+# the words of the first 6 variables, the same in every word
+_PATTERNS = [sum(1 << i for i in range(64) if i >> k & 1) for k in range(6)]
+
+
+def _popcount(words) -> int:
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(words).sum(dtype=np.uint64))
+    return int(np.unpackbits(words.view(np.uint8)).sum(dtype=np.uint64))
+
+
+class TruthTable:
+    """The compiled truth table of a formula, over its variables followed
+    by the extra `names`."""
+
+    def __init__(self, formula, names: Iterable[str] = ()):
+        if np is None:
+            raise RuntimeError("truth tables need numpy")
+        prop = formula if isinstance(formula, Prop) else from_z3(formula)
+        self.names = list(dict.fromkeys(variables(prop) + list(names)))
+        if len(self.names) > MAX_VARS:
+            raise ValueError(f"{len(self.names)} variables, at most {MAX_VARS} are supported")
+        index = {name: k for k, name in enumerate(self.names)}
+
+        # instructions [op, destination, operands...], in evaluation order
+        program = []
+
+        def combine(node: Prop, args) -> int:
+            match node:
+                case PVar(var):
+                    program.append([VAR, None, index[var]])
+                case PTrue():
+                    program.append([TRUE, None])
+                case PFalse():
+                    program.append([FALSE, None])
+                case PNot():
+                    program.append([NOT, None, *args])
+                case PAnd():
+                    program.append([AND, None, *args])
+                case POr():
+                    program.append([OR, None, *args])
+                case PImplies():
+                    program.append([IMPLIES, None, *args])
+            return len(program) - 1
+
+        result = transform(prop, combine)
+        self._allocate(program, result)
+        self.program = program
+
+    def _allocate(self, program: List[list], result: int):
+        """Assign registers to the instructions, an operand's register is
+        freed after its last use, but never reused for the same
+        instruction's destination."""
+        last_use = {result: len(program)}
+        for i, instruction in enumerate(program):
+            if instruction[0] >= NOT:
+                for operand in instruction[2:]:
+                    last_use[operand] = i
+        free = []
+        self.registers = 0
+        for i, instruction in enumerate(program):
+            if free:
+                instruction[1] = free.pop()
+            else:
+                instruction[1] = self.registers
+                self.registers += 1
+            if instruction[0] >= NOT:
+                operands = [program[operand][1] for operand in instruction[2:]]
+                for operand in set(instruction[2:]):
+                    if last_use[operand] == i:
+                        free.append(program[operand][1])
+                instruction[2:] = operands
+        self.result = program[result][1]
+
+    @property
+    def num_words(self) -> int:
+        return max(1, 1 << max(len(self.names) - 6, 0))
+
+    def _tail_mask(self) -> int:
+        """The valid bits of the last word, fewer than 64 when there are
+        fewer than 6 variables."""
+        bits = 1 << len(self.names)
+        return (1 << bits) - 1 if bits < 64 else (1 << 64) - 1
+
+    def chunks(self, negate: bool = False) -> Iterator:
+        """The words of the truth table (of the negation), a chunk at a
+        time. The array is overwritten by the next chunk."""
+        all_ones = np.uint64((1 << 64) - 1)
+        registers = [np.empty(0, dtype=np.uint64) for _ in range(self.registers)]
+        total = self.num_words
+        for start in range(0, total, CHUNK_WORDS):
+            size = min(CHUNK_WORDS, total - start)
+            if len(registers[0]) != size:
+                registers = [np.empty(size, dtype=np.uint64) for _ in range(self.registers)]
+            word_index = None
+            for op, dst, *operands in self.program:
+                out = registers[dst]
+                if op == VAR:
+                    k = operands[0]
+                    if k < 6:
+                        out.fill(_PATTERNS[k])
+                    else:
+                        if word_index is None:
+                            word_index = np.arange(start, start + size, dtype=np.uint64)
+                        np.right_shift(word_index, np.uint64(k - 6), out=out)
+                        np.bitwise_and(out, np.uint64(1), out=out)
+                        np.multiply(out, all_ones, out=out)
+                elif op == TRUE:
+                    out.fill(all_ones)
+                elif op == FALSE:
+                    out.fill(0)
+                elif op == NOT:
+                    np.invert(registers[operands[0]], out=out)
+                elif op == AND:
+                    np.bitwise_and(registers[operands[0]], registers[operands[1]], out=out)
+                elif op == OR:
+                    np.bitwise_or(registers[operands[0]], registers[operands[1]], out=out)
+                else:
+                    np.invert(registers[operands[0]], out=out)
+                    np.bitwise_or(out, registers[operands[1]], out=out)
+            words = registers[self.result]
+            if negate:
+                np.invert(words, out=words)
+            if start + size == total:
+                words[-1] &= np.uint64(self._tail_mask())
+            yield words
+
+    def count(self) -> int:
+        """The number of models over the variables of the table."""
+        return sum(_popcount(words) for words in self.chunks())
+
+    def satisfiable(self) -> bool:
+        return any(words.any() for words in self.chunks())
+
+    def valid(self) -> bool:
+        return not any(words.any() for words in self.chunks(negate=True))
+
+    def model(self) -> Optional[Dict[str, bool]]:
+        """The first model in the order of the table, None if there is
+        none."""
+        offset = 0
+        for words in self.chunks():
+            nonzero = np.flatnonzero(words)
+            if len(nonzero):
+                word = int(words[nonzero[0]])
+                i = 64 * (offset + int(nonzero[0])) + (word & -word).bit_length() - 1
+                return {name: bool(i >> k & 1) for k, name in enumerate(self.names)}
+            offset += len(words)
+        return None
+
+
+def truth_table(formula, names: Iterable[str] = ()) -> TruthTable:
+    return TruthTable(formula, names)
+
+
+#####################
+# test cases:
+
+@unittest.skipIf(np is None, "needs numpy")
+class TestTruthTable(unittest.TestCase):
+    def test_small(self):
+        self.assertTrue(truth_table(test_prop_1).valid())
+        table = truth_table(test_prop_2)
+        self.assertEqual(table.count(), 7)
+        self.assertFalse(table.valid())
+        self.assertTrue(evaluate(test_prop_2, table.model()))
+        p = PVar("p")
+        self.assertFalse(truth_table(PAnd(p, PNot(p))).satisfiable())
+        self.assertIsNone(truth_table(PAnd(p, PNot(p))).model())
+        self.assertEqual(truth_table(PTrue()).count(), 1)
+        self.assertEqual(truth_table(PImplies(p, PTrue()), ["q"]).count(), 4)
+
+    def test_against_evaluation(self):
+        from bdd import random_prop
+        rng = random.Random(5)
+        names = [f"v{i}" for i in range(8)]
+        for _ in range(30):
+            prop = random_prop(rng, names, rng.randint(1, 40))
+            table = truth_table(prop)
+            words = np.concatenate([words.copy() for words in table.chunks()])
+            for index in range(1 << len(table.names)):
+                # the first variable is the least significant bit
+                assignment = {name: bool(index >> k & 1) for k, name in enumerate(table.names)}
+                self.assertEqual(bool(int(words[index >> 6]) >> (index & 63) & 1),
+                                 evaluate(prop, assignment))
+
+    def test_chunks(self):
+        from bdd import interleaved
+        global CHUNK_WORDS
+        saved, CHUNK_WORDS = CHUNK_WORDS, 4
+        try:
+            # 2 ** 20 assignments over 4096 words
+            table = truth_table(interleaved(10))
+            self.assertEqual(table.count(), 4 ** 10 - 3 ** 10)
+            self.assertTrue(table.satisfiable())
+            self.assertFalse(table.valid())
+            self.assertTrue(truth_table(POr(interleaved(10), PNot(interleaved(10)))).valid())
+            model = truth_table(PAnd(PNot(PVar("x0")), PAnd(PVar("x9"), PVar("y9"))),
+                                table.names).model()
+            self.assertEqual(sum(model.values()), 2)
+        finally:
+            CHUNK_WORDS = saved
+
+    def test_z3(self):
+        from z3 import And, Bools, Implies, Not, Or
+        a, b, c, d = Bools("a b c d")
+        F = Or(And(d, And(a, b)), And(c, And(a, b)))
+        self.assertEqual(truth_table(F).count(), 3)
+        self.assertEqual(truth_table(Not(F)).count(), 13)
+        self.assertTrue(truth_table(Implies(And(a, b), Or(a, c))).valid())
+        with self.assertRaises(ValueError):
+            truth_table(And([Bools(f"x{i}")[0] for i in range(MAX_VARS + 1)]))
+
+    def test_large(self):
+        # 25 variables, 2 ** 19 words
+        from bdd import interleaved
+        prop = PAnd(interleaved(12), PVar("z"))
+        self.assertEqual(truth_table(prop).count(), 4 ** 12 - 3 ** 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -241,43 +241,49 @@ print(solver.model())
 # Exercise 1-6
 # Now it's your turn, let's wrap all these facility into a nice function:
 # Read and understand the src, then complete the lost part.
-def sat_all(props, f):
-    """Get all solutions of given proposition set props that satisfy f
+#
+# The formula is asserted once; each model found is then blocked by one
+# flat clause over `props` only, which rules out that assignment of the
+# props (and no other), so the solver keeps what it learned about `f`.
+# The models are generated one at a time, so that the caller can stop at
+# any point, and nothing is kept in between.
+def iter_models(props, f, assumptions=()):
+    """Generate the solutions of f projected on props, one model per
+    assignment of props
 
     Arguments:
         props {BoolRef} -- Proposition list
         f {Boolref} -- logical express that consist of props
+        assumptions {BoolRef} -- literals assumed by every check
     """
     solver = Solver()
     solver.add(f)
-    result = []
-    while solver.check() == sat:
+    while solver.check(*assumptions) == sat:
         m = solver.model()
-        result.append(m)
-        block = []
-        for prop in props:
-            prop_is_true = m.eval(prop, model_completion=True)
+        yield m
+        solver.add(Or([Not(prop) if is_true(m.eval(prop, model_completion=True)) else prop
+                       for prop in props]))
 
-            if prop_is_true:
-                new_prop = prop
-            else:
-                new_prop = Not(prop)
 
-            block.append(new_prop)
-
-        r = block[0]
-        for b in block[1:]:
-            r = And(r, b)
-        solver.add(And(f, Not(r)))
+def sat_all(props, f, assumptions=()):
+    """Get all solutions of given proposition set props that satisfy f
 
+    Arguments:
+        props {BoolRef} -- Proposition list
+        f {Boolref} -- logical express that consist of props
+        assumptions {BoolRef} -- literals assumed by every check
+    """
     print("the given proposition: ", f)
-    print("the number of solutions: ", len(result))
 
     def print_model(m):
         print(sorted([(d, m[d]) for d in m], key=lambda x: str(x[0])))
 
-    for m in result:
+    count = 0
+    for m in iter_models(props, f, assumptions):
         print_model(m)
+        count += 1
+    print("the number of solutions: ", count)
+    return count
 
 print("======Exercise 1-6=======")
 # If you complete the function. Try to use it for below props.